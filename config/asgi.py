@@ -0,0 +1,47 @@
+"""
+ASGI config for UserPortal project.
+
+Serves the same Django application as ``config/wsgi.py``, plus the upload
+receiver (``userportal/users/receiver.py``) under ``UPLOAD_RECEIVER_URL``, so
+one ASGI server process handles slow uploads and downloads on its event loop
+instead of holding a worker per transfer. Uploads only stream to disk through
+the receiver: Django buffers the body of every request it handles before the
+view runs. Run it with any ASGI server, e.g.::
+
+    uvicorn config.asgi:application
+
+Async views (``/api/async/...``) only avoid blocking under ASGI; the regular
+sync views keep working here too, each request running in a thread.
+
+"""
+
+import os
+import sys
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.core.asgi import get_asgi_application
+
+# Add the project root to the Python path
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(APP_DIR))
+
+# Set the DJANGO_SETTINGS_MODULE environment variable
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.base")
+
+# Initialize Django before importing anything that uses settings or models.
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+from userportal.users.receiver import application as upload_receiver  # noqa: E402
+
+RECEIVER_PREFIX = urlsplit(settings.UPLOAD_RECEIVER_URL).path.rstrip("/") + "/"
+
+
+async def application(scope, receive, send):
+    # Django does not speak the lifespan protocol; the receiver answers it.
+    if scope["type"] == "lifespan" or (scope["type"] == "http" and scope["path"].startswith(RECEIVER_PREFIX)):
+        await upload_receiver(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -69,6 +69,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 ROOT_URLCONF = "config.urls"
 # https://docs.djangoproject.com/en/dev/ref/settings/#wsgi-application
 WSGI_APPLICATION = "config.wsgi.application"
+# Used by ASGI servers' runserver integrations; see config/asgi.py.
+ASGI_APPLICATION = "config.asgi.application"
 
 # APPS
 # ------------------------------------------------------------------------------
@@ -81,6 +83,7 @@ DJANGO_APPS = [
     "django.contrib.staticfiles",
     # "django.contrib.humanize", # Handy template tags
     "django.contrib.admin",
+    "django.contrib.postgres",
     "django.forms",
     "corsheaders",  # Add CORS headers app
 ]
@@ -119,6 +122,22 @@ LOGIN_URL = 'http://localhost:3000/login'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = 'http://localhost:3000/login'
 
+# PASSWORDS
+# ------------------------------------------------------------------------------
+# https://docs.djangoproject.com/en/dev/ref/settings/#password-hashers
+# New passwords use the first hasher. The others only check older hashes,
+# which are rehashed with the first one when their users next log in.
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+]
+# Threads per process that hash and check passwords, and how many more hashes
+# may wait for one before requests get a 503, see userportal/users/hashing.py.
+PASSWORD_HASHING_WORKERS = env.int("PASSWORD_HASHING_WORKERS", default=2)
+PASSWORD_HASHING_QUEUE_SIZE = env.int("PASSWORD_HASHING_QUEUE_SIZE", default=8)
+
 # MIDDLEWARE
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#middleware
@@ -279,7 +298,7 @@ REDIS_SSL = REDIS_URL.startswith("rediss://")
 # Django REST framework & JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'userportal.users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -302,10 +321,178 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'userportal.users.tokens.TokenRefreshSerializer',
 }
+# Where logged-out refresh tokens are kept: "database" (simplejwt's
+# token_blacklist tables) or "redis" (REDIS_URL, each kept until its token
+# expires), see userportal/users/blacklist.py. Run
+# `manage.py migrate_token_blacklist` before and after switching to "redis".
+TOKEN_BLACKLIST_BACKEND = env("TOKEN_BLACKLIST_BACKEND", default="database")
+# Seconds a process trusts that a token was not revoked before asking Redis
+# again, and how many answers it remembers.
+TOKEN_BLACKLIST_LOCAL_TTL = env.float("TOKEN_BLACKLIST_LOCAL_TTL", default=2)
+TOKEN_BLACKLIST_LOCAL_SIZE = env.int("TOKEN_BLACKLIST_LOCAL_SIZE", default=10_000)
+# Users behind access tokens are cached in the default cache for
+# AUTH_USER_CACHE_TTL seconds, and in each process for AUTH_USER_CACHE_LOCAL_TTL
+# (the longest a change to a user can go unnoticed by other processes), see
+# userportal/users/authentication.py.
+AUTH_USER_CACHE_TTL = env.int("AUTH_USER_CACHE_TTL", default=15 * 60)
+AUTH_USER_CACHE_LOCAL_TTL = env.float("AUTH_USER_CACHE_LOCAL_TTL", default=5)
+AUTH_USER_CACHE_LOCAL_SIZE = env.int("AUTH_USER_CACHE_LOCAL_SIZE", default=1024)
 
 # INTERNAL IPs for debug toolbar
 INTERNAL_IPS = ["127.0.0.1", "localhost"]
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+
+# FILE UPLOADS
+# ------------------------------------------------------------------------------
+FILE_ALLOWED_CONTENT_TYPES = [
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # Excel
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # Word
+    "application/msword",  # Old Word .doc
+    "text/plain",
+]
+# Hash, size and sniff uploads in the same pass that receives them.
+# https://docs.djangoproject.com/en/dev/ref/settings/#file-upload-handlers
+FILE_UPLOAD_HANDLERS = [
+    "userportal.users.uploadhandlers.InspectingMemoryFileUploadHandler",
+    "userportal.users.uploadhandlers.InspectingTemporaryFileUploadHandler",
+]
+# Limit for single-request multipart uploads to /api/files/.
+FILE_UPLOAD_MAX_SIZE = env.int("FILE_UPLOAD_MAX_SIZE", default=5 * 1024 * 1024)
+# Maximum number of files in one /api/files/batch/ upload.
+FILE_BATCH_MAX_FILES = env.int("FILE_BATCH_MAX_FILES", default=100)
+# Resumable uploads (/api/uploads/) are written to disk chunk by chunk, so they
+# can be much larger without holding a worker or memory for the whole body.
+RESUMABLE_UPLOAD_MAX_SIZE = env.int("RESUMABLE_UPLOAD_MAX_SIZE", default=512 * 1024 * 1024)
+RESUMABLE_UPLOAD_MAX_CHUNK_SIZE = env.int("RESUMABLE_UPLOAD_MAX_CHUNK_SIZE", default=8 * 1024 * 1024)
+# Bytes each user may store unless StorageUsage.quota says otherwise.
+STORAGE_QUOTA_DEFAULT = env.int("STORAGE_QUOTA_DEFAULT", default=1024 * 1024 * 1024)
+# Where the upload receiver (userportal/users/receiver.py) is mounted, and how
+# long the tickets that POST /api/uploads/<id>/ticket/ issues for it last.
+UPLOAD_RECEIVER_URL = env("UPLOAD_RECEIVER_URL", default="/upload-receiver/")
+UPLOAD_TICKET_EXPIRES = env.int("UPLOAD_TICKET_EXPIRES", default=60 * 60)
+# Staging directory for in-progress uploads, relative to MEDIA_ROOT.
+RESUMABLE_UPLOAD_DIR = "upload_sessions"
+# Content-addressed blob store for File.file, relative to MEDIA_ROOT.
+BLOB_STORAGE_DIR = "blobs"
+# Levels of two-hex-digit directories blobs are spread over (blobs/ab/cd/abcd...).
+# Run `manage.py shard_blobs` after changing it.
+BLOB_STORAGE_FANOUT = env.int("BLOB_STORAGE_FANOUT", default=2)
+# Where `manage.py reconcile_files` moves files nothing refers to, relative to
+# the storage root they were found in.
+ORPHAN_QUARANTINE_DIR = "quarantine"
+# Slower, cheaper filesystem for blobs nobody has read recently. Unset keeps
+# everything on MEDIA_ROOT. See `manage.py tier_blobs`.
+COLD_STORAGE_ROOT = env("COLD_STORAGE_ROOT", default=None)
+# Days without a download before a blob moves to cold storage.
+COLD_STORAGE_AFTER_DAYS = env.int("COLD_STORAGE_AFTER_DAYS", default=90)
+# Compress blobs as they move to cold storage (with BLOB_COMPRESSION, or gzip).
+COLD_STORAGE_COMPRESS = env.bool("COLD_STORAGE_COMPRESS", default=False)
+# Store blobs of these types compressed, see userportal/users/compression.py.
+# "gzip", "zstd" (needs the zstandard package) or "" to store everything as is.
+# Compressed blobs cannot be offloaded to the web server or served in ranges.
+BLOB_COMPRESSION = env("BLOB_COMPRESSION", default="")
+BLOB_COMPRESSIBLE_TYPES = env.list(
+    "BLOB_COMPRESSIBLE_TYPES",
+    default=["text/plain", "application/msword"],
+)
+# Store raw unless a sample of the content compresses to at most this ratio.
+BLOB_COMPRESSION_MAX_RATIO = env.float("BLOB_COMPRESSION_MAX_RATIO", default=0.9)
+
+# FILE DOWNLOADS
+# ------------------------------------------------------------------------------
+# How download bytes reach the client, see userportal/users/delivery.py:
+#   userportal.users.delivery.PythonDelivery      (default, wsgi.file_wrapper/sendfile)
+#   userportal.users.delivery.NginxAccelDelivery  (X-Accel-Redirect)
+#   userportal.users.delivery.XSendfileDelivery   (X-Sendfile)
+DOWNLOAD_DELIVERY_BACKEND = env(
+    "DOWNLOAD_DELIVERY_BACKEND",
+    default="userportal.users.delivery.PythonDelivery",
+)
+# Internal nginx location that aliases MEDIA_ROOT, e.g.
+#   location /protected/ { internal; alias /app/media/; }
+DOWNLOAD_ACCEL_PREFIX = env("DOWNLOAD_ACCEL_PREFIX", default="/protected/")
+# The same for COLD_STORAGE_ROOT.
+DOWNLOAD_ACCEL_COLD_PREFIX = env("DOWNLOAD_ACCEL_COLD_PREFIX", default="/protected-cold/")
+# Default and maximum lifetime, in seconds, of signed download URLs from
+# /api/files/<id>/signed-url/. They work for anyone holding them until then.
+DOWNLOAD_URL_EXPIRES = env.int("DOWNLOAD_URL_EXPIRES", default=300)
+DOWNLOAD_URL_MAX_EXPIRES = env.int("DOWNLOAD_URL_MAX_EXPIRES", default=24 * 60 * 60)
+# Files per page of GET /api/files/, and the most a client may ask for.
+FILE_LIST_PAGE_SIZE = env.int("FILE_LIST_PAGE_SIZE", default=50)
+FILE_LIST_MAX_PAGE_SIZE = env.int("FILE_LIST_MAX_PAGE_SIZE", default=200)
+# Maximum number of files in one /api/files/archive/ download.
+FILE_ARCHIVE_MAX_FILES = env.int("FILE_ARCHIVE_MAX_FILES", default=1000)
+
+# FILE VERSIONS
+# ------------------------------------------------------------------------------
+# Replaced versions are split into content-defined chunks of about
+# VERSION_CHUNK_AVG_SIZE bytes (a power of two), see userportal/users/versions.py.
+VERSION_CHUNK_MIN_SIZE = env.int("VERSION_CHUNK_MIN_SIZE", default=16 * 1024)
+VERSION_CHUNK_AVG_SIZE = env.int("VERSION_CHUNK_AVG_SIZE", default=64 * 1024)
+VERSION_CHUNK_MAX_SIZE = env.int("VERSION_CHUNK_MAX_SIZE", default=256 * 1024)
+# Threads per process chunking replaced versions after they are saved.
+VERSION_CHUNKING_WORKERS = env.int("VERSION_CHUNKING_WORKERS", default=1)
+
+# PREVIEWS
+# ------------------------------------------------------------------------------
+# Rendered previews are cached under MEDIA_ROOT, least recently used evicted
+# past PREVIEW_CACHE_MAX_BYTES, see userportal/users/previews.py.
+PREVIEW_CACHE_DIR = env("PREVIEW_CACHE_DIR", default="previews")
+PREVIEW_CACHE_MAX_BYTES = env.int("PREVIEW_CACHE_MAX_BYTES", default=256 * 1024 * 1024)
+# Longer side of PDF thumbnails in pixels, and characters in text snippets.
+PREVIEW_THUMBNAIL_SIZE = env.int("PREVIEW_THUMBNAIL_SIZE", default=256)
+PREVIEW_SNIPPET_LENGTH = env.int("PREVIEW_SNIPPET_LENGTH", default=500)
+# Threads per process rendering previews (and processes drawing PDF pages),
+# how many renders may wait for one before requests get 202 without queueing,
+# and how long a request waits for a render before answering 202 and letting
+# it finish in the background.
+PREVIEW_WORKERS = env.int("PREVIEW_WORKERS", default=2)
+PREVIEW_QUEUE_SIZE = env.int("PREVIEW_QUEUE_SIZE", default=32)
+PREVIEW_RENDER_TIMEOUT = env.float("PREVIEW_RENDER_TIMEOUT", default=10)
+
+# TEXT EXTRACTION
+# ------------------------------------------------------------------------------
+# Threads per process queueing text extraction of new uploads after they are
+# saved, and worker processes parsing the documents for them.
+EXTRACTION_WORKERS = env.int("EXTRACTION_WORKERS", default=2)
+# Uploads waiting for a worker beyond this are left pending for
+# `manage.py extract_files` instead of piling up in memory.
+EXTRACTION_QUEUE_SIZE = env.int("EXTRACTION_QUEUE_SIZE", default=100)
+# Characters of extracted text kept per file.
+EXTRACTION_MAX_TEXT_LENGTH = env.int("EXTRACTION_MAX_TEXT_LENGTH", default=1_000_000)
+# Largest zip member of a DOCX or XLSX, decompressed, that extraction will read.
+EXTRACTION_MAX_MEMBER_SIZE = env.int("EXTRACTION_MAX_MEMBER_SIZE", default=64 * 1024 * 1024)
+
+# SEARCH
+# ------------------------------------------------------------------------------
+# PostgreSQL text search configuration used to index and query files.
+SEARCH_CONFIG = env("SEARCH_CONFIG", default="english")
+# Characters of extracted text indexed per file; tsvectors are limited to 1MB.
+SEARCH_MAX_TEXT_LENGTH = env.int("SEARCH_MAX_TEXT_LENGTH", default=100_000)
+# Default and maximum number of results from /api/files/search/.
+SEARCH_RESULTS_LIMIT = env.int("SEARCH_RESULTS_LIMIT", default=20)
+SEARCH_MAX_RESULTS = env.int("SEARCH_MAX_RESULTS", default=100)
+
+# LOGIN RATE LIMITS
+# ------------------------------------------------------------------------------
+# Attempts at /api/token/ and the login and register views allowed in any
+# LOGIN_RATE_LIMIT_WINDOW seconds, per client IP and per email address, see
+# userportal/users/ratelimit.py.
+LOGIN_RATE_LIMIT_WINDOW = env.int("LOGIN_RATE_LIMIT_WINDOW", default=60)
+LOGIN_RATE_LIMIT_PER_IP = env.int("LOGIN_RATE_LIMIT_PER_IP", default=20)
+LOGIN_RATE_LIMIT_PER_EMAIL = env.int("LOGIN_RATE_LIMIT_PER_EMAIL", default=10)
+# Where the counters live: "redis" (REDIS_URL, one round trip per attempt) or
+# "cache" (the default cache, for development).
+RATE_LIMIT_BACKEND = env("RATE_LIMIT_BACKEND", default="cache")
+# Request header with the client's address when behind a proxy that sets it,
+# e.g. "HTTP_X_REAL_IP". Unset uses REMOTE_ADDR.
+RATE_LIMIT_IP_HEADER = env("RATE_LIMIT_IP_HEADER", default="")
+# Proxies in front of the app that append to RATE_LIMIT_IP_HEADER, as with
+# "HTTP_X_FORWARDED_FOR": the client's address is this many entries from the
+# right, since entries further left can be forged by the client.
+RATE_LIMIT_PROXY_COUNT = env.int("RATE_LIMIT_PROXY_COUNT", default=1)
@@ -31,6 +31,9 @@ CACHES = {
     },
 }
 
+# Login rate limits are counted in Redis directly, in one round trip.
+RATE_LIMIT_BACKEND = env("RATE_LIMIT_BACKEND", default="redis")
+
 # SECURITY
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#secure-proxy-ssl-header
@@ -7,6 +7,7 @@ from django.http import HttpResponse
 from django.utils.http import urlquote
 from .models import File
 from .serializers import FileSerializer
+from userportal.users.delivery import get_delivery_backend
 import os
 import mimetypes
 from django.urls import reverse
@@ -83,28 +84,15 @@ class FileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        file_path = file_obj.file.path
-        file_name = os.path.basename(file_path)
-
-        # Ensure the file exists
-        if not os.path.exists(file_path):
-            return Response(
-                {'error': 'File not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Read the file in chunks
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
+        # Compressed blobs have no plain path on disk; the delivery backend
+        # locates the stored bytes itself and answers 404 if they are gone.
+        file_name = os.path.basename(file_obj.file.name)
 
         # Get content type
-        content_type, _ = mimetypes.guess_type(file_path)
+        content_type, _ = mimetypes.guess_type(file_name)
         if not content_type:
             content_type = 'application/octet-stream'
 
-        # Create response with proper headers
-        response = HttpResponse(file_data, content_type=content_type)
-        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
-        response['Content-Length'] = len(file_data)
-
-        return response
+        # Let the configured delivery backend send the bytes instead of
+        # reading the whole file into memory here.
+        return get_delivery_backend().serve(request, file_obj.file.name, file_name, content_type)
@@ -11,7 +11,7 @@ import RegisterForm from './components/auth/RegisterForm';
 import Dashboard from './components/Dashboard';
 import { Sidebar } from './components/Sidebar';
 import Profile from './components/Profile';
-import api from './api'; // Assuming you have an api module
+import { fetchAllPages } from './api';
 
 interface File {
   id: number;
@@ -45,8 +45,7 @@ function AppContent() {
     if (user) {
       const fetchFiles = async () => {
         try {
-          const response = await api.get<File[]>("/api/files/");
-          setFiles(response.data);
+          setFiles(await fetchAllPages<File>("/api/files/"));
         } catch (err) {
           console.error("Failed to fetch files:", err);
         }
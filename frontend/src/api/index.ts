@@ -103,4 +103,25 @@ api.interceptors.response.use(
   }
 );
 
+interface Page<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+// Fetch every page of a cursor-paginated list by following `next`.
+export async function fetchAllPages<T>(url: string, pageSize = 200): Promise<T[]> {
+  const items: T[] = [];
+  let next: string | null = url;
+  let params: { page_size: number } | undefined = { page_size: pageSize };
+  while (next) {
+    const response: { data: Page<T> } = await api.get<Page<T>>(next, { params });
+    items.push(...response.data.results);
+    next = response.data.next;
+    // `next` already carries the page size and cursor.
+    params = undefined;
+  }
+  return items;
+}
+
 export default api;
\ No newline at end of file
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Card, Row, Col, Statistic, Typography, Table, Button, message, Tag, Tooltip, Layout, Upload } from 'antd';
 import { useAuth } from './auth/AuthContext';
-import api from '../api';
+import api, { fetchAllPages } from '../api';
 import {
   FilePdfOutlined,
   FileExcelOutlined,
@@ -19,11 +19,6 @@ interface DashboardProps {
   onFilesUpdated: (files: FileItem[]) => void;
 }
 
-interface FileApiResponse {
-  results?: FileItem[];
-  count?: number;
-}
-
 interface FileItem {
   id: number;
   file: string;
@@ -166,12 +161,8 @@ export const Dashboard: React.FC<DashboardProps> = ({ files, onFilesUpdated }) =
   useEffect(() => {
     const fetchFiles = async () => {
       try {
-        const response = await api.get<FileApiResponse>('/api/files/');
-        
-        // Ensure we have an array of files
-        const filesData = Array.isArray(response.data) 
-          ? response.data 
-          : response.data.results || [];
+        // The list is paginated; the totals below need every page.
+        const filesData = await fetchAllPages<FileItem>('/api/files/');
         
         // Map the response to our FileItem interface
         const formattedFiles = filesData.map((file: any) => ({
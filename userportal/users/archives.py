@@ -0,0 +1,77 @@
+"""Stream several files as one ZIP archive without a temporary file.
+
+``zipfile`` can write to an unseekable stream: sizes and CRCs then follow
+each entry in a data descriptor instead of being patched into its header.
+:func:`stream_zip` writes into a small in-memory sink and yields whatever
+has accumulated after every block, so memory use is bounded by the block
+size no matter how many or how large the files are.
+"""
+import logging
+import os
+import zipfile
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 256 * 1024
+
+
+class _Sink:
+    """Write-only file object collecting what ``ZipFile`` writes."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def archive_names(files):
+    """Pair each file with a unique name inside the archive."""
+    seen = set()
+    for file in files:
+        name = file.download_name
+        root, ext = os.path.splitext(name)
+        counter = 1
+        while name in seen:
+            name = f"{root} ({counter}){ext}"
+            counter += 1
+        seen.add(name)
+        yield name, file
+
+
+def stream_zip(files):
+    """Yield the bytes of a ZIP archive containing ``files``."""
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, 'w')
+    for name, file in archive_names(files):
+        try:
+            source = file.file.storage.open(file.file.name, 'rb')
+        except FileNotFoundError:
+            logger.warning("Skipping missing file %s in archive", file.file.name)
+            continue
+
+        info = zipfile.ZipInfo(name, date_time=timezone.localtime(file.upload_date).timetuple()[:6])
+        # Office documents and PDFs are already compressed; only text is worth deflating.
+        info.compress_type = zipfile.ZIP_DEFLATED if file.file_type.startswith('text/') else zipfile.ZIP_STORED
+        # Knowing the size lets zipfile decide whether the entry needs ZIP64.
+        info.file_size = source.size
+        with source, archive.open(info, 'w') as entry:
+            while block := source.read(BLOCK_SIZE):
+                entry.write(block)
+                if data := sink.drain():
+                    yield data
+        if data := sink.drain():
+            yield data
+    archive.close()
+    yield sink.drain()
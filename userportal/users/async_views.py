@@ -0,0 +1,118 @@
+"""Async versions of the file download and chunk upload endpoints.
+
+Under ASGI (``config/asgi.py``) these run on the event loop: authentication
+and queries use Django's async ORM, and disk reads and writes happen in the
+thread pool, so one process can keep thousands of slow downloads going. The
+DRF views in :mod:`userportal.users.views` serve the same files and keep
+working under both WSGI and ASGI.
+
+Uploads gain less. Django's ASGI handler reads the whole request body before
+calling any view, spooling it to a temporary file past
+``FILE_UPLOAD_MAX_MEMORY_SIZE``. A slow client therefore holds no thread, but
+each chunk is written to disk twice, and the view only starts once the
+chunk has fully arrived. Large uploads should go to the upload receiver
+(``userportal/users/receiver.py``), which writes the body as it arrives.
+
+DRF does not support async views, so these are plain Django views that
+check the same ``Authorization: Bearer`` JWT themselves.
+"""
+import asyncio
+import functools
+
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import aget_cached_user
+from .delivery import aserve_file
+from .models import File
+from .models import UploadChunk
+from .models import UploadSession
+from .uploads import chunk_problem
+from .uploads import missing_ranges
+from .uploads import received_ranges
+from .uploads import write_chunk
+
+
+async def authenticate(request):
+    """Return the active user the request's JWT belongs to, or ``None``."""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    try:
+        token = auth.get_validated_token(raw_token)
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+    user = await aget_cached_user(user_id)
+    return user if user is not None and user.is_active else None
+
+
+def jwt_required(view):
+    """Authenticate an async view's request with a JWT, answering 401 without one."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await authenticate(request)
+        if request.user is None:
+            return JsonResponse(
+                {'error': 'Authentication credentials were not provided or are invalid'},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+# ATOMIC_REQUESTS cannot wrap async views; the few writes here are single
+# statements.
+@transaction.non_atomic_requests
+@require_http_methods(["GET", "HEAD"])
+@jwt_required
+async def download_file_view(request, pk):
+    try:
+        file = await File.objects.aget(pk=pk, user=request.user)
+    except File.DoesNotExist:
+        return JsonResponse({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+    return await aserve_file(request, file)
+
+
+@csrf_exempt
+@transaction.non_atomic_requests
+@require_http_methods(["PUT"])
+@jwt_required
+async def upload_chunk_view(request, pk, offset):
+    try:
+        session = await UploadSession.objects.aget(pk=pk, user=request.user)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+
+    problem = chunk_problem(session, offset, length)
+    if problem:
+        error, response_status = problem
+        return JsonResponse({'error': error}, status=response_status)
+
+    # The body has already been buffered by Django's ASGI handler; copy it
+    # to the staging file in a thread.
+    written = await asyncio.to_thread(write_chunk, session, offset, request, length)
+    if written != length:
+        return JsonResponse({'error': 'Incomplete chunk, please resend it'}, status=status.HTTP_400_BAD_REQUEST)
+
+    await UploadChunk.objects.aupdate_or_create(session=session, offset=offset, defaults={'size': length})
+    chunks = [chunk async for chunk in UploadChunk.objects.filter(session=session).values_list('offset', 'size')]
+    received = received_ranges(chunks)
+    return JsonResponse({
+        'id': str(session.pk),
+        'received': received,
+        'missing': missing_ranges(received, session.total_size),
+    })
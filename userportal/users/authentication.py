@@ -0,0 +1,143 @@
+"""JWT authentication that loads ``request.user`` from a cache.
+
+simplejwt's ``JWTAuthentication`` selects the user from the database on every
+request, although the user rarely changes during an access token's lifetime.
+:class:`CachedJWTAuthentication` looks the user up in two places first:
+
+* a small in-process LRU, where entries live for ``AUTH_USER_CACHE_LOCAL_TTL``
+  seconds and cost no I/O at all;
+* the default cache (Redis in production), under the user's id and their
+  current *version*. Entries live for ``AUTH_USER_CACHE_TTL`` seconds.
+
+A user's version is a random token. Saving or deleting the user replaces it,
+so changing a password, deactivating an account or editing a profile makes
+every cached copy unreachable, and the next request loads the user again.
+This happens in the process that saved at once, and in other processes
+within ``AUTH_USER_CACHE_LOCAL_TTL``. ``QuerySet.update()`` sends no
+signals, so code that changes users that way must call
+:func:`invalidate_user` itself.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+
+VERSION_KEY = 'auth-user:{}:version'
+USER_KEY = 'auth-user:{}:{}'
+
+
+class LocalUserCache:
+    """An in-process LRU of users, each kept for a few seconds."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Requests may change their user; they must not change the cached one.
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (copy.copy(user), time.monotonic() + settings.AUTH_USER_CACHE_LOCAL_TTL)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.AUTH_USER_CACHE_LOCAL_SIZE:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_users = LocalUserCache()
+
+
+def user_version(user_id):
+    """The user's current cache version, starting a new one if it was lost."""
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_user(user_id):
+    """Make every cached copy of the user stale."""
+    user_id = str(user_id)
+    cache.set(VERSION_KEY.format(user_id), uuid.uuid4().hex, timeout=None)
+    local_users.discard(user_id)
+
+
+def get_cached_user(user_id):
+    """Return the user whose ``USER_ID_FIELD`` is ``user_id``, or ``None``."""
+    # Tokens carry the id as a string; keys must not depend on which we got.
+    user_id = str(user_id)
+    user = local_users.get(user_id)
+    if user is not None:
+        return user
+    key = USER_KEY.format(user_id, user_version(user_id))
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None:
+            return None
+        cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+    local_users.set(user_id, user)
+    return user
+
+
+async def aget_cached_user(user_id):
+    """:func:`get_cached_user` for async views; local hits stay on the event loop."""
+    user = local_users.get(str(user_id))
+    if user is not None:
+        return user
+    return await sync_to_async(get_cached_user)(user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` with users loaded by :func:`get_cached_user`."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as exc:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from exc
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
@@ -0,0 +1,78 @@
+"""Revoked refresh tokens kept in Redis, each only until the token expires.
+
+With ``TOKEN_BLACKLIST_BACKEND = "redis"``, logging out stores the refresh
+token's id in Redis (``REDIS_URL``), expiring when the token does. Checking a
+token is then a single ``EXISTS``, and Redis only ever holds tokens that
+were revoked and could still be used. The default, ``"database"``, keeps
+simplejwt's ``token_blacklist`` tables. Those grow with every login until
+``manage.py flushexpiredtokens`` runs, and each refresh joins them.
+
+Each process also remembers answers for a while. A revoked token stays
+revoked, so revocations are kept until the token expires. A token found not
+to be revoked is trusted for ``TOKEN_BLACKLIST_LOCAL_TTL`` seconds, which is
+therefore how long another process may keep accepting a token after logout.
+
+To switch an existing deployment, run ``manage.py migrate_token_blacklist``,
+which copies unexpired revocations from the tables, change the setting, then
+run it once more for tokens revoked in between.
+"""
+import threading
+import time
+
+from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
+
+from .redis_client import get_redis
+
+KEY = 'token-blacklist:{}'
+
+
+def uses_redis():
+    return settings.TOKEN_BLACKLIST_BACKEND == 'redis'
+
+
+class RedisBlacklist:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Token id -> when to forget it, oldest first.
+        self._revoked = {}
+        self._not_revoked = {}
+
+    def add(self, jti, exp):
+        """Revoke the token ``jti`` until ``exp``, a Unix time."""
+        ttl = int(exp - time.time()) + 1
+        if ttl > 0:
+            get_redis().set(KEY.format(jti), 1, ex=ttl)
+        self._remember(jti, exp, revoked=True)
+
+    def contains(self, jti, exp):
+        now = time.time()
+        with self._lock:
+            if jti in self._revoked:
+                return True
+            expires = self._not_revoked.get(jti)
+            if expires is not None and expires > now:
+                return False
+        revoked = bool(get_redis().exists(KEY.format(jti)))
+        self._remember(jti, exp if revoked else now + settings.TOKEN_BLACKLIST_LOCAL_TTL, revoked)
+        return revoked
+
+    def _remember(self, jti, expires, revoked):
+        with self._lock:
+            self._not_revoked.pop(jti, None)
+            entries = self._revoked if revoked else self._not_revoked
+            entries[jti] = expires
+            if len(entries) > settings.TOKEN_BLACKLIST_LOCAL_SIZE:
+                # Forget the oldest answer; Redis still has it.
+                del entries[next(iter(entries))]
+
+
+redis_blacklist = RedisBlacklist()
+
+
+def is_revoked(payload):
+    return redis_blacklist.contains(payload[api_settings.JTI_CLAIM], payload['exp'])
+
+
+def revoke(payload):
+    redis_blacklist.add(payload[api_settings.JTI_CLAIM], payload['exp'])
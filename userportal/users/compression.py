@@ -0,0 +1,115 @@
+"""Compression of blobs at rest.
+
+A blob is stored compressed when its type is in ``BLOB_COMPRESSIBLE_TYPES``
+and a sample of its first bytes shrinks enough with ``BLOB_COMPRESSION``, so
+already-compressed content (most PDFs, scans) is left alone. Compressed blobs
+keep their name plus the encoding's suffix, and are stored in the HTTP
+content-coding format of the same name, so downloads can send them as they
+are with ``Content-Encoding``.
+
+``gzip`` only needs the standard library; ``zstd`` needs the optional
+``zstandard`` package.
+"""
+import gzip
+import io
+import struct
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+SAMPLE_SIZE = 256 * 1024
+
+
+def _zstd():
+    if zstandard is None:
+        msg = "zstd compression needs the zstandard package."
+        raise ImproperlyConfigured(msg)
+    return zstandard
+
+
+def open_reader(path, encoding):
+    """Open a compressed file for reading its decompressed bytes."""
+    if encoding == 'gzip':
+        return gzip.open(path, 'rb')
+    return _zstd().ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)  # noqa: PTH123, SIM115
+
+
+def open_writer(path, encoding, size=-1):
+    """Open ``path`` for writing bytes that are compressed on the way."""
+    if encoding == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=GZIP_LEVEL)
+    compressor = _zstd().ZstdCompressor(level=ZSTD_LEVEL)
+    # Recording the size in the frame header makes decoded_size() cheap.
+    return compressor.stream_writer(open(path, 'wb'), size=size, closefd=True)  # noqa: PTH123, SIM115
+
+
+def decoded_size(path, encoding):
+    """Size of a compressed file's content, read from its header or trailer."""
+    with open(path, 'rb') as f:  # noqa: PTH123
+        if encoding == 'gzip':
+            # ISIZE, the size modulo 2**32; blobs are far smaller than that.
+            f.seek(-4, io.SEEK_END)
+            return struct.unpack('<I', f.read(4))[0]
+        size = _zstd().frame_content_size(f.read(18))
+    if size < 0:
+        with open_reader(path, encoding) as reader:
+            size = sum(iter(lambda: len(reader.read(1024 * 1024)), 0))
+    return size
+
+
+def compressed_size(data, encoding):
+    if encoding == 'gzip':
+        return len(zlib.compress(data, GZIP_LEVEL))
+    return len(_zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(data))
+
+
+def worth_compressing(sample, encoding):
+    """Whether ``sample`` shrinks to at most ``BLOB_COMPRESSION_MAX_RATIO`` of its size."""
+    return bool(sample) and compressed_size(sample, encoding) <= len(sample) * settings.BLOB_COMPRESSION_MAX_RATIO
+
+
+class DecompressedFile(File):
+    """A compressed blob, read as the original bytes.
+
+    It reports the uncompressed ``size`` and claims not to be seekable, so
+    ``FileResponse`` does not decompress everything to measure it. It also
+    has no ``fileno()``, so ``sendfile`` cannot send the compressed bytes.
+    Seeking still works, for range requests and ``zipfile``: forwards by
+    skipping, backwards by starting again from the top.
+    """
+
+    def __init__(self, path, encoding, name):
+        # File proxies ``encoding`` to the underlying file; use another name.
+        self.path = path
+        self.codec = encoding
+        super().__init__(open_reader(path, encoding), name)
+        self.size = decoded_size(path, encoding)
+
+    def seekable(self):
+        return False
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_END:
+            offset += self.size
+        elif whence == io.SEEK_CUR:
+            offset += self.file.tell()
+        if offset < self.file.tell():
+            self.file.close()
+            self.file = open_reader(self.path, self.codec)
+        return self.file.seek(offset)
+
+    def fileno(self):
+        raise io.UnsupportedOperation("fileno")
@@ -0,0 +1,262 @@
+"""Pluggable delivery of file downloads.
+
+Views decide *whether* a user may download a file; a delivery backend decides
+*how* the bytes reach the client. ``DOWNLOAD_DELIVERY_BACKEND`` selects one of:
+
+* :class:`PythonDelivery` -- the application sends the file itself. Django
+  hands the open file to the WSGI server's ``wsgi.file_wrapper``, which lets
+  servers such as gunicorn use ``os.sendfile`` so the bytes are copied by the
+  kernel rather than through the worker. Partial (``Range``) responses are
+  streamed in blocks.
+* :class:`NginxAccelDelivery` -- responds with an ``X-Accel-Redirect`` to an
+  ``internal`` nginx location mapped to ``MEDIA_ROOT`` (or, for blobs on the
+  cold tier, to ``COLD_STORAGE_ROOT``).
+* :class:`XSendfileDelivery` -- responds with an ``X-Sendfile`` header for
+  Apache ``mod_xsendfile`` or lighttpd.
+
+Blobs stored compressed cannot be offloaded and are always sent by
+:class:`PythonDelivery`. Clients that accept the blob's encoding get the
+stored bytes as they are, with ``Content-Encoding`` (and still through
+``sendfile``); others get them decompressed. Seeking in a compressed stream
+means decompressing everything before the offset, so ``Range`` is ignored for
+these blobs and the whole file is sent with ``Accept-Ranges: none``.
+"""
+import asyncio
+import mimetypes
+import os
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse
+from django.http import Http404
+from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_vary_headers
+from django.utils.http import content_disposition_header
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+
+from .models import Blob
+from .ranges import RangeIterator
+from .ranges import RangeNotSatisfiable
+from .ranges import if_range_matches
+from .ranges import parse_range_header
+from .storage import COLD
+from .storage import blob_storage
+
+
+def accepts_encoding(request, encoding):
+    """Whether the request's ``Accept-Encoding`` allows ``encoding``."""
+    accepted = {}
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.partition(';')
+        try:
+            quality = float(params.strip().removeprefix('q=')) if params.strip() else 1.0
+        except ValueError:
+            quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted.get(encoding, accepted.get('*', 0.0)) > 0
+
+
+class DeliveryBackend:
+    storage = blob_storage
+
+    def serve(self, request, name, filename, content_type, etag=None, last_modified=None):
+        """Return a response that sends the stored file ``name`` to the client.
+
+        ``etag`` and ``last_modified`` are the validators of the stored
+        content, for backends that evaluate ``If-Range`` themselves.
+        """
+        raise NotImplementedError
+
+    def headers(self, filename, content_type):
+        return {
+            'Content-Type': content_type,
+            'Content-Disposition': content_disposition_header(True, filename),
+        }
+
+
+class PythonDelivery(DeliveryBackend):
+    """Send the file from Django, honouring ``Range`` requests."""
+    block_size = 256 * 1024
+
+    def serve(self, request, name, filename, content_type, etag=None, last_modified=None):
+        try:
+            located = self.storage.locate(name)
+        except FileNotFoundError as exc:
+            raise Http404("File not found") from exc
+        if located.encoding:
+            if accepts_encoding(request, located.encoding):
+                response = self.encoded(located, filename, content_type)
+            else:
+                response = self.decoded(request, name, filename, content_type, allow_ranges=False)
+            response['Accept-Ranges'] = 'none'
+            patch_vary_headers(response, ['Accept-Encoding'])
+            return response
+        return self.decoded(request, name, filename, content_type, etag, last_modified)
+
+    def encoded(self, located, filename, content_type):
+        """Send a compressed blob's stored bytes, for the client to decompress."""
+        response = FileResponse(
+            open(located.path, 'rb'),  # noqa: PTH123, SIM115
+            as_attachment=True,
+            filename=filename,
+            content_type=content_type,
+        )
+        response.block_size = self.block_size
+        response['Content-Encoding'] = located.encoding
+        return response
+
+    def decoded(self, request, name, filename, content_type, etag=None, last_modified=None, allow_ranges=True):
+        try:
+            stored = self.storage.open(name, 'rb')
+        except FileNotFoundError as exc:
+            raise Http404("File not found") from exc
+
+        ranges = None
+        if allow_ranges and if_range_matches(request, etag, last_modified):
+            try:
+                ranges = parse_range_header(request.META.get('HTTP_RANGE'), stored.size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stored.size}'
+                stored.close()
+                return response
+
+        if ranges is None:
+            response = FileResponse(
+                stored,
+                as_attachment=True,
+                filename=filename,
+                content_type=content_type,
+            )
+            response.block_size = self.block_size
+            response['Accept-Ranges'] = 'bytes'
+            # FileResponse cannot measure decompressed blobs by seeking.
+            response['Content-Length'] = stored.size
+            return response
+
+        content = RangeIterator(stored, ranges, stored.size, content_type)
+        headers = self.headers(filename, content_type)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers['Content-Range'] = f'bytes {start}-{end}/{stored.size}'
+        else:
+            headers['Content-Type'] = content.multipart_content_type
+        headers['Content-Length'] = content.content_length()
+        return StreamingHttpResponse(content, status=206, headers=headers)
+
+
+class OffloadDelivery(DeliveryBackend):
+    """Base for backends where the web server in front of Django sends the bytes."""
+    header = None
+
+    def target(self, name, stored):
+        raise NotImplementedError
+
+    def serve(self, request, name, filename, content_type, etag=None, last_modified=None):
+        try:
+            stored = self.storage.locate(name)
+        except FileNotFoundError as exc:
+            raise Http404("File not found") from exc
+        if stored.encoding:
+            return PythonDelivery().serve(request, name, filename, content_type, etag, last_modified)
+
+        # The web server handles Range requests for offloaded files itself.
+        response = HttpResponse(headers=self.headers(filename, content_type))
+        response[self.header] = self.target(name, stored)
+        return response
+
+
+class NginxAccelDelivery(OffloadDelivery):
+    header = 'X-Accel-Redirect'
+
+    def target(self, name, stored):
+        if stored.tier == COLD:
+            prefix, root = settings.DOWNLOAD_ACCEL_COLD_PREFIX, self.storage.cold_location
+        else:
+            prefix, root = settings.DOWNLOAD_ACCEL_PREFIX, self.storage.location
+        # Where the bytes were found, which may be another layout than ``name``'s.
+        relative = os.path.relpath(stored.path, root)
+        return prefix + quote(relative.replace(os.sep, '/'))
+
+
+class XSendfileDelivery(OffloadDelivery):
+    header = 'X-Sendfile'
+
+    def target(self, name, stored):
+        return stored.path
+
+
+def get_delivery_backend():
+    return import_string(settings.DOWNLOAD_DELIVERY_BACKEND)()
+
+
+def serve_file(request, file):
+    """Send a ``File`` row's content with the configured delivery backend."""
+    response = serve_stored(request, **download_details(file))
+    if file.blob_id and response.status_code != 304:
+        Blob.objects.touch(file.blob_id)
+    return response
+
+
+async def aserve_file(request, file):
+    """:func:`serve_file` for async views.
+
+    The response's content is read from disk in a thread pool, a block at a
+    time, so under ASGI one event loop streams any number of downloads to
+    slow clients without tying up a thread per download.
+    """
+    # Locating and opening the file stats the disk; keep that off the loop
+    # too. Nothing here uses the database, so it needs no dedicated thread.
+    response = await sync_to_async(serve_stored, thread_sensitive=False)(request, **download_details(file))
+    if response.streaming:
+        response.streaming_content = read_in_thread(response.streaming_content)
+    if file.blob_id and response.status_code != 304:
+        await Blob.objects.atouch(file.blob_id)
+    return response
+
+
+async def read_in_thread(iterable):
+    """Yield the items of a blocking iterable, producing each in a thread."""
+    iterator = iter(iterable)
+    while (block := await asyncio.to_thread(next, iterator, None)) is not None:
+        yield block
+
+
+def download_details(file):
+    """What :func:`serve_stored` needs to know about a ``File`` row."""
+    filename = file.download_name
+    return {
+        'name': file.file.name,
+        'filename': filename,
+        'content_type': file.file_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        'etag': f'"{file.blob_id}"' if file.blob_id else None,
+        'last_modified': int(file.upload_date.timestamp()),
+    }
+
+
+def serve_stored(request, name, filename, content_type, etag=None, last_modified=None):
+    """Send the stored file ``name`` with the configured delivery backend.
+
+    Conditional requests are answered here, before the backend is involved:
+    the strong ETag is the content hash and ``Last-Modified`` is the upload
+    date, so an unchanged file costs a 304 and no I/O.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = get_delivery_backend().serve(
+            request, name, filename, content_type, etag=etag, last_modified=last_modified,
+        )
+    if etag and response.has_header('Content-Encoding'):
+        # The compressed bytes are a different representation of the content.
+        response['ETag'] = f'W/{etag}'
+    elif etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Downloads need authentication: let browsers keep them, but revalidate.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,74 @@
+"""Named background worker pools, one of each per process.
+
+Extraction, previews, version chunking and password hashing each run on a
+small pool of their own, started the first time :func:`get` asks for it.
+Pools given a ``queue_size`` accept at most that many tasks waiting for a
+thread; :meth:`Pool.submit` raises :class:`QueueFull` beyond that, rather than
+letting work pile up in memory.
+
+CPU-bound pure-Python work would hold the GIL and stall every request the
+process serves, whatever thread it ran on; :func:`get_processes` gives it a
+pool of worker processes instead.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Pool:
+    def __init__(self, name, max_workers, queue_size=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # Running and waiting tasks together.
+        self._slots = None if queue_size is None else threading.BoundedSemaphore(max_workers + queue_size)
+
+    def submit(self, fn, *args):
+        """Start ``fn(*args)`` on the pool, or raise :class:`QueueFull` if it is full."""
+        if self._slots is None:
+            return self._executor.submit(fn, *args)
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+_pools = {}
+_process_pools = {}
+_lock = threading.Lock()
+
+
+def get(name, max_workers, queue_size=None):
+    """Return the pool called ``name``, starting it with these limits if it is new."""
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = Pool(name, max_workers, queue_size)
+    return pool
+
+
+def get_processes(name, max_workers):
+    """Return the process pool called ``name``, starting it if it is new.
+
+    Workers are spawned rather than forked from this multi-threaded process,
+    and set Django up before their first task.
+    """
+    with _lock:
+        pool = _process_pools.get(name)
+        if pool is None:
+            pool = _process_pools[name] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+    return pool
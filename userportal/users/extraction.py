@@ -0,0 +1,245 @@
+"""Text and metadata extraction for uploaded documents.
+
+:func:`extract` reads a document and returns its text along with page,
+sheet and word counts. It only uses the standard library, apart from PDF
+text, which needs ``pypdf``; without it PDFs still get a page count. Office
+documents are zip files, so members that would decompress to more than
+``EXTRACTION_MAX_MEMBER_SIZE`` are refused, and their XML is only parsed
+until ``EXTRACTION_MAX_TEXT_LENGTH`` characters of text have been found.
+
+New uploads are queued with :func:`schedule_extraction`, which runs
+:func:`process_file` on a small thread pool after the upload's transaction
+commits, so requests never wait for parsing. Parsing is CPU-bound Python
+that would hold the GIL, so those threads only fetch and store: the
+documents are parsed in worker processes. The pool's queue is bounded: when
+it is full, files simply stay ``pending`` until ``manage.py extract_files``
+processes the backlog on all cores.
+"""
+import logging
+import re
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from xml.etree import ElementTree as ET
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db import transaction
+
+try:
+    import pypdf
+except ImportError:  # pragma: no cover
+    pypdf = None
+
+from . import executors
+from .compression import DecompressedFile
+from .models import FileContent
+from .search import update_search_vectors
+from .storage import COPY_BUFFER_SIZE
+from .storage import blob_storage
+
+logger = logging.getLogger(__name__)
+
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+APP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}'
+
+TEXT_TYPES = {'text/plain', 'application/pdf', DOCX, XLSX}
+
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+PDF_OVERLAP = 64
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def extract(file, content_type):
+    """Return ``text``, ``page_count``, ``sheet_count`` and ``word_count`` for an open binary file."""
+    result = {'text': '', 'page_count': None, 'sheet_count': None}
+    if content_type == 'application/pdf':
+        result.update(extract_pdf(file))
+    elif content_type == DOCX:
+        result.update(extract_docx(file))
+    elif content_type == XLSX:
+        result.update(extract_xlsx(file))
+    elif content_type == 'text/plain':
+        result['text'] = file.read(settings.EXTRACTION_MAX_TEXT_LENGTH).decode('utf-8', errors='replace')
+
+    result['text'] = result['text'][:settings.EXTRACTION_MAX_TEXT_LENGTH]
+    result['word_count'] = len(result['text'].split())
+    return result
+
+
+def has_text(content_type):
+    """Whether :func:`extract` finds text in files of ``content_type``."""
+    return content_type in TEXT_TYPES and (content_type != 'application/pdf' or pypdf is not None)
+
+
+@contextmanager
+def open_located(path, encoding):
+    """Open a blob found at ``path``, stored with ``encoding``, for random access."""
+    if not encoding:
+        with open(path, 'rb') as file:  # noqa: PTH123
+            yield file
+        return
+    # PDF and zip readers seek backwards, which a compressed blob can only do
+    # by decompressing again from the start; decompress it once.
+    with DecompressedFile(path, encoding, path) as file:
+        with tempfile.SpooledTemporaryFile(max_size=COPY_BUFFER_SIZE * 16) as plain:
+            shutil.copyfileobj(file, plain, COPY_BUFFER_SIZE)
+            plain.seek(0)
+            yield plain
+
+
+def extract_located(path, encoding, content_type):
+    """:func:`extract` for a blob found at ``path``; needs no database, so it runs in worker processes."""
+    with open_located(path, encoding) as file:
+        return extract(file, content_type)
+
+
+def extract_stored(name, content_type):
+    """:func:`extract` for a file in the blob store, whichever tier holds it."""
+    located = blob_storage.locate(name)
+    return extract_located(located.path, located.encoding, content_type)
+
+
+def extract_pdf(file):
+    if pypdf is not None:
+        reader = pypdf.PdfReader(file)
+        text = '\n'.join(page.extract_text() or '' for page in reader.pages)
+        return {'text': text, 'page_count': len(reader.pages)}
+
+    # Without a PDF library, count page objects in the raw bytes. Files that
+    # keep their objects in compressed streams report no page count.
+    # Matches starting in the last PDF_OVERLAP bytes of a block are left for
+    # the next window, so a marker split across blocks is counted once.
+    pages = 0
+    tail = b''
+    while block := file.read(READ_BLOCK_SIZE):
+        window = tail + block
+        cutoff = max(len(window) - PDF_OVERLAP, 0)
+        pages += sum(1 for match in PDF_PAGE_RE.finditer(window) if match.start() < cutoff)
+        tail = window[cutoff:]
+    pages += len(PDF_PAGE_RE.findall(tail))
+    return {'page_count': pages or None}
+
+
+def _open_member(archive, member):
+    """Open a zip member, refusing it if it decompresses to more than ``EXTRACTION_MAX_MEMBER_SIZE``."""
+    info = archive.getinfo(member)
+    if info.file_size > settings.EXTRACTION_MAX_MEMBER_SIZE:
+        raise ValueError(f"{member} is too large to extract ({info.file_size} bytes)")
+    # Reading stops at the declared size, whatever the compressed data says.
+    return archive.open(info)
+
+
+def _xml_text(archive, member, tag, paragraph_tag=None):
+    """Concatenate the text of ``tag`` elements, streaming the XML.
+
+    Parsing stops once ``EXTRACTION_MAX_TEXT_LENGTH`` characters are found.
+    """
+    limit = settings.EXTRACTION_MAX_TEXT_LENGTH
+    parts = []
+    length = 0
+    with _open_member(archive, member) as xml:
+        for _, element in ET.iterparse(xml, events=('end',)):
+            if element.tag == tag and element.text:
+                parts.append(element.text)
+                length += len(element.text)
+            elif paragraph_tag and element.tag == paragraph_tag:
+                parts.append('\n')
+                length += 1
+            # Children end before their parent, so nothing read is needed again.
+            element.clear()
+            if length >= limit:
+                break
+    return ''.join(parts)
+
+
+def extract_docx(file):
+    with zipfile.ZipFile(file) as archive:
+        text = _xml_text(archive, 'word/document.xml', f'{WORD_NS}t', f'{WORD_NS}p')
+        page_count = None
+        if 'docProps/app.xml' in archive.namelist():
+            with _open_member(archive, 'docProps/app.xml') as xml:
+                pages = ET.parse(xml).find(f'{APP_NS}Pages')  # noqa: S314
+            if pages is not None and (pages.text or '').isdigit():
+                page_count = int(pages.text)
+    return {'text': text, 'page_count': page_count}
+
+
+def extract_xlsx(file):
+    with zipfile.ZipFile(file) as archive:
+        with _open_member(archive, 'xl/workbook.xml') as xml:
+            workbook = ET.parse(xml).getroot()  # noqa: S314
+        sheet_count = len(workbook.findall(f'{SHEET_NS}sheets/{SHEET_NS}sheet'))
+        text = ''
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            text = _xml_text(archive, 'xl/sharedStrings.xml', f'{SHEET_NS}t', f'{SHEET_NS}si')
+    return {'text': text, 'sheet_count': sheet_count}
+
+
+def save_result(file_id, result=None, error=None):
+    """Store an extraction result (or failure) on the file's ``FileContent``."""
+    if error is not None:
+        FileContent.objects.filter(file_id=file_id).update(
+            status=FileContent.Status.FAILED, error=error[:1000],
+        )
+        return
+    FileContent.objects.filter(file_id=file_id).update(status=FileContent.Status.DONE, error='', **result)
+    update_search_vectors([file_id])
+
+
+def process_file(file_id, offload=False):
+    """Extract one file's content and store the result. Runs in a worker.
+
+    With ``offload``, the document is parsed in a worker process.
+    """
+    content = FileContent.objects.select_related('file').filter(file_id=file_id).first()
+    if content is None:
+        return
+    file = content.file
+    try:
+        if offload:
+            located = blob_storage.locate(file.file.name)
+            pool = executors.get_processes('extraction', settings.EXTRACTION_WORKERS)
+            result = pool.submit(extract_located, located.path, located.encoding, file.file_type).result()
+        else:
+            result = extract_stored(file.file.name, file.file_type)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Extraction failed for file %s: %s", file_id, exc)
+        save_result(file_id, error=str(exc) or exc.__class__.__name__)
+    else:
+        save_result(file_id, result)
+
+
+def _run(file_id):
+    try:
+        process_file(file_id, offload=True)
+    except Exception:
+        logger.exception("Extraction worker crashed for file %s", file_id)
+    finally:
+        # Worker threads get their own database connections; don't leak them.
+        close_old_connections()
+
+
+def _submit(file_id):
+    pool = executors.get('extraction', settings.EXTRACTION_WORKERS, settings.EXTRACTION_QUEUE_SIZE)
+    try:
+        pool.submit(_run, file_id)
+    except executors.QueueFull:
+        logger.info("Extraction queue full, leaving file %s pending", file_id)
+
+
+def schedule_extraction(files):
+    """Mark ``files`` as pending and queue them once the transaction commits."""
+    file_ids = [file.pk for file in files]
+    FileContent.objects.filter(file_id__in=file_ids).update(status=FileContent.Status.PENDING, error='')
+    existing = set(FileContent.objects.filter(file_id__in=file_ids).values_list('file_id', flat=True))
+    FileContent.objects.bulk_create([
+        FileContent(file_id=file_id) for file_id in file_ids if file_id not in existing
+    ])
+    for file_id in file_ids:
+        transaction.on_commit(lambda file_id=file_id: _submit(file_id))
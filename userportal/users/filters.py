@@ -0,0 +1,39 @@
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+
+class FileFilterSerializer(serializers.Serializer):
+    file_type = serializers.CharField(required=False)
+    uploaded_after = serializers.DateTimeField(required=False)
+    uploaded_before = serializers.DateTimeField(required=False)
+    min_size = serializers.IntegerField(required=False, min_value=0)
+    max_size = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, attrs):
+        after, before = attrs.get('uploaded_after'), attrs.get('uploaded_before')
+        if after and before and after > before:
+            raise serializers.ValidationError({'uploaded_before': 'Must not be earlier than uploaded_after'})
+        if attrs.get('min_size', 0) > attrs.get('max_size', float('inf')):
+            raise serializers.ValidationError({'max_size': 'Must not be smaller than min_size'})
+        return attrs
+
+
+class FileFilterBackend(BaseFilterBackend):
+    """Filter the files list by ``file_type``, upload date range and size range."""
+    lookups = {
+        'file_type': 'file_type',
+        'uploaded_after': 'upload_date__gte',
+        'uploaded_before': 'upload_date__lt',
+        'min_size': 'file_size__gte',
+        'max_size': 'file_size__lte',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        if getattr(view, 'action', None) != 'list':
+            return queryset
+        params = {key: value for key, value in request.query_params.items() if key in self.lookups}
+        serializer = FileFilterSerializer(data=params)
+        serializer.is_valid(raise_exception=True)
+        return queryset.filter(**{
+            self.lookups[key]: value for key, value in serializer.validated_data.items()
+        })
@@ -0,0 +1,70 @@
+"""Password hashing on a small, bounded pool of threads.
+
+Hashing a password with argon2 takes a core and about 100MB for a fraction of
+a second. Done on request threads, a burst of logins can occupy every worker
+while cheap requests queue behind them. Here every hash and verification,
+including those inside ``authenticate()`` (see :meth:`User.check_password
+<userportal.users.models.User.check_password>`), runs on
+``PASSWORD_HASHING_WORKERS`` threads per process. At most
+``PASSWORD_HASHING_QUEUE_SIZE`` more wait for one. Beyond that the request
+fails at once with :class:`HashingBusy` (503 with ``Retry-After``) instead of
+piling up.
+
+Threads are enough because argon2 and PBKDF2 release the GIL while they work.
+Async code awaits :func:`ahash_password` and :func:`averify_password`,
+which never block the event loop.
+"""
+import asyncio
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.hashers import verify_password as django_verify_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import executors
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The server is busy, please try again shortly.'
+    default_code = 'hashing_busy'
+    # Sent as Retry-After.
+    wait = 1
+
+
+def get_pool():
+    return executors.get(
+        'password-hashing', settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE_SIZE,
+    )
+
+
+def submit(fn, *args):
+    """Start ``fn(*args)`` on the pool, or raise :class:`HashingBusy` if it is full."""
+    try:
+        return get_pool().submit(fn, *args)
+    except executors.QueueFull:
+        raise HashingBusy from None
+
+
+def hash_password(raw_password):
+    """``make_password()`` on the pool."""
+    if raw_password is None:
+        # Unusable passwords are random strings, not hashes.
+        return make_password(None)
+    return submit(make_password, raw_password).result()
+
+
+def verify_password(raw_password, encoded):
+    """Return ``(is_correct, must_update)`` for ``raw_password``, checked on the pool."""
+    return submit(django_verify_password, raw_password, encoded).result()
+
+
+async def ahash_password(raw_password):
+    if raw_password is None:
+        return make_password(None)
+    return await asyncio.wrap_future(submit(make_password, raw_password))
+
+
+async def averify_password(raw_password, encoded):
+    return await asyncio.wrap_future(submit(django_verify_password, raw_password, encoded))
@@ -0,0 +1,82 @@
+import sys
+import time
+import uuid
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from userportal.users.models import User
+from userportal.users.views import MyTokenObtainPairView
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure logins per second through /api/token/ with the configured password hasher. "
+        "The throwaway user it logs in as is rolled back afterwards, and login rate limits are "
+        "lifted while it runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=20)
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Also time the old flow, which checked the password a second time after issuing tokens.",
+        )
+
+    def handle(self, *args, **options):
+        logins = options["logins"]
+        factory = APIRequestFactory()
+        view = MyTokenObtainPairView.as_view()
+        password = uuid.uuid4().hex
+
+        # Every login still goes through the rate limiter, so its cost is
+        # measured, but no limit is ever reached.
+        unlimited = {
+            f"LOGIN_RATE_LIMIT_{name}": sys.maxsize for name in ("PER_IP", "PER_EMAIL")
+        }
+        with override_settings(**unlimited), transaction.atomic():
+            user = User.objects.create_user(
+                email=f"benchmark-{uuid.uuid4().hex}@example.com", name="Benchmark", password=password,
+            )
+            body = {"email": user.email, "password": password}
+            # The first login may rehash the password with current parameters.
+            view(factory.post("/api/token/", body, format="json"))
+
+            def log_in():
+                response = view(factory.post("/api/token/", body, format="json"))
+                if response.status_code != 200:
+                    raise CommandError(f"Login failed with status {response.status_code}")
+
+            def log_in_twice():
+                # What the view used to do to build X-User-Data.
+                log_in()
+                authenticate(email=body["email"], password=body["password"])
+
+            wall, cpu = self.measure(log_in, logins)
+            if options["compare"]:
+                old_wall, old_cpu = self.measure(log_in_twice, logins)
+            transaction.set_rollback(True)
+
+        # Hashers may use several threads, so CPU time gives the per-core rate.
+        self.stdout.write(
+            f"{logins} logins with {get_hasher().algorithm}: {logins / wall:.1f} per second, "
+            f"{logins / cpu:.1f} per second per core.",
+        )
+        if options["compare"]:
+            self.stdout.write(
+                f"Checking the password twice: {logins / old_wall:.1f} per second, "
+                f"{logins / old_cpu:.1f} per second per core ({old_cpu / cpu:.1f}x the CPU time).",
+            )
+
+    def measure(self, log_in, logins):
+        """Wall clock and CPU seconds taken by ``logins`` calls of ``log_in``."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        for _ in range(logins):
+            log_in()
+        return time.perf_counter() - wall, time.process_time() - cpu
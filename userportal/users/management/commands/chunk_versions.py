@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from userportal.users.models import FileVersion
+from userportal.users.versions import chunk_version
+
+
+class Command(BaseCommand):
+    help = "Split replaced file versions that still hold their whole content into shared chunks."
+
+    def handle(self, *args, **options):
+        pending = FileVersion.objects.filter(chunks__isnull=True, blob__isnull=False).order_by("pk")
+        done = failed = 0
+        for version_id in pending.values_list("pk", flat=True).iterator():
+            try:
+                chunk_version(version_id)
+            except Exception as exc:  # noqa: BLE001
+                failed += 1
+                self.stderr.write(f"Version {version_id}: {exc}")
+            else:
+                done += 1
+        self.stdout.write(f"Chunked {done} versions, {failed} failed.")
@@ -0,0 +1,80 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from userportal.users.models import File
+from userportal.users.storage import blob_name
+from userportal.users.storage import blob_storage
+from userportal.users.storage import content_digest
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill content hashes for files that are not in the blob store yet, "
+        "move them into it and delete the duplicate copies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be moved and reclaimed without changing anything.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        pending = File.objects.filter(blob__isnull=True).exclude(file="")
+        names = pending.order_by("file").values_list("file", flat=True).distinct()
+
+        moved = collapsed = missing = reclaimed = 0
+        for name in names.iterator(chunk_size=options["batch_size"]):
+            if not blob_storage.exists(name):
+                missing += 1
+                self.stderr.write(f"Missing on disk: {name}")
+                continue
+
+            with blob_storage.open(name) as content:
+                digest = content_digest(content)
+                size = content.size
+            target = blob_name(digest)
+            duplicate = target != name and blob_storage.exists(target)
+
+            if duplicate:
+                collapsed += 1
+                reclaimed += size
+            elif target != name:
+                moved += 1
+            if dry_run:
+                continue
+
+            if target != name and not duplicate:
+                self.link_into_store(blob_storage.path(name), blob_storage.path(target))
+            with transaction.atomic():
+                for file in File.objects.select_for_update().filter(file=name, blob__isnull=True):
+                    file.file.name = target
+                    file.save(update_fields=["file", "blob"])
+                if target != name:
+                    transaction.on_commit(lambda name=name: blob_storage.delete(name))
+
+        prefix = "Would move" if dry_run else "Moved"
+        self.stdout.write(
+            f"{prefix} {moved} files into the blob store, collapsed {collapsed} duplicates "
+            f"({reclaimed} bytes reclaimed), {missing} files missing on disk."
+        )
+
+    def link_into_store(self, source, target):
+        """Make ``target`` a copy of ``source`` without touching ``source``.
+
+        The original is only deleted once the rows pointing at it have been
+        updated, so an interrupted run never loses data.
+        """
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except OSError:
+            tmp_path = f"{target}.tmp"
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, target)
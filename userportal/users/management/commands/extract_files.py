@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+
+import django
+from django.core.management.base import BaseCommand
+
+from userportal.users.extraction import extract_stored
+from userportal.users.extraction import save_result
+from userportal.users.models import File
+from userportal.users.models import FileContent
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract text and metadata for files that are pending, failed or were "
+        "never processed, using one worker process per core."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Reprocess every file, including those already extracted.",
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        workers = max(options["workers"], 1)
+        untracked = File.objects.filter(content__isnull=True).values_list("pk", flat=True)
+        FileContent.objects.bulk_create(
+            [FileContent(file_id=pk) for pk in untracked.iterator()],
+            batch_size=1000,
+        )
+
+        contents = FileContent.objects.all()
+        if not options["all"]:
+            contents = contents.exclude(status=FileContent.Status.DONE)
+        jobs = list(contents.order_by("file_id").values_list("file_id", "file__file", "file__file_type"))
+
+        done = failed = 0
+        # Parsing is CPU-bound, so use processes rather than threads. Results
+        # come back to this process, which is the only one writing to the
+        # database. At most a few jobs per worker are queued at a time.
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            running = {}
+            for file_id, name, file_type in jobs:
+                running[pool.submit(extract_stored, name, file_type)] = file_id
+                if len(running) >= workers * 4:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        ok = self.record(running.pop(future), future)
+                        done, failed = done + ok, failed + (not ok)
+            for future in wait(running).done:
+                ok = self.record(running[future], future)
+                done, failed = done + ok, failed + (not ok)
+
+        self.stdout.write(f"Extracted {done} files, {failed} failed.")
+
+    def record(self, file_id, future):
+        exc = future.exception()
+        if exc is not None:
+            self.stderr.write(f"File {file_id}: {exc}")
+            save_result(file_id, error=str(exc) or exc.__class__.__name__)
+            return False
+        save_result(file_id, future.result())
+        return True
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from userportal.users.blacklist import KEY
+from userportal.users.redis_client import get_redis
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy revoked refresh tokens that have not expired yet from the token_blacklist "
+        "tables to Redis, for TOKEN_BLACKLIST_BACKEND = 'redis'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clear-tables",
+            action="store_true",
+            help="Empty the token_blacklist tables afterwards; only once the Redis backend is in use.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        revoked = (
+            BlacklistedToken.objects.filter(token__expires_at__gt=now)
+            .values_list("token__jti", "token__expires_at")
+            .order_by("pk")
+        )
+        client = get_redis()
+        pipeline = client.pipeline(transaction=False)
+        copied = 0
+        for jti, expires_at in revoked.iterator(chunk_size=options["batch_size"]):
+            ttl = int((expires_at - now).total_seconds()) + 1
+            pipeline.set(KEY.format(jti), 1, ex=ttl)
+            copied += 1
+            if copied % options["batch_size"] == 0:
+                pipeline.execute()
+        pipeline.execute()
+        self.stdout.write(f"Copied {copied} revoked tokens to Redis.")
+
+        if options["clear_tables"]:
+            # Blacklisted tokens go with their outstanding token.
+            deleted, _ = OutstandingToken.objects.all().delete()
+            self.stdout.write(f"Deleted {deleted} rows from the token_blacklist tables.")
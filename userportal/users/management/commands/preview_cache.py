@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from userportal.users.previews import cache_stats
+from userportal.users.previews import preview_cache
+
+
+class Command(BaseCommand):
+    help = "Report the preview cache's size and hit rate, and optionally shrink or empty it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-bytes",
+            type=int,
+            help="Evict least recently used previews until the cache is below this size.",
+        )
+        parser.add_argument("--clear", action="store_true", help="Remove every cached preview.")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            preview_cache.evict(max_bytes=0)
+        elif options["max_bytes"] is not None:
+            preview_cache.evict(max_bytes=options["max_bytes"])
+
+        entries = list(preview_cache.entries())
+        stats = cache_stats()
+        requests = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / requests if requests else 0
+        self.stdout.write(
+            f"{len(entries)} previews ({sum(size for _, size, _ in entries)} bytes) in {preview_cache.root}. "
+            f"{stats['hits']} hits, {stats['misses']} misses ({hit_rate:.0%} hit rate).",
+        )
@@ -0,0 +1,177 @@
+import os
+import time
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils._os import safe_join
+
+from userportal.users.compression import SUFFIXES
+from userportal.users.models import Blob
+from userportal.users.models import File
+from userportal.users.models import UploadSession
+from userportal.users.storage import Throttle
+from userportal.users.storage import blob_digest
+from userportal.users.storage import blob_name
+from userportal.users.storage import blob_storage
+
+LEGACY_UPLOAD_DIR = "uploads"
+
+
+def walk(root):
+    """Yield ``(path, stat)`` for every regular file under ``root``, using ``os.scandir``."""
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.path, entry.stat(follow_symlinks=False)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Find stored bytes that no row refers to, and rows whose bytes are missing. "
+        "Orphaned files are quarantined (or deleted) at a limited rate; missing "
+        "ones are reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete orphaned files instead of moving them to ORPHAN_QUARANTINE_DIR.",
+        )
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Leave files modified more recently than this alone; they may belong to uploads in progress.",
+        )
+        parser.add_argument(
+            "--max-rate",
+            type=float,
+            default=200,
+            help="Maximum orphaned files to remove per second (0 for no limit).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.cutoff = time.time() - options["grace_hours"] * 3600
+        self.throttle = Throttle(options["max_rate"])
+        self.orphans = self.reclaimed = 0
+
+        # Files on disk are checked against the database a batch at a time,
+        # and rows are streamed with server-side cursors, so memory stays
+        # bounded however many files there are.
+        roots = [(settings.MEDIA_ROOT, [settings.BLOB_STORAGE_DIR, LEGACY_UPLOAD_DIR, settings.RESUMABLE_UPLOAD_DIR])]
+        if settings.COLD_STORAGE_ROOT:
+            roots.append((settings.COLD_STORAGE_ROOT, [settings.BLOB_STORAGE_DIR]))
+        for root, directories in roots:
+            for directory in directories:
+                files = walk(os.path.join(root, directory))
+                for batch in batched(files, options["batch_size"]):
+                    self.reconcile(root, batch)
+
+        missing_blobs, missing_files = self.find_missing()
+
+        prefix = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(
+            f"{prefix} {self.orphans} orphaned files ({self.reclaimed} bytes). "
+            f"{missing_blobs} blobs and {missing_files} files are missing from storage.",
+        )
+
+    def reconcile(self, root, batch):
+        """Remove the files in ``batch`` that nothing refers to."""
+        keys = {}
+        for path, stat in batch:
+            # Recently written files may not have their row yet.
+            if stat.st_mtime < self.cutoff:
+                name = os.path.relpath(path, root).replace(os.sep, "/")
+                keys[path] = (self.classify(name), stat.st_size)
+
+        blobs = {key for (kind, key), _ in keys.values() if kind == "blob"}
+        sessions = {key for (kind, key), _ in keys.values() if kind == "session"}
+        names = {key for (kind, key), _ in keys.values() if kind == "file"}
+        referenced = {
+            "blob": set(Blob.objects.filter(pk__in=blobs).values_list("pk", flat=True)),
+            "session": {str(pk) for pk in UploadSession.objects.filter(pk__in=sessions).values_list("pk", flat=True)},
+            "file": set(File.objects.filter(file__in=names).values_list("file", flat=True)),
+            "stray": set(),
+        }
+        for path, ((kind, key), size) in keys.items():
+            if key in referenced[kind]:
+                continue
+            if kind == "blob" and Blob.objects.filter(pk=key).exists():
+                # Uploaded again since the batch was checked.
+                continue
+            self.remove(root, path, size)
+
+    def classify(self, name):
+        """Return ``(kind, key)``: the kind of row that would refer to ``name``, and how."""
+        if name.endswith(".tmp"):
+            # Partial writes are renamed into place when they finish.
+            return "stray", None
+        directory, _, filename = name.rpartition("/")
+        if directory == settings.RESUMABLE_UPLOAD_DIR:
+            session_id, _, _ = filename.partition(".")
+            try:
+                return "session", str(uuid.UUID(session_id))
+            except ValueError:
+                return "stray", None
+        if name.startswith(f"{settings.BLOB_STORAGE_DIR}/"):
+            for suffix in SUFFIXES.values():
+                name = name.removesuffix(suffix)
+            digest = blob_digest(name)
+            return ("blob", digest) if digest else ("stray", None)
+        return "file", name
+
+    def remove(self, root, path, size):
+        self.orphans += 1
+        self.reclaimed += size
+        if self.options["dry_run"]:
+            self.stdout.write(f"Orphaned: {path}")
+            return
+        try:
+            if self.options["delete"]:
+                os.remove(path)
+            else:
+                # Keep the layout so a file can be put back by hand.
+                target = safe_join(root, settings.ORPHAN_QUARANTINE_DIR, os.path.relpath(path, root))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+        except FileNotFoundError:
+            self.orphans -= 1
+            self.reclaimed -= size
+            return
+        self.throttle.wait(1)
+
+    def find_missing(self):
+        """Report blobs and legacy files whose bytes are not in storage."""
+        missing_blobs = missing_files = 0
+        for sha256 in Blob.objects.values_list("sha256", flat=True).iterator(chunk_size=2000):
+            if not blob_storage.exists(blob_name(sha256)):
+                missing_blobs += 1
+                files = File.objects.filter(blob_id=sha256).count()
+                missing_files += files
+                self.stderr.write(f"Missing on disk: blob {sha256} ({files} files)")
+        legacy = File.objects.filter(blob__isnull=True).values_list("pk", "file")
+        for pk, name in legacy.iterator(chunk_size=2000):
+            if not name or not blob_storage.exists(name):
+                missing_files += 1
+                self.stderr.write(f"Missing on disk: file {pk} ({name})")
+        return missing_blobs, missing_files
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Sum
+
+from userportal.users.models import File
+from userportal.users.models import FileVersion
+from userportal.users.models import StorageUsage
+from userportal.users.models import User
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's storage usage counters from their files and file versions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report counters that are out of date without fixing them.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        checked = fixed = 0
+        last_pk = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size],
+            )
+            if not user_ids:
+                break
+            last_pk = user_ids[-1]
+            checked += len(user_ids)
+            fixed += self.reconcile(user_ids, dry_run=options["dry_run"])
+
+        prefix = "Would fix" if options["dry_run"] else "Fixed"
+        self.stdout.write(f"Checked {checked} users. {prefix} {fixed} usage counters.")
+
+    @transaction.atomic
+    def reconcile(self, user_ids, dry_run):
+        # Lock the counters first: uploads and deletes take the same locks, so
+        # the totals below cannot change before they are written back.
+        StorageUsage.objects.bulk_create([StorageUsage(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        usages = StorageUsage.objects.select_for_update().filter(pk__in=user_ids).order_by("pk").in_bulk()
+        actual = {user_id: StorageUsage(user_id=user_id) for user_id in user_ids}
+        rows = (
+            File.objects.filter(user_id__in=user_ids)
+            .values("user_id", "file_type")
+            .annotate(count=Count("pk"), bytes=Sum("file_size"))
+            .order_by()
+        )
+        for row in rows:
+            actual[row["user_id"]].add(row["file_type"], row["bytes"], row["count"])
+        replaced = (
+            FileVersion.objects.filter(file__user_id__in=user_ids)
+            .exclude(pk=F("file__current_version"))
+            .values("file__user_id")
+            .annotate(bytes=Sum("size"))
+            .order_by()
+        )
+        for row in replaced:
+            actual[row["file__user_id"]].add_versions(row["bytes"])
+
+        stale = []
+        for user_id, usage in usages.items():
+            expected = actual[user_id]
+            if (usage.bytes_used, usage.file_count, usage.by_type) != (
+                expected.bytes_used, expected.file_count, expected.by_type,
+            ):
+                self.stdout.write(
+                    f"User {user_id}: {usage.bytes_used} bytes in {usage.file_count} files recorded, "
+                    f"{expected.bytes_used} bytes in {expected.file_count} files stored.",
+                )
+                usage.bytes_used = expected.bytes_used
+                usage.file_count = expected.file_count
+                usage.by_type = expected.by_type
+                stale.append(usage)
+        if dry_run:
+            transaction.set_rollback(True)
+        elif stale:
+            StorageUsage.objects.bulk_update(stale, ["bytes_used", "file_count", "by_type"])
+        return len(stale)
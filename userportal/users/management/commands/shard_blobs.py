@@ -0,0 +1,71 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import CharField
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.db.models.functions import Substr
+
+from userportal.users.models import Blob
+from userportal.users.models import File
+from userportal.users.storage import blob_name
+from userportal.users.storage import blob_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move blobs into the directory layout set by BLOB_STORAGE_FANOUT and "
+        "rename the files that refer to them, in batches, while the site is up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        moved = renamed = 0
+        last_pk = ""
+        while True:
+            digests = list(
+                Blob.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:options["batch_size"]],
+            )
+            if not digests:
+                break
+            last_pk = digests[-1]
+            for digest in digests:
+                moved += self.move(digest, dry_run=options["dry_run"])
+            renamed += self.rename(digests, dry_run=options["dry_run"])
+
+        prefix = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(f"{prefix} {moved} stored files and renamed {renamed} files.")
+
+    def move(self, digest, dry_run):
+        """Rename every stored copy of a blob into the current layout.
+
+        Storage looks for a blob under every layout, and each rename is
+        atomic, so readers find the bytes throughout.
+        """
+        name = blob_name(digest)
+        current, *old_names = blob_storage.layouts(name)
+        moved = 0
+        for old_name in old_names:
+            for source, target in zip(blob_storage.variants(old_name), blob_storage.variants(current)):
+                if not os.path.exists(source.path):
+                    continue
+                moved += 1
+                if not dry_run:
+                    os.makedirs(os.path.dirname(target.path), exist_ok=True)
+                    os.replace(source.path, target.path)
+        return moved
+
+    def rename(self, digests, dry_run):
+        """Point ``File.file`` at the current names, with one query per batch."""
+        files = File.objects.filter(blob_id__in=digests).exclude(file__in=[blob_name(digest) for digest in digests])
+        if dry_run:
+            return files.count()
+        # blob_name() spelled out in SQL.
+        parts = [Value(f"{settings.BLOB_STORAGE_DIR}/")]
+        for level in range(settings.BLOB_STORAGE_FANOUT):
+            parts += [Substr("blob_id", level * 2 + 1, 2), Value("/")]
+        return files.update(file=Concat(*parts, "blob_id", output_field=CharField()))
@@ -0,0 +1,103 @@
+from argparse import BooleanOptionalAction
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from userportal.users.models import Blob
+from userportal.users.storage import COLD
+from userportal.users.storage import HOT
+from userportal.users.storage import Throttle
+from userportal.users.storage import blob_name
+from userportal.users.storage import blob_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move blobs that have not been read for a while to cold storage, and "
+        "bring cold blobs that were read again back to hot storage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.COLD_STORAGE_AFTER_DAYS,
+            help="Days without a read before a blob is moved to cold storage.",
+        )
+        parser.add_argument(
+            "--compress",
+            action=BooleanOptionalAction,
+            default=settings.COLD_STORAGE_COMPRESS,
+            help="Compress blobs moved to cold storage.",
+        )
+        parser.add_argument(
+            "--max-rate",
+            type=float,
+            default=20.0,
+            help="Maximum MB per second to copy between tiers (0 for no limit).",
+        )
+        parser.add_argument("--limit", type=int, default=None, help="Move at most this many blobs.")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if not blob_storage.cold_location:
+            msg = "COLD_STORAGE_ROOT is not set."
+            raise CommandError(msg)
+
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        read_since = Q(last_accessed__gte=cutoff)
+        unread_since = Q(last_accessed__lt=cutoff) | Q(last_accessed__isnull=True, created__lt=cutoff)
+        # A cold blob read since the cutoff was read after it was moved,
+        # because it was moved for not having been read since then.
+        moves = [
+            (HOT, Blob.objects.filter(read_since, tier=COLD).order_by("-last_accessed")),
+            (COLD, Blob.objects.filter(unread_since, tier=HOT).order_by("last_accessed", "created")),
+        ]
+
+        throttle = Throttle(options["max_rate"] * 1024 * 1024)
+        limit = options["limit"]
+        moved = {HOT: [0, 0], COLD: [0, 0]}
+        for tier, blobs in moves:
+            for sha256, size in blobs.values_list("sha256", "size").iterator():
+                if limit is not None and limit <= 0:
+                    break
+                if not options["dry_run"] and not self.move(sha256, tier, options["compress"]):
+                    continue
+                moved[tier][0] += 1
+                moved[tier][1] += size
+                if limit is not None:
+                    limit -= 1
+                if not options["dry_run"]:
+                    throttle.wait(size)
+
+        prefix = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(
+            f"{prefix} {moved[COLD][0]} blobs ({moved[COLD][1]} bytes) to cold storage "
+            f"and {moved[HOT][0]} blobs ({moved[HOT][1]} bytes) to hot storage.",
+        )
+
+    def move(self, sha256, tier, compress):
+        name = blob_name(sha256)
+        try:
+            blob_storage.move_to_tier(name, tier, compress=compress)
+        except FileNotFoundError:
+            self.stderr.write(f"Missing on disk: {name}")
+            return False
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(pk=sha256).first()
+            if blob is None:
+                # Released while it was being copied, so the copy just written
+                # may be left behind. With no row to lock, deleting it could
+                # race an upload of the same bytes; reconcile_files removes it
+                # once it is old enough.
+                self.stderr.write(f"Released while moving: {name}")
+                return False
+            blob.tier = tier
+            blob.save(update_fields=["tier"])
+        return True
+
@@ -1,11 +1,25 @@
+from datetime import timedelta
 from typing import TYPE_CHECKING
 
-from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import UserManager as DjangoUserManager
+from django.db import IntegrityError
+from django.db import models
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Q
+from django.utils import timezone
+
+from .hashing import hash_password
+from .storage import blob_name
+from .storage import blob_storage
 
 if TYPE_CHECKING:
     from .models import User  # noqa: F401
 
+# Reads update Blob.last_accessed at most this often, so popular files do not
+# cost a write per download.
+ACCESS_RESOLUTION = timedelta(hours=1)
+
 
 class UserManager(DjangoUserManager["User"]):
     """Custom manager for the User model."""
@@ -19,7 +33,7 @@ class UserManager(DjangoUserManager["User"]):
             raise ValueError(msg)
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
-        user.password = make_password(password)
+        user.password = hash_password(password)
         user.save(using=self._db)
         return user
 
@@ -40,3 +54,88 @@ class UserManager(DjangoUserManager["User"]):
             raise ValueError(msg)
 
         return self._create_user(email, password, **extra_fields)
+
+
+class BlobManager(models.Manager):
+    """Reference counting for content-addressed blobs."""
+
+    def acquire(self, sha256: str, size: int, count: int = 1):
+        """Add ``count`` references to a blob, creating its row on first use."""
+        with transaction.atomic():
+            if not self.filter(pk=sha256).update(ref_count=F("ref_count") + count):
+                try:
+                    with transaction.atomic():
+                        self.create(sha256=sha256, size=size, ref_count=count)
+                except IntegrityError:
+                    # Created concurrently by another upload of the same bytes.
+                    self.filter(pk=sha256).update(ref_count=F("ref_count") + count)
+        return sha256
+
+    def release(self, sha256: str, count: int = 1):
+        """Drop ``count`` references and delete the blob once nothing refers to it."""
+        with transaction.atomic():
+            blob = self.select_for_update().filter(pk=sha256).first()
+            if blob is None:
+                return
+            if blob.ref_count > count:
+                self.filter(pk=sha256).update(ref_count=F("ref_count") - count)
+                return
+            # The row stays, with no references, until the bytes are gone;
+            # see delete_unreferenced().
+            self.filter(pk=sha256).update(ref_count=0)
+        transaction.on_commit(lambda: self.delete_unreferenced(sha256))
+
+    def delete_unreferenced(self, sha256: str):
+        """Delete a blob's bytes and row if it still has no references.
+
+        The row is locked while the bytes are deleted. An upload of the same
+        content adds its reference by updating that row, so either it waits
+        and then finds no bytes and writes them again, or it gets there
+        first and the blob is kept.
+        """
+        with transaction.atomic():
+            blob = self.select_for_update().filter(pk=sha256, ref_count=0).first()
+            if blob is None:
+                return
+            blob_storage.delete(blob_name(sha256))
+            blob.delete()
+
+    def _untouched(self, sha256, now):
+        return self.filter(
+            Q(last_accessed__isnull=True) | Q(last_accessed__lt=now - ACCESS_RESOLUTION),
+            pk=sha256,
+        )
+
+    def touch(self, sha256: str):
+        """Record that a blob was read, for tiering."""
+        now = timezone.now()
+        self._untouched(sha256, now).update(last_accessed=now)
+
+    async def atouch(self, sha256: str):
+        now = timezone.now()
+        await self._untouched(sha256, now).aupdate(last_accessed=now)
+
+
+class StorageUsageManager(models.Manager):
+    def locked(self, user_id):
+        """Return a user's usage row locked until the end of the transaction, creating it if needed."""
+        usage = self.select_for_update().filter(pk=user_id).first()
+        if usage is None:
+            try:
+                with transaction.atomic():
+                    self.create(user_id=user_id)
+            except IntegrityError:
+                # Created concurrently by another upload from the same user.
+                pass
+            usage = self.select_for_update().get(pk=user_id)
+        return usage
+
+    def refund(self, user_id, file_type: str, size: int, count: int = 1, versions: int = 0):
+        """Take deleted files, and ``versions`` bytes of their replaced versions, off a user's usage."""
+        with transaction.atomic():
+            # Missing when the user itself is being deleted.
+            usage = self.select_for_update().filter(pk=user_id).first()
+            if usage is not None:
+                usage.add(file_type, -size, -count)
+                usage.add_versions(-versions)
+                usage.save()
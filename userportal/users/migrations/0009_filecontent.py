@@ -0,0 +1,33 @@
+# Generated by Django 5.0.13 on 2026-10-18 03:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_blob_file_original_name'),
+    ]
+
+    operations = [
+        # Office MIME types are longer than the original 50 characters.
+        migrations.AlterField(
+            model_name='file',
+            name='file_type',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.CreateModel(
+            name='FileContent',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='users.file')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('text', models.TextField(blank=True)),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('sheet_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('word_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
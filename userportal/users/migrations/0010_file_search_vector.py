@@ -0,0 +1,61 @@
+# Generated by Django 5.0.13 on 2026-10-18 03:41
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import BtreeGinExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import Func
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models import TextField
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Substr
+
+
+def populate_search_vectors(apps, schema_editor):
+    File = apps.get_model('users', 'File')
+    FileContent = apps.get_model('users', 'FileContent')
+    config = settings.SEARCH_CONFIG
+    text = FileContent.objects.filter(file=OuterRef('pk')).values('text')[:1]
+    File.objects.update(search_vector=(
+        SearchVector(
+            Func(
+                'original_name', Value('[^[:alnum:]]+'), Value(' '), Value('g'),
+                function='regexp_replace', output_field=TextField(),
+            ),
+            weight='A',
+            config=config,
+        )
+        + SearchVector(Coalesce('description', Value(''), output_field=TextField()), weight='B', config=config)
+        + SearchVector(
+            Coalesce(Substr(Subquery(text), 1, settings.SEARCH_MAX_TEXT_LENGTH), Value(''), output_field=TextField()),
+            weight='C',
+            config=config,
+        )
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_filecontent'),
+    ]
+
+    operations = [
+        # Lets the GIN index cover user_id as well as the search vector.
+        BtreeGinExtension(),
+        migrations.AddField(
+            model_name='file',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Fill the column before the index exists, so it is built once.
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='file',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'search_vector'], name='file_user_search_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.13 on 2026-10-18 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_file_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['user', '-upload_date', '-id'], name='file_user_upload_date_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.13 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_storageusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='last_accessed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='tier',
+            field=models.CharField(choices=[('hot', 'Hot'), ('cold', 'Cold')], default='hot', max_length=4),
+        ),
+        migrations.AddIndex(
+            model_name='blob',
+            index=models.Index(fields=['tier', 'last_accessed'], name='blob_tier_last_accessed_idx'),
+        ),
+    ]
@@ -1,13 +1,27 @@
+import os
+import uuid
 from typing import ClassVar
 
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.db.models import CharField
 from django.db.models import EmailField
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from .hashing import ahash_password
+from .hashing import averify_password
+from .hashing import hash_password
+from .hashing import verify_password
+from .managers import BlobManager
+from .managers import StorageUsageManager
 from .managers import UserManager
+from .storage import COLD
+from .storage import HOT
+from .storage import get_blob_storage
 
 class User(AbstractUser):
     """
@@ -40,6 +54,28 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+    # Hashing runs on the bounded pool in hashing.py, not the request thread.
+
+    def set_password(self, raw_password):
+        self.password = hash_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        is_correct, must_update = verify_password(raw_password, self.password)
+        if is_correct and must_update:
+            self.set_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes.
+            self._password = None
+            self.save(update_fields=["password"])
+        return is_correct
+
+    async def acheck_password(self, raw_password):
+        is_correct, must_update = await averify_password(raw_password, self.password)
+        if is_correct and must_update:
+            self.password = await ahash_password(raw_password)
+            await self.asave(update_fields=["password"])
+        return is_correct
+
     def has_perm(self, perm, obj=None):
         """Does the user have a specific permission?"""
         return True
@@ -78,13 +114,170 @@ class PhoneNumber(models.Model):
         verbose_name_plural = "Phone Numbers"
 
 
+class Blob(models.Model):
+    """Stored content, keyed by SHA-256 and shared by every ``File`` with the same bytes."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    # Maintained by `manage.py tier_blobs`; reads find the bytes either way.
+    tier = models.CharField(max_length=4, choices=[(HOT, 'Hot'), (COLD, 'Cold')], default=HOT)
+    last_accessed = models.DateTimeField(null=True, blank=True)
+
+    objects: ClassVar[BlobManager] = BlobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tier', 'last_accessed'], name='blob_tier_last_accessed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} references)"
+
+
 class File(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='uploads/')
-    file_type = models.CharField(max_length=50)
+    file = models.FileField(upload_to='uploads/', storage=get_blob_storage)
+    original_name = models.CharField(max_length=255, blank=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='files')
+    file_type = models.CharField(max_length=100)
     file_size = models.IntegerField()
     upload_date = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True, null=True)
+    # Maintained by userportal.users.search.update_search_vectors().
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Set once a file has more than one version, see userportal/users/versions.py.
+    current_version = models.ForeignKey(
+        'FileVersion', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['user', 'search_vector'], name='file_user_search_idx'),
+            # Serves the paginated files list, newest first.
+            models.Index(fields=['user', '-upload_date', '-id'], name='file_user_upload_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.file.name} - {self.user.email}"
+
+    @property
+    def download_name(self):
+        return self.original_name or os.path.basename(self.file.name)
+
+
+class FileVersion(models.Model):
+    """One revision of a ``File``.
+
+    The current version's bytes are the file's own. A replaced version holds
+    a reference to its whole ``blob`` until it has been split into ``chunks``,
+    ``[[sha256, size], ...]`` in order, each a blob shared with any other
+    version containing the same bytes.
+    """
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='versions')
+    number = models.PositiveIntegerField()
+    original_name = models.CharField(max_length=255, blank=True)
+    file_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    chunks = models.JSONField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'number'], name='unique_file_version_number'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_id} v{self.number}"
+
+
+class FileContent(models.Model):
+    """Text and metadata extracted from a ``File`` in the background."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        DONE = 'done', _('Done')
+        FAILED = 'failed', _('Failed')
+
+    file = models.OneToOneField(File, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, db_index=True)
+    text = models.TextField(blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    sheet_count = models.PositiveIntegerField(null=True, blank=True)
+    word_count = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_id} ({self.status})"
+
+
+class StorageUsage(models.Model):
+    """Running totals of a user's files, kept in step with ``File`` rows so quota checks never sum the table.
+
+    ``bytes_used`` also counts the replaced versions of files, which are not
+    files of their own and so are left out of ``file_count`` and ``by_type``.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='storage_usage')
+    bytes_used = models.BigIntegerField(default=0)
+    file_count = models.PositiveIntegerField(default=0)
+    # {file_type: {"count": files, "bytes": total size}}
+    by_type = models.JSONField(default=dict, blank=True)
+    quota = models.BigIntegerField(null=True, blank=True, help_text="Bytes allowed. Empty for the default quota.")
+    updated = models.DateTimeField(auto_now=True)
+
+    objects: ClassVar[StorageUsageManager] = StorageUsageManager()
+
+    def __str__(self):
+        return f"{self.user_id}: {self.bytes_used} of {self.limit} bytes"
+
+    @property
+    def limit(self):
+        return self.quota if self.quota is not None else settings.STORAGE_QUOTA_DEFAULT
+
+    def has_room(self, size):
+        return self.bytes_used + size <= self.limit
+
+    def add(self, file_type, size, count=1):
+        self.bytes_used += size
+        self.file_count += count
+        totals = self.by_type.setdefault(file_type, {'count': 0, 'bytes': 0})
+        totals['count'] += count
+        totals['bytes'] += size
+        if totals['count'] <= 0:
+            del self.by_type[file_type]
+
+    def add_versions(self, size):
+        self.bytes_used += size
+
+
+class UploadSession(models.Model):
+    """A resumable upload whose chunks are written to a staging file until it is completed."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    total_size = models.BigIntegerField()
+    description = models.TextField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.total_size} bytes) - {self.user.email}"
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    offset = models.BigIntegerField()
+    size = models.IntegerField()
+
+    class Meta:
+        ordering = ['offset']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'offset'], name='unique_upload_chunk_offset'),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} @ {self.offset} ({self.size} bytes)"
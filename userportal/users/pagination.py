@@ -0,0 +1,16 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class FileCursorPagination(CursorPagination):
+    """Keyset pagination for the files list.
+
+    The cursor encodes the last ``upload_date`` seen, so each page is an index
+    range scan on ``(user, upload_date, id)`` and page 1000 costs the same as
+    page 1. Rows sharing the cursor's ``upload_date`` are skipped by an offset
+    the cursor also carries; ``id`` only keeps their order stable.
+    """
+    ordering = ('-upload_date', '-id')
+    page_size = settings.FILE_LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.FILE_LIST_MAX_PAGE_SIZE
@@ -0,0 +1,295 @@
+"""Dashboard previews: a first-page thumbnail or a short text snippet.
+
+``GET /api/files/<id>/preview/`` returns a PNG thumbnail of a PDF's first
+page (``?kind=thumbnail``), or the opening text of a TXT, DOCX, XLSX or PDF
+(``?kind=text``). Thumbnails need ``pymupdf``; without it every file gets a
+text snippet. Snippets of documents come from the text extracted when they
+were uploaded (``FileContent``), so they cost a query and are not cached;
+files without text have no snippet.
+
+Thumbnails and plain text snippets are rendered on a small thread pool, and
+a request for a preview that is already being rendered waits for that render
+instead of starting another. PyMuPDF is not thread-safe, so the pages
+themselves are drawn in worker processes. Past ``PREVIEW_QUEUE_SIZE`` waiting
+renders, requests are told to come back later. Results are kept in :class:`PreviewCache`, a
+directory under ``MEDIA_ROOT`` keyed by the content hash, so identical files
+share previews and a replaced file gets new ones. Each process evicts the
+least recently used previews once it sees the directory grow past
+``PREVIEW_CACHE_MAX_BYTES``. Hits and misses are counted in the default
+cache; ``manage.py preview_cache`` reports them.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import pymupdf
+except ImportError:  # pragma: no cover
+    pymupdf = None
+
+from . import executors
+from .extraction import has_text
+from .models import FileContent
+from .storage import COPY_BUFFER_SIZE
+from .storage import blob_storage
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL = 'thumbnail'
+TEXT = 'text'
+# Eviction goes a little below the limit so it does not run on every write.
+EVICTION_TARGET = 0.9
+STATS_KEY = 'previews:{}'
+
+
+class PreviewUnavailable(Exception):
+    pass
+
+
+class PreviewPending(Exception):
+    """The file's text has not been extracted yet, or too many previews are being rendered."""
+
+
+class PreviewCache:
+    """Rendered previews on disk, evicting the least recently used past ``max_bytes``.
+
+    Reading an entry bumps its modification time, which is what eviction
+    orders by: access times are often not kept (``noatime``). ``root`` and
+    ``max_bytes`` default to ``PREVIEW_CACHE_DIR`` under ``MEDIA_ROOT`` and
+    ``PREVIEW_CACHE_MAX_BYTES``.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self._root = root
+        self._max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def root(self):
+        return self._root or os.path.join(settings.MEDIA_ROOT, settings.PREVIEW_CACHE_DIR)
+
+    @property
+    def max_bytes(self):
+        return settings.PREVIEW_CACHE_MAX_BYTES if self._max_bytes is None else self._max_bytes
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entry:
+                data = entry.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as entry:
+            entry.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self.entries())
+            else:
+                self._size += len(data)
+            full = self._size > self.max_bytes
+        if full:
+            self.evict()
+
+    def entries(self):
+        """Yield ``(path, size, mtime)`` for every preview in the cache."""
+        try:
+            shards = [entry.path for entry in os.scandir(self.root) if entry.is_dir()]
+        except FileNotFoundError:
+            return
+        for shard in shards:
+            with os.scandir(shard) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.tmp'):
+                        # Being written by put().
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def evict(self, max_bytes=None):
+        """Remove the least recently used previews until the cache fits again."""
+        target = (self.max_bytes if max_bytes is None else max_bytes) * EVICTION_TARGET
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._size = total
+
+
+preview_cache = PreviewCache()
+
+
+def preview_kinds(content_type):
+    """The kinds of preview available for a file, best first."""
+    kinds = []
+    if content_type == 'application/pdf' and pymupdf is not None:
+        kinds.append(THUMBNAIL)
+    if has_text(content_type):
+        kinds.append(TEXT)
+    return kinds
+
+
+@contextmanager
+def stored_path(name):
+    """Yield a path to the plain bytes of a stored file, decompressing it to a temporary file if need be."""
+    located = blob_storage.locate(name)
+    if not located.encoding:
+        yield located.path
+        return
+    with tempfile.NamedTemporaryFile() as plain, blob_storage.open(name) as file:
+        shutil.copyfileobj(file, plain, COPY_BUFFER_SIZE)
+        plain.flush()
+        yield plain.name
+
+
+def render_thumbnail(name, content_type):
+    """PNG of the first page, ``PREVIEW_THUMBNAIL_SIZE`` pixels on its longer side."""
+    pool = executors.get_processes('preview', settings.PREVIEW_WORKERS)
+    with stored_path(name) as path:
+        return pool.submit(render_first_page, path, settings.PREVIEW_THUMBNAIL_SIZE).result()
+
+
+def render_first_page(path, size):
+    """PNG of the first page of the PDF at ``path``, ``size`` pixels on its longer side."""
+    # Opened by path, pymupdf only reads the parts of the PDF it needs.
+    with pymupdf.open(path, filetype='pdf') as document:
+        page = document[0]
+        zoom = size / max(page.rect.width, page.rect.height)
+        return page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False).tobytes('png')
+
+
+def snippet(text):
+    """The first ``PREVIEW_SNIPPET_LENGTH`` characters of ``text``, whitespace collapsed, as UTF-8."""
+    data = ' '.join(text.split())[:settings.PREVIEW_SNIPPET_LENGTH].encode()
+    if not data:
+        raise PreviewUnavailable('This file has no text to preview')
+    return data
+
+
+def render_snippet(name, content_type):
+    # No more than four bytes a character; a character cut in half is dropped.
+    with blob_storage.open(name) as file:
+        return snippet(file.read(settings.PREVIEW_SNIPPET_LENGTH * 4).decode('utf-8', errors='ignore'))
+
+
+def extracted_snippet(file):
+    """:func:`snippet` of the text extracted from a document."""
+    content = FileContent.objects.filter(file=file).values_list('status', 'text').first()
+    if content is None or content[0] == FileContent.Status.FAILED:
+        raise PreviewUnavailable('No text could be extracted from this file')
+    if content[0] == FileContent.Status.PENDING:
+        raise PreviewPending('Text extraction has not finished for this file')
+    return snippet(content[1])
+
+
+RENDERERS = {THUMBNAIL: render_thumbnail, TEXT: render_snippet}
+
+
+def cache_key(file, kind):
+    """Name a preview by content and by the settings it was rendered with."""
+    # Files stored before blobs have no content hash, but their names are
+    # unique and never reused.
+    digest = file.blob_id or hashlib.sha256(file.file.name.encode()).hexdigest()
+    if kind == THUMBNAIL:
+        return f"{digest}-{kind}-{settings.PREVIEW_THUMBNAIL_SIZE}.png"
+    return f"{digest}-{kind}-{settings.PREVIEW_SNIPPET_LENGTH}.txt"
+
+
+def get_preview(file, kind):
+    """Return the preview of ``file`` as bytes, rendering it if it is not cached.
+
+    Raises :class:`PreviewUnavailable` if the file has no preview of this
+    kind, :class:`PreviewPending` if its text is still being extracted or the
+    render queue is full, and
+    ``TimeoutError`` if rendering takes longer than
+    ``PREVIEW_RENDER_TIMEOUT``; the render carries on and fills the cache.
+    """
+    if kind not in preview_kinds(file.file_type):
+        raise PreviewUnavailable(f'No {kind} preview is available for this file')
+    if kind == TEXT and file.file_type != 'text/plain':
+        return extracted_snippet(file)
+    key = cache_key(file, kind)
+    data = preview_cache.get(key)
+    if data is not None:
+        count('hits')
+        return data
+    count('misses')
+    with _renders_lock:
+        future = _renders.get(key)
+        if future is None:
+            pool = executors.get('preview', settings.PREVIEW_WORKERS, settings.PREVIEW_QUEUE_SIZE)
+            try:
+                future = pool.submit(_run, key, file.file.name, file.file_type, kind)
+            except executors.QueueFull:
+                raise PreviewPending('Too many previews are being rendered') from None
+            _renders[key] = future
+    try:
+        return future.result(timeout=settings.PREVIEW_RENDER_TIMEOUT)
+    except (TimeoutError, PreviewUnavailable):
+        raise
+    except Exception as exc:
+        raise PreviewUnavailable('Could not render a preview of this file') from exc
+
+
+def count(outcome):
+    key = STATS_KEY.format(outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted from the cache in between; the count starts again.
+        cache.add(key, 1, timeout=None)
+
+
+def cache_stats():
+    """Preview cache hits and misses since the counters were last reset."""
+    return {outcome: cache.get(STATS_KEY.format(outcome), 0) for outcome in ('hits', 'misses')}
+
+
+# Renders in progress, by cache key.
+_renders = {}
+_renders_lock = threading.Lock()
+
+
+def _run(key, name, content_type, kind):
+    try:
+        data = RENDERERS[kind](name, content_type)
+        preview_cache.put(key, data)
+        return data
+    except PreviewUnavailable:
+        raise
+    except Exception:
+        logger.exception("Rendering the %s preview of %s failed", kind, name)
+        raise
+    finally:
+        with _renders_lock:
+            _renders.pop(key, None)
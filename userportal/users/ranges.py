@@ -0,0 +1,120 @@
+"""HTTP byte ranges (RFC 9110, section 14) for file downloads."""
+import secrets
+
+from django.utils.http import parse_http_date_safe
+
+# More ranges than this in one request are ignored and the whole file is sent,
+# so a client cannot make us seek thousands of times for one response.
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):  # noqa: N818
+    pass
+
+
+def parse_range_header(header, size):
+    """Parse a ``Range`` header into inclusive ``(start, end)`` byte offsets.
+
+    Returns ``None`` when the header is absent, malformed or asks for too many
+    ranges, in which case the whole file should be sent. Raises
+    :class:`RangeNotSatisfiable` when no requested range overlaps the file.
+    """
+    if not header:
+        return None
+    unit, sep, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not sep:
+        return None
+
+    specs = [spec.strip() for spec in specs.split(',') if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not dash or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:
+            # Suffix range: the last N bytes.
+            if not last:
+                return None
+            length = int(last)
+            if length and size:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last), size - 1) if last else size - 1))
+
+    if not ranges:
+        raise RangeNotSatisfiable
+    return ranges
+
+
+def if_range_matches(request, etag, last_modified):
+    """Return whether the ``Range`` header should be honoured given ``If-Range``."""
+    validator = request.META.get('HTTP_IF_RANGE')
+    if not validator:
+        return True
+    if validator.startswith(('"', 'W/')):
+        # If-Range requires a strong comparison.
+        return etag is not None and validator == etag
+    return last_modified is not None and parse_http_date_safe(validator) == last_modified
+
+
+class RangeIterator:
+    """Stream byte ranges of an open file, optionally as ``multipart/byteranges``.
+
+    Django closes response content that has a ``close()`` method, which
+    closes the underlying file even if the client disconnects early.
+    """
+    block_size = 64 * 1024
+
+    def __init__(self, file, ranges, size, content_type=None):
+        self.file = file
+        self.ranges = ranges
+        self.size = size
+        self.content_type = content_type
+        self.boundary = secrets.token_hex(16) if len(ranges) > 1 else None
+
+    @property
+    def multipart_content_type(self):
+        return f'multipart/byteranges; boundary={self.boundary}'
+
+    def part_header(self, start, end):
+        return (
+            f'\r\n--{self.boundary}\r\n'
+            f'Content-Type: {self.content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n'
+        ).encode('ascii')
+
+    def closing_boundary(self):
+        return f'\r\n--{self.boundary}--\r\n'.encode('ascii')
+
+    def content_length(self):
+        length = sum(end - start + 1 for start, end in self.ranges)
+        if self.boundary:
+            length += sum(len(self.part_header(start, end)) for start, end in self.ranges)
+            length += len(self.closing_boundary())
+        return length
+
+    def __iter__(self):
+        for start, end in self.ranges:
+            if self.boundary:
+                yield self.part_header(start, end)
+            self.file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = self.file.read(min(self.block_size, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+        if self.boundary:
+            yield self.closing_boundary()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,128 @@
+"""Sliding-window rate limits for logging in and registering.
+
+Each attempt counts against two limits, checked before any password is
+hashed: per client IP and per email address. A limit allows ``limit``
+attempts in any ``LOGIN_RATE_LIMIT_WINDOW`` seconds. There is no limit for
+everyone together, which a burst from many addresses would use up for real
+users too; the bounded password hashing queue (see ``hashing.py``) is what
+caps the CPU such a burst can take.
+
+Windows slide using two fixed-window counters: the current window's count
+plus the previous window's, weighted by how much of the previous window still
+overlaps the last ``window`` seconds. That takes two numbers per key, however
+busy it is. With ``RATE_LIMIT_BACKEND = "redis"`` every counter for an attempt
+is read and incremented in one pipelined round trip. ``"cache"`` uses the
+default cache and suits development and tests. If Redis is unreachable,
+attempts are let through rather than locking everyone out.
+
+Rejected attempts count too, so a client that keeps trying stays limited.
+"""
+import hashlib
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import Throttled
+
+from .redis_client import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY = 'ratelimit:{}:{}:{}:{}'
+
+
+class RateLimited(Throttled):
+    default_detail = 'Too many attempts.'
+
+
+def client_ip(request):
+    """The client's address, from ``RATE_LIMIT_IP_HEADER`` behind a proxy that sets it.
+
+    Proxies append the address they received a request from, so only the
+    last ``RATE_LIMIT_PROXY_COUNT`` entries were written by our own proxies;
+    anything before them is whatever the client sent.
+    """
+    header = settings.RATE_LIMIT_IP_HEADER
+    address = request.META.get(header) if header else None
+    if not address:
+        return request.META.get('REMOTE_ADDR') or 'unknown'
+    entries = [entry.strip() for entry in address.split(',') if entry.strip()] or ['unknown']
+    return entries[-min(max(settings.RATE_LIMIT_PROXY_COUNT, 1), len(entries))]
+
+
+def limits(request, email):
+    """``(name, identifier, limit)`` for each limit an attempt counts against."""
+    checks = [('ip', client_ip(request), settings.LOGIN_RATE_LIMIT_PER_IP)]
+    if email:
+        # Hashed so addresses do not end up in Redis.
+        digest = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        checks.append(('email', digest, settings.LOGIN_RATE_LIMIT_PER_EMAIL))
+    return checks
+
+
+def count_redis(keys, window):
+    """Increment each ``(current, previous)`` pair of keys; return their counts."""
+    pipeline = get_redis().pipeline(transaction=False)
+    for current, previous in keys:
+        pipeline.incr(current)
+        pipeline.expire(current, 2 * window)
+        pipeline.get(previous)
+    results = pipeline.execute()
+    return [(results[i], int(results[i + 2] or 0)) for i in range(0, len(results), 3)]
+
+
+def count_cache(keys, window):
+    counts = []
+    previous = cache.get_many([previous for _, previous in keys])
+    for current, previous_key in keys:
+        cache.add(current, 0, 2 * window)
+        try:
+            value = cache.incr(current)
+        except ValueError:
+            # Expired in between.
+            cache.add(current, 1, 2 * window)
+            value = 1
+        counts.append((value, previous.get(previous_key, 0)))
+    return counts
+
+
+def retry_after(current, previous, limit, elapsed, window):
+    """Seconds until the sliding count drops back within ``limit``."""
+    if current <= limit and previous:
+        # Wait for enough of the previous window to slide out.
+        wait = window * (1 - (limit - current) / previous) - elapsed
+    else:
+        # Only the next window, once enough of this one has slid out, has room.
+        wait = window - elapsed + window * (1 - limit / max(current, 1))
+    return max(math.ceil(wait), 1)
+
+
+def check_rate(request, scope, email=None):
+    """Count an attempt at ``scope`` and raise :class:`RateLimited` if it is over a limit."""
+    window = settings.LOGIN_RATE_LIMIT_WINDOW
+    now = time.time()
+    index, elapsed = divmod(now, window)
+    checks = limits(request, email)
+    keys = [
+        (KEY.format(scope, name, identifier, int(index)), KEY.format(scope, name, identifier, int(index) - 1))
+        for name, identifier, _ in checks
+    ]
+    try:
+        if settings.RATE_LIMIT_BACKEND == 'redis':
+            counts = count_redis(keys, window)
+        else:
+            counts = count_cache(keys, window)
+    except RedisError as exc:
+        logger.warning("Rate limits are not enforced: %s", exc)
+        return
+
+    waits = [
+        retry_after(current, previous, limit, elapsed, window)
+        for (_, _, limit), (current, previous) in zip(checks, counts)
+        if previous * (1 - elapsed / window) + current > limit
+    ]
+    if waits:
+        raise RateLimited(wait=max(waits))
@@ -0,0 +1,119 @@
+"""A small ASGI app that receives upload bodies for signed tickets.
+
+Run it next to the Django workers and route ``UPLOAD_RECEIVER_URL`` to it,
+for example::
+
+    DJANGO_SETTINGS_MODULE=config.settings.production \\
+        uvicorn userportal.users.receiver:application --port 8001
+
+``PUT <UPLOAD_RECEIVER_URL>/<ticket>`` streams the body to a private file
+next to the session's :func:`~userportal.users.tickets.received_path` and
+renames it there once exactly the ticket's size has arrived. The body is
+hashed and its type sniffed as it is written, and both are recorded beside
+it, so completing the upload never reads it again. A client that
+goes away, or sends more or less than that, leaves nothing behind. The
+receiver only needs settings (``SECRET_KEY`` and the staging directory): it
+never touches the database, and one event loop holds any number of slow
+uploads. Writes happen in a thread so the loop is never blocked on disk.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+
+from .tickets import InvalidTicket
+from .tickets import received_path
+from .tickets import verify_ticket
+from .tickets import write_received_metadata
+from .uploadhandlers import ContentSniffer
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    if scope['method'] != 'PUT':
+        await respond(send, 405, {'error': 'Method not allowed'}, [(b'allow', b'PUT')])
+        return
+
+    try:
+        ticket = verify_ticket(scope['path'].rstrip('/').rsplit('/', 1)[-1])
+    except InvalidTicket as exc:
+        await respond(send, 403, {'error': str(exc)})
+        return
+    headers = dict(scope['headers'])
+    length = headers.get(b'content-length')
+    if length is not None and length != str(ticket.size).encode():
+        await respond(send, 400, {'error': f'Content-Length must be {ticket.size}'})
+        return
+
+    path = received_path(ticket.session_id)
+    await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    hasher, sniffer = hashlib.sha256(), ContentSniffer()
+    received = await receive_body(receive, tmp_path, ticket.size, hasher, sniffer)
+    if received is None:
+        # The client disconnected; there is nobody to answer.
+        return
+    if received != ticket.size:
+        await respond(send, 400, {'error': f'Expected {ticket.size} bytes, received {received}'})
+        return
+    metadata = {'size': received, 'sha256': hasher.hexdigest(), 'content_type': sniffer.content_type}
+    # Recorded first, so a body in place always has its metadata.
+    await asyncio.to_thread(write_received_metadata, ticket.session_id, metadata)
+    await asyncio.to_thread(os.replace, tmp_path, path)
+    await respond(send, 201, {'received': received})
+
+
+async def receive_body(receive, path, limit, hasher, sniffer):
+    """Write the request body to ``path``, stopping past ``limit`` bytes.
+
+    Every block written is also fed to ``hasher`` and ``sniffer``. Returns
+    the number of bytes received, or ``None`` if the client went away.
+    ``path`` is removed unless exactly ``limit`` bytes arrived.
+    """
+    received = 0
+    destination = await asyncio.to_thread(open, path, 'wb')
+
+    def consume(body):
+        destination.write(body)
+        hasher.update(body)
+        sniffer.feed(body)
+
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                received = None
+                break
+            body = message.get('body', b'')
+            received += len(body)
+            if received > limit:
+                break
+            if body:
+                await asyncio.to_thread(consume, body)
+            if not message.get('more_body', False):
+                break
+    finally:
+        await asyncio.to_thread(destination.close)
+        if received != limit:
+            await asyncio.to_thread(os.remove, path)
+    return received
+
+
+async def respond(send, status, data, headers=()):
+    body = json.dumps(data).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,27 @@
+"""The Redis connection (``REDIS_URL``) shared by the token blacklist and rate limits."""
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import redis
+    from redis import RedisError
+except ImportError:  # pragma: no cover
+    redis = None
+
+    class RedisError(Exception):
+        pass
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis():
+    global _client  # noqa: PLW0603
+    with _client_lock:
+        if _client is None:
+            if redis is None:
+                raise ImproperlyConfigured("The redis package is required to use REDIS_URL")
+            _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
@@ -0,0 +1,99 @@
+"""PostgreSQL full-text search over files.
+
+``File.search_vector`` holds a weighted ``tsvector`` of the file name (A),
+description (B) and extracted text (C). It is recomputed in the database by
+:func:`update_search_vectors` whenever a file is saved or its extraction
+finishes, and is covered by a GIN index on ``(user_id, search_vector)`` so a
+search only ever visits the requesting user's matching rows.
+
+Snippets are produced by ``ts_headline``, which re-parses the text, so they
+are computed only for the page of results being returned.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline
+from django.contrib.postgres.search import SearchQuery
+from django.contrib.postgres.search import SearchRank
+from django.contrib.postgres.search import SearchVector
+from django.db.models import F
+from django.db.models import Func
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models import TextField
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Concat
+from django.db.models.functions import Substr
+from django.utils.html import escape
+
+from .models import File
+from .models import FileContent
+
+# Highlight markers that cannot occur in document text. The snippet is
+# HTML-escaped before they are turned into <mark> tags.
+START_SEL = '\x02'
+STOP_SEL = '\x03'
+
+
+def _extracted_text():
+    # to_tsvector() rejects documents whose vector exceeds 1MB, so only the
+    # start of very long texts is indexed.
+    text = FileContent.objects.filter(file=OuterRef('pk')).values('text')[:1]
+    return Coalesce(Substr(Subquery(text), 1, settings.SEARCH_MAX_TEXT_LENGTH), Value(''), output_field=TextField())
+
+
+def _name_words():
+    # The parser reads "q3-report_final.pdf" as one file name token; split it
+    # into words so each of them can be searched for.
+    return Func(
+        'original_name', Value('[^[:alnum:]]+'), Value(' '), Value('g'),
+        function='regexp_replace', output_field=TextField(),
+    )
+
+
+def search_vector():
+    config = settings.SEARCH_CONFIG
+    return (
+        SearchVector(_name_words(), weight='A', config=config)
+        + SearchVector(Coalesce('description', Value(''), output_field=TextField()), weight='B', config=config)
+        + SearchVector(_extracted_text(), weight='C', config=config)
+    )
+
+
+def update_search_vectors(file_ids):
+    """Recompute ``search_vector`` for the given files in a single UPDATE."""
+    File.objects.filter(pk__in=file_ids).update(search_vector=search_vector())
+
+
+def search_files(queryset, terms, limit):
+    """Return up to ``limit`` files matching ``terms``, best first, with ``rank`` and ``snippet``.
+
+    ``terms`` uses web search syntax: quoted phrases, ``or`` and ``-word``.
+    """
+    query = SearchQuery(terms, search_type='websearch', config=settings.SEARCH_CONFIG)
+    files = list(
+        queryset.filter(search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .order_by('-rank', '-upload_date', '-id')[:limit]
+    )
+
+    snippets = dict(
+        File.objects.filter(pk__in=[file.pk for file in files])
+        .annotate(snippet=SearchHeadline(
+            Concat(Coalesce('description', Value(''), output_field=TextField()), Value('\n'), _extracted_text(), output_field=TextField()),
+            query,
+            config=settings.SEARCH_CONFIG,
+            start_sel=START_SEL,
+            stop_sel=STOP_SEL,
+            max_fragments=2,
+            max_words=30,
+            min_words=10,
+        ))
+        .values_list('pk', 'snippet')
+    )
+    for file in files:
+        file.snippet = highlight(snippets.get(file.pk, ''))
+    return files
+
+
+def highlight(snippet):
+    return escape(snippet.strip()).replace(START_SEL, '<mark>').replace(STOP_SEL, '</mark>')
@@ -1,6 +1,10 @@
+import os
+
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
-from .models import User, Address, PhoneNumber, File
+from .models import User, Address, PhoneNumber, File, FileContent, FileVersion, StorageUsage, UploadSession
+from .uploads import QuotaExceeded, check_upload, detected_content_type, missing_ranges, received_ranges
 
 class UserSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(
@@ -41,6 +45,25 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
+class StorageUsageSerializer(serializers.ModelSerializer):
+    limit = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = StorageUsage
+        fields = ['bytes_used', 'file_count', 'by_type', 'limit']
+        read_only_fields = fields
+
+class ProfileSerializer(UserSerializer):
+    storage = serializers.SerializerMethodField()
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ('storage',)
+
+    def get_storage(self, obj):
+        # Users who never uploaded anything have no usage row yet.
+        usage = getattr(obj, 'storage_usage', None) or StorageUsage(user=obj)
+        return StorageUsageSerializer(usage).data
+
 class AddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = Address
@@ -51,28 +74,24 @@ class PhoneNumberSerializer(serializers.ModelSerializer):
         model = PhoneNumber
         fields = ['id', 'number']
 
+class FileContentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FileContent
+        fields = ['status', 'page_count', 'sheet_count', 'word_count', 'error']
+        read_only_fields = fields
+
 class FileSerializer(serializers.ModelSerializer):
+    content = FileContentSerializer(read_only=True)
+
     class Meta:
         model = File
-        fields = ['id', 'file', 'file_type', 'file_size', 'upload_date', 'description', 'user']
-        read_only_fields = ['user', 'upload_date', 'file_type', 'file_size']
+        fields = ['id', 'file', 'original_name', 'file_type', 'file_size', 'upload_date', 'description', 'user', 'content']
+        read_only_fields = ['user', 'original_name', 'upload_date', 'file_type', 'file_size']
 
     def validate_file(self, value):
-        # Validate file type
-        allowed_types = [
-            'application/pdf',
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',  # Excel
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',  # Word
-            'application/msword',  # Old Word .doc
-            'text/plain'
-        ]
-        if value.content_type not in allowed_types:
-            raise serializers.ValidationError("Only PDF, Excel, Word, and TXT files are allowed")
-        
-        # Validate file size (5MB limit)
-        if value.size > 5242880:  # 5MB in bytes
-            raise serializers.ValidationError("File size must be less than 5MB")
-        
+        # Trust the type sniffed from the bytes by the upload handler over
+        # the Content-Type the client sent.
+        check_upload(detected_content_type(value), value.size, settings.FILE_UPLOAD_MAX_SIZE)
         return value
 
     def create(self, validated_data):
@@ -81,8 +100,99 @@ class FileSerializer(serializers.ModelSerializer):
         if not uploaded_file:
             raise serializers.ValidationError({"file": "No file was uploaded"})
             
-        # Set file size
+        # Set file size and type as measured while receiving the upload
         validated_data['file_size'] = uploaded_file.size
+        validated_data['file_type'] = detected_content_type(uploaded_file)
         
         # Create the file instance
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+class FileVersionSerializer(serializers.ModelSerializer):
+    current = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FileVersion
+        fields = ['number', 'original_name', 'file_type', 'size', 'sha256', 'created', 'current']
+
+    def get_current(self, obj):
+        return obj.pk == obj.file.current_version_id
+
+
+class NewVersionSerializer(serializers.Serializer):
+    file = serializers.FileField()
+
+    def validate_file(self, value):
+        check_upload(detected_content_type(value), value.size, settings.FILE_UPLOAD_MAX_SIZE)
+        return value
+
+
+class FileSearchResultSerializer(FileSerializer):
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta(FileSerializer.Meta):
+        fields = FileSerializer.Meta.fields + ['rank', 'snippet']
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    received = serializers.SerializerMethodField()
+    missing = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'total_size', 'description', 'created', 'received', 'missing']
+        read_only_fields = ['id', 'created']
+
+    def validate_filename(self, value):
+        filename = os.path.basename(value.replace('\\', '/'))
+        if not filename:
+            raise serializers.ValidationError("Please enter a valid file name")
+        return filename
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("File is empty")
+        return value
+
+    def validate(self, attrs):
+        check_upload(attrs['content_type'], attrs['total_size'], settings.RESUMABLE_UPLOAD_MAX_SIZE)
+        # Fail early rather than after the whole file has been sent; the
+        # quota is enforced for real when the upload completes.
+        user = self.context['request'].user
+        usage = StorageUsage.objects.filter(user=user).first() or StorageUsage(user=user)
+        if not usage.has_room(attrs['total_size']):
+            raise QuotaExceeded
+        return attrs
+
+    def get_received(self, obj):
+        return received_ranges((chunk.offset, chunk.size) for chunk in obj.chunks.all())
+
+    def get_missing(self, obj):
+        return missing_ranges(self.get_received(obj), obj.total_size)
+
+
+class SignedUrlSerializer(serializers.Serializer):
+    expires_in = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_expires_in(self, value):
+        if value > settings.DOWNLOAD_URL_MAX_EXPIRES:
+            raise serializers.ValidationError(
+                f"Links can be valid for at most {settings.DOWNLOAD_URL_MAX_EXPIRES} seconds"
+            )
+        return value
+
+
+class FileArchiveSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+    )
+    file_type = serializers.CharField(required=False)
+
+    def validate_ids(self, value):
+        ids = list(dict.fromkeys(value))
+        if len(ids) > settings.FILE_ARCHIVE_MAX_FILES:
+            raise serializers.ValidationError(
+                f"At most {settings.FILE_ARCHIVE_MAX_FILES} files can be downloaded at once"
+            )
+        return ids
@@ -0,0 +1,118 @@
+import os
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+from .extraction import schedule_extraction
+from .models import Blob
+from .models import File
+from .models import FileVersion
+from .models import StorageUsage
+from .models import User
+from .search import update_search_vectors
+from .storage import blob_digest
+from .storage import content_digest
+from .uploads import charge_storage
+
+
+@receiver(pre_save, sender=File)
+def charge_new_file(sender, instance, raw=False, **kwargs):
+    """Count a new file against its owner's quota before its content is written."""
+    if raw or not instance._state.adding:
+        return
+    charge_storage(instance.user_id, instance.file_type, instance.file_size)
+
+
+@receiver(pre_save, sender=File)
+def attach_blob(sender, instance, raw=False, **kwargs):
+    """Point ``File.blob`` at the blob holding the file's content."""
+    if raw or not instance.file:
+        return
+
+    previous = instance.blob_id
+    if not instance.file._committed:
+        if not instance.original_name:
+            instance.original_name = os.path.basename(instance.file.name)
+        digest = content_digest(instance.file.file)
+        if digest != previous:
+            # Take the reference before writing, so the bytes cannot be
+            # deleted by a concurrent release between the write and the insert.
+            Blob.objects.acquire(digest, instance.file.size)
+        instance.file.save(instance.file.name, instance.file.file, save=False)
+    else:
+        digest = blob_digest(instance.file.name)
+        if digest is not None and digest != previous:
+            Blob.objects.acquire(digest, instance.file.size)
+
+    if digest != previous:
+        instance.blob_id = digest
+        instance._released_blob = previous
+        instance._content_changed = True
+
+
+@receiver(post_save, sender=File)
+def release_replaced_blob(sender, instance, **kwargs):
+    previous = getattr(instance, '_released_blob', None)
+    if previous:
+        instance._released_blob = None
+        Blob.objects.release(previous)
+
+
+@receiver(post_save, sender=File)
+def queue_extraction(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created or getattr(instance, '_content_changed', False):
+        instance._content_changed = False
+        schedule_extraction([instance])
+    update_search_vectors([instance.pk])
+
+
+@receiver(post_delete, sender=File)
+def release_deleted_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        Blob.objects.release(instance.blob_id)
+
+
+@receiver(pre_delete, sender=File)
+def measure_replaced_versions(sender, instance, **kwargs):
+    # The versions are deleted along with the file, before it.
+    replaced = instance.versions.exclude(pk=instance.current_version_id)
+    instance._version_bytes = replaced.aggregate(total=Sum('size'))['total'] or 0
+
+
+@receiver(post_delete, sender=File)
+def refund_deleted_file(sender, instance, **kwargs):
+    StorageUsage.objects.refund(
+        instance.user_id, instance.file_type, instance.file_size, versions=getattr(instance, '_version_bytes', 0),
+    )
+
+
+@receiver(post_delete, sender=FileVersion)
+def release_version_content(sender, instance, **kwargs):
+    if instance.blob_id:
+        Blob.objects.release(instance.blob_id)
+    for digest, count in Counter(digest for digest, _ in instance.chunks or []).items():
+        Blob.objects.release(digest, count)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, raw=False, **kwargs):
+    """Drop cached copies of a changed user, and again once the change is committed.
+
+    Until then other requests still read the old row, and may cache it under
+    the new version.
+    """
+    if raw:
+        return
+    user_id = instance.pk
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
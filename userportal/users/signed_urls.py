@@ -0,0 +1,68 @@
+"""Short-lived signed download URLs.
+
+``POST /api/files/<id>/signed-url/`` returns a URL that downloads the file
+without any credentials until it expires, for shared links and embedded
+viewers. Everything needed to serve the file -- its storage name, download
+name, type and validators -- travels in the URL's token, signed with
+``SECRET_KEY``, so :func:`~userportal.users.views.signed_download_view`
+checks the signature and expiry and hands the name to the delivery backend
+without authenticating anyone or reading the database.
+
+A link stays valid until it expires even if the file is deleted, as long as
+the blob is still stored; keep ``DOWNLOAD_URL_EXPIRES`` short.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils import timezone
+
+from .delivery import download_details
+
+SALT = 'userportal.users.signed_urls'
+
+
+class InvalidDownloadToken(Exception):
+    pass
+
+
+def sign_download(file, expires_in=None):
+    """Return ``(path, expires)`` of a signed download URL for a ``File`` row."""
+    if expires_in is None:
+        expires_in = settings.DOWNLOAD_URL_EXPIRES
+    expires = timezone.now() + timedelta(seconds=min(expires_in, settings.DOWNLOAD_URL_MAX_EXPIRES))
+    details = download_details(file)
+    payload = {
+        'id': file.pk,
+        'exp': int(expires.timestamp()),
+        'n': details['name'],
+        'f': details['filename'],
+        't': details['content_type'],
+        'e': details['etag'],
+        'm': details['last_modified'],
+    }
+    token = signing.dumps(payload, salt=SALT, compress=True)
+    return reverse('users:signed-download', kwargs={'token': token}), expires
+
+
+def verify_download(token):
+    """Return the :func:`~userportal.users.delivery.serve_stored` arguments a token grants.
+
+    Raises :class:`InvalidDownloadToken` if the token was tampered with or
+    has expired.
+    """
+    try:
+        payload = signing.loads(token, salt=SALT)
+    except signing.BadSignature as exc:
+        raise InvalidDownloadToken('Invalid download link') from exc
+    if payload['exp'] < time.time():
+        raise InvalidDownloadToken('Download link has expired')
+    return {
+        'name': payload['n'],
+        'filename': payload['f'],
+        'content_type': payload['t'],
+        'etag': payload['e'],
+        'last_modified': payload['m'],
+    }
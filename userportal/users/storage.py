@@ -0,0 +1,286 @@
+"""Content-addressed storage for uploaded files.
+
+Every upload is stored once under ``BLOB_STORAGE_DIR``, named by the SHA-256
+of its bytes, so identical documents uploaded by many users share one file on
+disk. ``File`` rows reference their blob through :class:`~userportal.users.models.Blob`,
+which counts the references and deletes the bytes when the last one goes away.
+
+Blobs are fanned out over ``BLOB_STORAGE_FANOUT`` levels of two-hex-digit
+directories (``blobs/ab/cd/abcd...``) so no directory grows huge, and since
+names are hashes they never collide. Blobs stored flat (``blobs/abcd...``)
+before the layout existed are still found under either name until
+``manage.py shard_blobs`` moves them.
+
+Files saved before the blob store existed keep their ``uploads/`` names and
+are served as before; ``manage.py dedupe_files`` moves them into the store.
+
+Storage is tiered. New content is written to the hot root (``MEDIA_ROOT``);
+``manage.py tier_blobs`` moves blobs nobody has read for a while to
+``COLD_STORAGE_ROOT``, optionally compressed, and brings them back once they
+are read again. Compressible documents may also be stored compressed from the
+start (see :mod:`~userportal.users.compression`), except those that arrive
+as files on disk, which are moved into place untouched. A blob keeps its name on
+either tier and in either form, and :meth:`BlobStorage.locate` finds where the
+bytes currently are, so ``File.file`` reads work unchanged.
+"""
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils._os import safe_join
+
+from .compression import SAMPLE_SIZE
+from .compression import SUFFIXES
+from .compression import DecompressedFile
+from .compression import decoded_size
+from .compression import open_writer
+from .compression import worth_compressing
+
+HASH_BUFFER_SIZE = 64 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+HOT = 'hot'
+COLD = 'cold'
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def content_digest(content):
+    """Return the hex SHA-256 of a Django ``File``, caching it on the object."""
+    digest = getattr(content, 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in content.chunks(HASH_BUFFER_SIZE):
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+        content.sha256 = digest
+    return digest
+
+
+def blob_name(digest):
+    shards = [digest[level * 2:level * 2 + 2] for level in range(settings.BLOB_STORAGE_FANOUT)]
+    return '/'.join([settings.BLOB_STORAGE_DIR, *shards, digest])
+
+
+def flat_blob_name(digest):
+    """The name blobs had before they were sharded."""
+    return f"{settings.BLOB_STORAGE_DIR}/{digest}"
+
+
+def blob_digest(name):
+    """Return the digest a storage name refers to, or ``None`` for non-blob names."""
+    if not name or not name.startswith(f"{settings.BLOB_STORAGE_DIR}/"):
+        return None
+    digest = os.path.basename(name)
+    return digest if _DIGEST_RE.match(digest) else None
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    """Where the bytes of a stored name currently are."""
+    path: str
+    tier: str
+    encoding: str | None = None
+
+
+class Throttle:
+    """Sleep so that work done stays under ``rate`` units (bytes, files) per second on average."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.total = 0
+
+    def wait(self, size):
+        if not self.rate:
+            return
+        self.total += size
+        delay = self.started + self.total / self.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class BlobStorage(FileSystemStorage):
+    """``FileSystemStorage`` that ignores the requested name and stores content by hash.
+
+    Saving content that is already stored is a no-op that returns the
+    existing name, which is also why names never need de-duplicating.
+    """
+
+    @property
+    def cold_location(self):
+        return settings.COLD_STORAGE_ROOT
+
+    def tier_path(self, name, tier):
+        return super().path(name) if tier == HOT else safe_join(self.cold_location, name)
+
+    def layouts(self, name):
+        """Names the bytes of ``name`` may be under, the current layout first."""
+        digest = blob_digest(name)
+        if digest is None:
+            return [name]
+        names = [blob_name(digest), flat_blob_name(digest)]
+        return names[:1] if names[0] == names[1] else names
+
+    def variants(self, name):
+        """Where ``name`` itself may be stored: on either tier, as is or compressed."""
+        tiers = (HOT, COLD) if self.cold_location else (HOT,)
+        for tier in tiers:
+            path = self.tier_path(name, tier)
+            yield StoredObject(path, tier)
+            for encoding, suffix in SUFFIXES.items():
+                yield StoredObject(path + suffix, tier, encoding)
+
+    def candidates(self, name):
+        for layout_name in self.layouts(name):
+            yield from self.variants(layout_name)
+
+    def locate(self, name):
+        """Return the :class:`StoredObject` holding ``name``, or raise ``FileNotFoundError``."""
+        for stored in self.candidates(name):
+            if os.path.exists(stored.path):
+                return stored
+        raise FileNotFoundError(name)
+
+    def path(self, name):
+        try:
+            stored = self.locate(name)
+        except FileNotFoundError:
+            # Not stored yet: new content is always written to the hot tier.
+            return super().path(self.layouts(name)[0])
+        if stored.encoding:
+            raise ValueError(f"{name} is stored compressed and has no plain path; open() it instead.")
+        return stored.path
+
+    def exists(self, name):
+        return any(os.path.lexists(stored.path) for stored in self.candidates(name))
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        for stored in self.candidates(name):
+            try:
+                os.remove(stored.path)
+            except FileNotFoundError:
+                pass
+
+    def size(self, name):
+        stored = self.locate(name)
+        return decoded_size(stored.path, stored.encoding) if stored.encoding else os.path.getsize(stored.path)
+
+    def _open(self, name, mode='rb'):
+        stored = self.locate(name)
+        if not stored.encoding:
+            return File(open(stored.path, mode))  # noqa: PTH123, SIM115
+        return DecompressedFile(stored.path, stored.encoding, name)
+
+    def move_to_tier(self, name, tier, compress=False):
+        """Move ``name`` to ``tier``, compressing it on the way to cold if ``compress``.
+
+        Blobs already stored compressed stay compressed on either tier. The
+        new copy is complete and renamed into place before the old one is
+        removed, so readers always find one of them; files already open keep
+        reading the old copy.
+        """
+        source = self.locate(name)
+        encoding = source.encoding
+        if encoding is None and tier == COLD and compress:
+            encoding = settings.BLOB_COMPRESSION or 'gzip'
+        path = self.tier_path(self.layouts(name)[0], tier)
+        target = StoredObject(path + SUFFIXES[encoding] if encoding else path, tier, encoding)
+        if source == target:
+            return target
+
+        os.makedirs(os.path.dirname(target.path), exist_ok=True)
+        tmp_path = f"{target.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if source.encoding == target.encoding:
+                shutil.copyfile(source.path, tmp_path)
+            else:
+                with open(source.path, 'rb') as src, open_writer(tmp_path, encoding, os.path.getsize(source.path)) as dst:  # noqa: PTH123
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, target.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        for stored in self.candidates(name):
+            if stored != target and os.path.exists(stored.path):
+                os.remove(stored.path)
+        return target
+
+    def encoding_for(self, content):
+        """Return the encoding to store ``content`` in, judged from its type and first bytes."""
+        encoding = settings.BLOB_COMPRESSION
+        content_type = getattr(content, 'sniffed_type', None) or getattr(content, 'content_type', None)
+        if not encoding or content_type not in settings.BLOB_COMPRESSIBLE_TYPES:
+            return None
+        content.seek(0)
+        sample = content.read(SAMPLE_SIZE)
+        content.seek(0)
+        return encoding if worth_compressing(sample, encoding) else None
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(blob_name(content_digest(content)), content, max_length)
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        full_path = super().path(name)
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            # Files already on disk are moved rather than read, however
+            # large, so they are not compressed here; tier_blobs does that if
+            # they go cold. Identical content may have been stored
+            # concurrently; replacing it with the same bytes is harmless.
+            file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+        elif encoding := self.encoding_for(content):
+            full_path += SUFFIXES[encoding]
+            self._write(full_path, content, encoding)
+        else:
+            self._write(full_path, content)
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    def _write(self, full_path, content, encoding=None):
+        # Write under a private name and rename, so readers never see a
+        # partially written blob, and a failed write leaves nothing behind.
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if encoding:
+                destination = open_writer(tmp_path, encoding, content.size)
+            else:
+                destination = open(tmp_path, 'wb')  # noqa: PTH123, SIM115
+            with destination:
+                for chunk in content.chunks():
+                    destination.write(chunk)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+blob_storage = BlobStorage()
+
+
+def get_blob_storage():
+    return blob_storage
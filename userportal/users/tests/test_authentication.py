@@ -0,0 +1,57 @@
+import pytest
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from userportal.users.authentication import CachedJWTAuthentication
+from userportal.users.authentication import local_users
+from userportal.users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _empty_local_cache():
+    local_users.clear()
+
+
+def authenticate(user: User):
+    request = APIRequestFactory().get("/api/me/", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    return CachedJWTAuthentication().authenticate(request)[0]
+
+
+def test_repeated_requests_do_not_query_users(user: User, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert authenticate(user) == user
+    with django_assert_num_queries(0):
+        assert authenticate(user) == user
+
+    # Another process has no local copy, but finds the user in the shared cache.
+    local_users.clear()
+    with django_assert_num_queries(0):
+        assert authenticate(user) == user
+
+
+def test_saving_a_user_invalidates_cached_copies(user: User, django_assert_num_queries):
+    authenticate(user)
+    user.name = "Renamed"
+    user.save()
+
+    with django_assert_num_queries(1):
+        assert authenticate(user).name == "Renamed"
+
+
+def test_deactivated_user_is_rejected(user: User):
+    authenticate(user)
+    user.is_active = False
+    user.save()
+
+    with pytest.raises(AuthenticationFailed):
+        authenticate(user)
+
+
+def test_changes_to_request_user_do_not_leak_into_the_cache(user: User):
+    authenticate(user).name = "Unsaved"
+
+    assert authenticate(user).name == user.name
+
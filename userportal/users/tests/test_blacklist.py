@@ -0,0 +1,49 @@
+from http import HTTPStatus
+
+import pytest
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from userportal.users.models import User
+from userportal.users.tokens import issue_tokens
+
+pytestmark = pytest.mark.django_db
+
+
+def log_out(tokens) -> int:
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+    return client.post("/api/logout/", {"refresh_token": tokens["refresh"]}, format="json").status_code
+
+
+def refresh(tokens) -> int:
+    return APIClient().post("/api/token/refresh/", {"refresh": tokens["refresh"]}, format="json").status_code
+
+
+def test_database_blacklist(user: User):
+    tokens = issue_tokens(user)
+    assert refresh(tokens) == HTTPStatus.OK
+
+    assert log_out(tokens) == HTTPStatus.OK
+
+    assert refresh(tokens) == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.fixture
+def redis_backend(settings):
+    redis = pytest.importorskip("redis")
+    try:
+        redis.Redis.from_url(settings.REDIS_URL).ping()
+    except redis.ConnectionError:
+        pytest.skip("Redis is not running")
+    settings.TOKEN_BLACKLIST_BACKEND = "redis"
+
+
+def test_redis_blacklist(redis_backend, user: User):
+    tokens = issue_tokens(user)
+    assert refresh(tokens) == HTTPStatus.OK
+
+    assert log_out(tokens) == HTTPStatus.OK
+
+    assert refresh(tokens) == HTTPStatus.UNAUTHORIZED
+    assert not OutstandingToken.objects.exists()
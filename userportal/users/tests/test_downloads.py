@@ -0,0 +1,241 @@
+import io
+import zipfile
+from http import HTTPStatus
+
+import pytest
+from django.core.files.base import ContentFile
+from django.utils.http import http_date
+from django.test import Client
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from userportal.users.models import File
+from userportal.users.models import UploadSession
+from userportal.users.models import User
+from userportal.users.ranges import RangeNotSatisfiable
+from userportal.users.ranges import parse_range_header
+from userportal.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def client(user: User) -> APIClient:
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def stored_file(user: User) -> File:
+    file = File(user=user, file_type="application/pdf", file_size=16)
+    file.file = ContentFile(b"%PDF-1.4 content", name="résumé.pdf")
+    file.save()
+    return file
+
+
+class TestDownloadDelivery:
+    def url(self, file: File) -> str:
+        return f"/api/files/{file.pk}/download/"
+
+    def test_python_delivery(self, client, stored_file):
+        response = client.get(self.url(stored_file))
+
+        assert response.status_code == HTTPStatus.OK
+        assert b"".join(response.streaming_content) == b"%PDF-1.4 content"
+        assert response["Content-Type"] == "application/pdf"
+        assert "filename*=utf-8''r%C3%A9sum%C3%A9.pdf" in response["Content-Disposition"]
+
+    def test_nginx_accel_redirect(self, client, stored_file, settings):
+        settings.DOWNLOAD_DELIVERY_BACKEND = "userportal.users.delivery.NginxAccelDelivery"
+        response = client.get(self.url(stored_file))
+
+        assert response.status_code == HTTPStatus.OK
+        assert response["X-Accel-Redirect"] == f"/protected/{stored_file.file.name}"
+        assert response.content == b""
+
+    def test_x_sendfile(self, client, stored_file, settings):
+        settings.DOWNLOAD_DELIVERY_BACKEND = "userportal.users.delivery.XSendfileDelivery"
+        response = client.get(self.url(stored_file))
+
+        assert response["X-Sendfile"] == stored_file.file.path
+
+    def test_other_users_files_are_not_found(self, stored_file):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(email="other@example.com"))
+        response = client.get(self.url(stored_file))
+
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+@pytest.mark.parametrize(
+    ("header", "expected"),
+    [
+        (None, None),
+        ("bytes=0-3", [(0, 3)]),
+        ("bytes=4-", [(4, 15)]),
+        ("bytes=-4", [(12, 15)]),
+        ("bytes=0-0, 10-100", [(0, 0), (10, 15)]),
+        ("bytes=5-2", None),
+        ("items=0-3", None),
+        ("bytes=abc", None),
+    ],
+)
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 16) == expected
+
+
+def test_parse_range_header_unsatisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header("bytes=16-20", 16)
+
+
+class TestConditionalDownloads:
+    def url(self, file: File) -> str:
+        return f"/api/files/{file.pk}/download/"
+
+    def test_validators(self, client, stored_file):
+        response = client.get(self.url(stored_file))
+
+        assert response["ETag"] == f'"{stored_file.blob_id}"'
+        assert response["Last-Modified"] == http_date(stored_file.upload_date.timestamp())
+        assert response["Accept-Ranges"] == "bytes"
+
+    def test_if_none_match(self, client, stored_file):
+        response = client.get(self.url(stored_file), HTTP_IF_NONE_MATCH=f'"{stored_file.blob_id}"')
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+    def test_if_modified_since(self, client, stored_file):
+        since = http_date(stored_file.upload_date.timestamp())
+        response = client.get(self.url(stored_file), HTTP_IF_MODIFIED_SINCE=since)
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+    def test_single_range(self, client, stored_file):
+        response = client.get(self.url(stored_file), HTTP_RANGE="bytes=5-7")
+
+        assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+        assert response["Content-Range"] == "bytes 5-7/16"
+        assert response["Content-Length"] == "3"
+        assert b"".join(response.streaming_content) == b"1.4"
+
+    def test_multiple_ranges(self, client, stored_file):
+        response = client.get(self.url(stored_file), HTTP_RANGE="bytes=0-3,-7")
+        body = b"".join(response.streaming_content)
+
+        assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+        assert response["Content-Type"].startswith("multipart/byteranges; boundary=")
+        assert int(response["Content-Length"]) == len(body)
+        assert b"Content-Range: bytes 0-3/16\r\n\r\n%PDF" in body
+        assert b"Content-Range: bytes 9-15/16\r\n\r\ncontent" in body
+
+    def test_unsatisfiable_range(self, client, stored_file):
+        response = client.get(self.url(stored_file), HTTP_RANGE="bytes=100-")
+
+        assert response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response["Content-Range"] == "bytes */16"
+
+    def test_stale_if_range_sends_whole_file(self, client, stored_file):
+        response = client.get(self.url(stored_file), HTTP_RANGE="bytes=0-3", HTTP_IF_RANGE='"stale"')
+        assert response.status_code == HTTPStatus.OK
+
+
+class TestSignedUrls:
+    def sign(self, client, file: File, **data) -> str:
+        response = client.post(f"/api/files/{file.pk}/signed-url/", data, format="json")
+        assert response.status_code == HTTPStatus.OK
+        return response.data["url"]
+
+    def test_download_without_credentials_or_queries(self, client, stored_file, django_assert_num_queries):
+        url = self.sign(client, stored_file)
+
+        with django_assert_num_queries(0):
+            response = APIClient().get(url)
+
+        assert response.status_code == HTTPStatus.OK
+        assert b"".join(response.streaming_content) == b"%PDF-1.4 content"
+        assert response["ETag"] == f'"{stored_file.blob_id}"'
+        assert "r%C3%A9sum%C3%A9.pdf" in response["Content-Disposition"]
+
+    def test_tampered_token_is_rejected(self, client, stored_file):
+        url = self.sign(client, stored_file)
+        token = url.rstrip("/").rsplit("/", 1)[1]
+        tampered = url.replace(token, token[:-2] + ("AA" if token[-2:] != "AA" else "BB"))
+
+        assert APIClient().get(tampered).status_code == HTTPStatus.FORBIDDEN
+
+    def test_expired_link_is_rejected(self, client, stored_file, monkeypatch):
+        url = self.sign(client, stored_file, expires_in=60)
+        monkeypatch.setattr("time.time", lambda: 2**40)
+
+        response = APIClient().get(url)
+        assert response.status_code == HTTPStatus.FORBIDDEN
+        assert response.json() == {"error": "Download link has expired"}
+
+    def test_lifetime_is_capped(self, client, stored_file, settings):
+        settings.DOWNLOAD_URL_MAX_EXPIRES = 600
+        response = client.post(f"/api/files/{stored_file.pk}/signed-url/", {"expires_in": 601}, format="json")
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_only_owner_can_sign(self, stored_file):
+        client = APIClient()
+        client.force_authenticate(UserFactory())
+        response = client.post(f"/api/files/{stored_file.pk}/signed-url/")
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+class TestAsyncViews:
+    def client_for(self, user: User) -> Client:
+        return Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def test_download(self, user: User, stored_file):
+        response = self.client_for(user).get(f"/api/async/files/{stored_file.pk}/download/", HTTP_RANGE="bytes=5-7")
+
+        assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+        assert response.is_async
+        assert b"".join(response) == b"1.4"
+
+    def test_download_requires_owner_and_token(self, stored_file):
+        url = f"/api/async/files/{stored_file.pk}/download/"
+        assert Client().get(url).status_code == HTTPStatus.UNAUTHORIZED
+        assert self.client_for(UserFactory()).get(url).status_code == HTTPStatus.NOT_FOUND
+
+    def test_upload_chunk(self, user: User):
+        session = UploadSession.objects.create(user=user, filename="a.txt", content_type="text/plain", total_size=10)
+        url = f"/api/async/uploads/{session.pk}/chunks/4/"
+
+        response = self.client_for(user).put(url, b"456789", content_type="application/octet-stream")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()["missing"] == [[0, 4]]
+        response = self.client_for(user).put(url, b"4567890", content_type="application/octet-stream")
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+class TestArchive:
+    def test_streams_requested_files(self, client, user: User, stored_file):
+        other = File(user=user, file_type="text/plain", file_size=5)
+        other.file = ContentFile(b"notes", name="résumé.pdf")
+        other.save()
+
+        response = client.post("/api/files/archive/", {"ids": [stored_file.pk, other.pk]}, format="json")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response["Content-Type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            assert archive.namelist() == ["résumé.pdf", "résumé (1).pdf"]
+            assert archive.read("résumé.pdf") == b"%PDF-1.4 content"
+            assert archive.read("résumé (1).pdf") == b"notes"
+
+    def test_filter_by_type(self, client, stored_file):
+        response = client.get("/api/files/archive/", {"file_type": "text/plain"})
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            assert archive.namelist() == []
+
+    def test_other_users_files_are_rejected(self, stored_file):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(email="other@example.com"))
+        response = client.get("/api/files/archive/", {"ids": str(stored_file.pk)})
+
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert response.json()["missing"] == [stored_file.pk]
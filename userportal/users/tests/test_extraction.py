@@ -0,0 +1,165 @@
+import io
+import zipfile
+from http import HTTPStatus
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from userportal.users.extraction import DOCX
+from userportal.users.extraction import XLSX
+from userportal.users.extraction import extract
+from userportal.users.extraction import process_file
+from userportal.users.models import File
+from userportal.users.models import FileContent
+from userportal.users.models import User
+
+pytestmark = pytest.mark.django_db
+
+WORD = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+SHEET = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_extract_docx(tmp_path):
+    path = tmp_path / "a.docx"
+    path.write_bytes(make_zip({
+        "word/document.xml": (
+            f"<w:document {WORD}><w:body>"
+            "<w:p><w:r><w:t>Quarterly</w:t></w:r><w:r><w:t> report</w:t></w:r></w:p>"
+            "<w:p><w:r><w:t>Second paragraph</w:t></w:r></w:p>"
+            "</w:body></w:document>"
+        ),
+        "docProps/app.xml": (
+            '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+            "<Pages>3</Pages></Properties>"
+        ),
+    }))
+
+    with path.open("rb") as file:
+        result = extract(file, DOCX)
+
+    assert result["text"] == "Quarterly report\nSecond paragraph\n"
+    assert result["page_count"] == 3
+    assert result["word_count"] == 4
+
+
+def test_extract_xlsx(tmp_path):
+    path = tmp_path / "a.xlsx"
+    path.write_bytes(make_zip({
+        "xl/workbook.xml": f'<workbook {SHEET}><sheets><sheet name="A"/><sheet name="B"/></sheets></workbook>',
+        "xl/sharedStrings.xml": f"<sst {SHEET}><si><t>Revenue</t></si><si><t>Costs</t></si></sst>",
+    }))
+
+    with path.open("rb") as file:
+        result = extract(file, XLSX)
+
+    assert result["sheet_count"] == 2
+    assert result["word_count"] == 2
+
+
+def test_extract_docx_stops_at_the_text_limit(tmp_path, settings):
+    settings.EXTRACTION_MAX_TEXT_LENGTH = 10
+    path = tmp_path / "a.docx"
+    paragraph = "<w:p><w:r><w:t>word</w:t></w:r></w:p>"
+    path.write_bytes(make_zip({
+        "word/document.xml": f"<w:document {WORD}><w:body>{paragraph * 1000}</w:body></w:document>",
+    }))
+
+    with path.open("rb") as file:
+        assert extract(file, DOCX)["text"] == "word\nword\n"
+
+
+def test_extract_refuses_large_members(tmp_path, settings):
+    settings.EXTRACTION_MAX_MEMBER_SIZE = 1000
+    path = tmp_path / "a.docx"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("word/document.xml", f"<w:document {WORD}>{' ' * 100_000}</w:document>")
+    path.write_bytes(buffer.getvalue())
+
+    with path.open("rb") as file, pytest.raises(ValueError, match="too large"):
+        extract(file, DOCX)
+
+
+def test_extract_pdf_page_count(tmp_path, monkeypatch):
+    monkeypatch.setattr("userportal.users.extraction.pypdf", None)
+    monkeypatch.setattr("userportal.users.extraction.READ_BLOCK_SIZE", 100)
+    path = tmp_path / "a.pdf"
+    path.write_bytes(
+        b"%PDF-1.4\n1 0 obj << /Type /Pages /Count 3 >> endobj\n"
+        + b"".join(b"%d 0 obj << /Type /Page >> endobj\n%s" % (n, b" " * 50) for n in range(2, 5)),
+    )
+
+    with path.open("rb") as file:
+        assert extract(file, "application/pdf")["page_count"] == 3
+
+
+class TestExtractionPipeline:
+    def test_upload_is_queued_and_processed(self, user: User):
+        client = APIClient()
+        client.force_authenticate(user)
+        upload = SimpleUploadedFile("notes.txt", b"one two three", content_type="text/plain")
+
+        response = client.post("/api/files/", {"file": upload})
+
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json()["content"]["status"] == "pending"
+        file_id = response.json()["id"]
+        assert client.get(f"/api/files/{file_id}/text/").status_code == HTTPStatus.CONFLICT
+
+        process_file(file_id)
+
+        response = client.get(f"/api/files/{file_id}/text/")
+        assert response.json() == {"text": "one two three", "word_count": 3}
+
+    def test_parsing_in_a_worker_process(self, user: User):
+        file = File.objects.create(
+            user=user,
+            file=SimpleUploadedFile("notes.txt", b"minutes of the meeting"),
+            file_type="text/plain",
+            file_size=22,
+        )
+
+        process_file(file.pk, offload=True)
+
+        content = FileContent.objects.get(file=file)
+        assert content.status == FileContent.Status.DONE
+        assert content.text == "minutes of the meeting"
+
+    def test_failure_is_recorded(self, user: User):
+        file = File.objects.create(
+            user=user,
+            file=SimpleUploadedFile("broken.docx", b"not a zip"),
+            file_type=DOCX,
+            file_size=9,
+        )
+
+        process_file(file.pk)
+
+        content = FileContent.objects.get(file=file)
+        assert content.status == FileContent.Status.FAILED
+        assert content.error
+
+    def test_backlog_command(self, user: User):
+        file = File.objects.create(
+            user=user,
+            file=SimpleUploadedFile("a.txt", b"backlog words"),
+            file_type="text/plain",
+            file_size=13,
+        )
+        FileContent.objects.all().delete()
+
+        call_command("extract_files", "--workers", "1")
+
+        content = FileContent.objects.get(file=file)
+        assert content.status == FileContent.Status.DONE
+        assert content.word_count == 2
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+from http import HTTPStatus
+
+import pytest
+from rest_framework.test import APIClient
+
+from userportal.users import hashing
+from userportal.users.executors import Pool
+from userportal.users.hashing import HashingBusy
+from userportal.users.models import User
+
+pytestmark = pytest.mark.django_db
+
+PASSWORD = "correct horse battery staple"
+
+
+@pytest.fixture
+def pool(monkeypatch) -> Pool:
+    pool = Pool("password-hashing", max_workers=1, queue_size=1)
+    monkeypatch.setattr(hashing, "get_pool", lambda: pool)
+    return pool
+
+
+@pytest.fixture
+def account(pool) -> User:
+    return User.objects.create_user(email="ada@example.com", name="Ada", password=PASSWORD)
+
+
+def test_full_pool_fails_fast(pool):
+    release = threading.Event()
+    running = [pool.submit(release.wait) for _ in range(2)]
+    try:
+        with pytest.raises(HashingBusy):
+            hashing.hash_password(PASSWORD)
+    finally:
+        release.set()
+    for future in running:
+        future.result()
+
+    # Slots are freed as hashes finish.
+    assert hashing.verify_password(PASSWORD, hashing.hash_password(PASSWORD))[0]
+
+
+def test_login_answers_503_when_busy(pool, account: User):
+    release = threading.Event()
+    running = [pool.submit(release.wait) for _ in range(2)]
+    try:
+        response = APIClient().post("/api/token/", {"email": account.email, "password": PASSWORD}, format="json")
+    finally:
+        release.set()
+    for future in running:
+        future.result()
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response["Retry-After"] == "1"
+
+
+def test_async_check_password(account: User):
+    assert asyncio.run(account.acheck_password(PASSWORD))
+    assert not asyncio.run(account.acheck_password("wrong"))
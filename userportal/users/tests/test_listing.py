@@ -0,0 +1,59 @@
+from datetime import timedelta
+from http import HTTPStatus
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from userportal.users.models import File
+from userportal.users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+class TestFileList:
+    @pytest.fixture
+    def client(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    @pytest.fixture
+    def files(self, user: User):
+        now = timezone.now()
+        files = []
+        for day in range(5):
+            file = File.objects.create(
+                user=user,
+                file=SimpleUploadedFile(f"{day}.txt", b"x" * (day + 1)),
+                file_type="application/pdf" if day % 2 else "text/plain",
+                file_size=day + 1,
+            )
+            # Two files share each timestamp so paging has to break ties by id.
+            File.objects.filter(pk=file.pk).update(upload_date=now - timedelta(days=day // 2))
+            files.append(file)
+        return files
+
+    def test_pages_cover_every_file_once(self, client, files):
+        seen = []
+        url = "/api/files/?page_size=2"
+        while url:
+            body = client.get(url).json()
+            seen.extend(file["id"] for file in body["results"])
+            url = body["next"]
+
+        assert sorted(seen) == sorted(file.pk for file in files)
+        assert len(seen) == len(files)
+
+    def test_filters(self, client, files):
+        response = client.get("/api/files/", {"file_type": "application/pdf", "min_size": 3})
+        assert [file["id"] for file in response.json()["results"]] == [files[3].pk]
+
+        since = (timezone.now() - timedelta(hours=1)).isoformat()
+        response = client.get("/api/files/", {"uploaded_after": since})
+        assert {file["id"] for file in response.json()["results"]} == {files[0].pk, files[1].pk}
+
+    def test_invalid_filter(self, client):
+        response = client.get("/api/files/", {"min_size": 10, "max_size": 1})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,80 @@
+import json
+from http import HTTPStatus
+
+import pytest
+from django.contrib.auth.hashers import MD5PasswordHasher
+from django.test import RequestFactory
+from rest_framework.test import APIClient
+
+from userportal.users.models import User
+from userportal.users.views import login_view_api
+
+pytestmark = pytest.mark.django_db
+
+PASSWORD = "correct horse battery staple"
+
+
+class CountingHasher(MD5PasswordHasher):
+    algorithm = "counting_md5"
+    verified = 0
+
+    def verify(self, password, encoded):
+        CountingHasher.verified += 1
+        return super().verify(password, encoded)
+
+
+@pytest.fixture
+def counting_hasher(settings):
+    settings.PASSWORD_HASHERS = [
+        "userportal.users.tests.test_login.CountingHasher",
+        "django.contrib.auth.hashers.MD5PasswordHasher",
+    ]
+    CountingHasher.verified = 0
+    return CountingHasher
+
+
+@pytest.fixture
+def account(counting_hasher) -> User:
+    user = User.objects.create_user(email="ada@example.com", name="Ada", password=PASSWORD)
+    counting_hasher.verified = 0
+    return user
+
+
+def test_token_checks_the_password_once(account: User, counting_hasher):
+    response = APIClient().post("/api/token/", {"email": account.email, "password": PASSWORD}, format="json")
+
+    assert response.status_code == HTTPStatus.OK
+    assert set(response.json()) == {"refresh", "access"}
+    assert json.loads(response["X-User-Data"]) == {"id": account.pk, "name": "Ada", "email": "ada@example.com"}
+    assert counting_hasher.verified == 1
+
+
+def test_token_rejects_a_wrong_password(account: User):
+    response = APIClient().post("/api/token/", {"email": account.email, "password": "wrong"}, format="json")
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert "error" in response.json()
+
+
+def test_login_view_api_checks_the_password_once(account: User, counting_hasher, rf: RequestFactory):
+    request = rf.post("/login/", {"email": account.email, "password": PASSWORD})
+
+    response = login_view_api(request)
+
+    data = json.loads(response.content)
+    assert set(data) == {"refresh", "access", "user"}
+    assert data["user"]["email"] == account.email
+    assert counting_hasher.verified == 1
+
+
+def test_login_upgrades_the_password_hash(settings, counting_hasher):
+    settings.PASSWORD_HASHERS = list(reversed(settings.PASSWORD_HASHERS))
+    user = User.objects.create_user(email="old@example.com", name="Old", password=PASSWORD)
+    assert user.password.startswith("md5$")
+    settings.PASSWORD_HASHERS = list(reversed(settings.PASSWORD_HASHERS))
+
+    response = APIClient().post("/api/token/", {"email": user.email, "password": PASSWORD}, format="json")
+
+    assert response.status_code == HTTPStatus.OK
+    user.refresh_from_db()
+    assert user.password.startswith("counting_md5$")
@@ -0,0 +1,125 @@
+import os
+import threading
+from http import HTTPStatus
+
+import pytest
+from django.core.files.base import ContentFile
+from rest_framework.test import APIClient
+
+from userportal.users import executors
+from userportal.users.extraction import DOCX
+from userportal.users.models import File
+from userportal.users.models import FileContent
+from userportal.users.models import User
+from userportal.users.previews import PreviewCache
+from userportal.users.previews import cache_stats
+from userportal.users.previews import preview_cache
+
+pytestmark = pytest.mark.django_db
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    previews = PreviewCache(str(tmp_path), max_bytes=300)
+    for age, key in enumerate(["aa-old", "bb-used", "cc-new"]):
+        previews.put(key, b"x" * 100)
+        os.utime(previews.path(key), (1000 + age, 1000 + age))
+    assert previews.get("aa-old") == b"x" * 100
+
+    previews.put("dd-newest", b"x" * 100)
+
+    # Reading "aa-old" made "bb-used" the least recently used.
+    assert previews.get("bb-used") is None
+    assert previews.get("aa-old") is not None
+    assert previews.get("dd-newest") is not None
+    assert sum(size for _, size, _ in previews.entries()) <= 300
+
+
+class TestPreviewEndpoint:
+    @pytest.fixture
+    def client(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def make_file(self, user: User, content: bytes, file_type: str = "text/plain") -> File:
+        file = File(user=user, file_type=file_type, file_size=len(content))
+        file.file = ContentFile(content, name="notes.txt")
+        file.save()
+        return file
+
+    def test_text_snippet_is_rendered_once(self, client, user: User, settings):
+        settings.PREVIEW_SNIPPET_LENGTH = 20
+        file = self.make_file(user, b"Quarterly   report\n\nfor the board, draft two")
+        url = f"/api/files/{file.pk}/preview/"
+
+        first = client.get(url)
+        second = client.get(url)
+
+        assert first.status_code == HTTPStatus.OK
+        assert first.json() == {"text": "Quarterly report for"}
+        assert second.json() == first.json()
+        assert cache_stats() == {"hits": 1, "misses": 1}
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        assert cache_stats() == {"hits": 1, "misses": 1}
+
+    def test_identical_content_shares_a_preview(self, client, user: User):
+        first = self.make_file(user, b"same words")
+        second = self.make_file(user, b"same words")
+
+        client.get(f"/api/files/{first.pk}/preview/")
+        response = client.get(f"/api/files/{second.pk}/preview/")
+
+        assert response.json() == {"text": "same words"}
+        assert cache_stats() == {"hits": 1, "misses": 1}
+
+    def test_full_render_queue_asks_to_retry(self, client, user: User, monkeypatch):
+        pool = executors.Pool("preview", max_workers=1, queue_size=0)
+        monkeypatch.setattr(executors, "get", lambda *args: pool)
+        release = threading.Event()
+        busy = pool.submit(release.wait)
+        file = self.make_file(user, b"Quarterly report")
+
+        try:
+            response = client.get(f"/api/files/{file.pk}/preview/")
+        finally:
+            release.set()
+            busy.result()
+
+        assert response.status_code == HTTPStatus.ACCEPTED
+        assert response["Retry-After"] == "1"
+        assert client.get(f"/api/files/{file.pk}/preview/").json() == {"text": "Quarterly report"}
+
+    def test_unavailable_kind(self, client, user: User):
+        file = self.make_file(user, b"plain text")
+
+        response = client.get(f"/api/files/{file.pk}/preview/", {"kind": "thumbnail"})
+
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert "error" in response.json()
+
+    def test_document_snippet_comes_from_extracted_text(self, client, user: User):
+        file = self.make_file(user, b"PK not really a docx", file_type=DOCX)
+        url = f"/api/files/{file.pk}/preview/"
+        content = FileContent.objects.get(file=file)
+
+        assert client.get(url).status_code == HTTPStatus.ACCEPTED
+
+        content.status = FileContent.Status.DONE
+        content.text = "Board   minutes\nfor March"
+        content.save()
+        assert client.get(url).json() == {"text": "Board minutes for March"}
+
+        content.text = ""
+        content.save()
+        assert client.get(url).status_code == HTTPStatus.NOT_FOUND
+
+    def test_empty_text_file_has_no_snippet(self, client, user: User):
+        file = self.make_file(user, b" \n ")
+
+        response = client.get(f"/api/files/{file.pk}/preview/")
+
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert cache_stats() == {"hits": 0, "misses": 1}
+        assert not list(preview_cache.entries())
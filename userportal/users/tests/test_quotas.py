@@ -0,0 +1,75 @@
+from http import HTTPStatus
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from userportal.users.models import File
+from userportal.users.models import StorageUsage
+from userportal.users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+class TestStorageQuota:
+    @pytest.fixture
+    def client(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def upload(self, client, name, content):
+        return client.post("/api/files/", {"file": SimpleUploadedFile(name, content, content_type="text/plain")})
+
+    def test_usage_follows_uploads_and_deletes(self, client, user: User):
+        first = self.upload(client, "a.txt", b"12345").json()
+        self.upload(client, "b.txt", b"123")
+
+        usage = StorageUsage.objects.get(user=user)
+        assert (usage.bytes_used, usage.file_count) == (8, 2)
+        assert usage.by_type == {"text/plain": {"count": 2, "bytes": 8}}
+
+        client.delete(f"/api/files/{first['id']}/")
+        storage = client.get(f"/api/profile/{user.pk}/").json()["storage"]
+        assert storage["bytes_used"] == 3
+        assert storage["by_type"] == {"text/plain": {"count": 1, "bytes": 3}}
+
+    def test_upload_over_quota_is_refused(self, client, user: User, settings):
+        settings.STORAGE_QUOTA_DEFAULT = 10
+        self.upload(client, "a.txt", b"12345678")
+
+        response = self.upload(client, "b.txt", b"123")
+
+        assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        assert File.objects.filter(user=user).count() == 1
+        assert StorageUsage.objects.get(user=user).bytes_used == 8
+
+    def test_batch_stops_at_quota(self, client, user: User):
+        StorageUsage.objects.create(user=user, quota=6)
+        files = [
+            SimpleUploadedFile("a.txt", b"1234", content_type="text/plain"),
+            SimpleUploadedFile("b.txt", b"5678", content_type="text/plain"),
+            SimpleUploadedFile("c.txt", b"9", content_type="text/plain"),
+        ]
+
+        response = client.post("/api/files/batch/", {"files": files})
+
+        assert [result["status"] for result in response.json()["results"]] == [201, 400, 201]
+        assert StorageUsage.objects.get(user=user).bytes_used == 5
+
+
+def test_reconcile_storage_usage(user: User):
+    File.objects.create(
+        user=user,
+        file=SimpleUploadedFile("a.txt", b"hello"),
+        file_type="text/plain",
+        file_size=5,
+    )
+    StorageUsage.objects.filter(user=user).update(bytes_used=999, file_count=7, by_type={})
+
+    call_command("reconcile_storage_usage", "--batch-size", "1")
+
+    usage = StorageUsage.objects.get(user=user)
+    assert (usage.bytes_used, usage.file_count) == (5, 1)
+    assert usage.by_type == {"text/plain": {"count": 1, "bytes": 5}}
@@ -0,0 +1,121 @@
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from userportal.users import ratelimit
+from userportal.users.models import User
+from userportal.users.ratelimit import retry_after
+from userportal.users.tests.test_login import PASSWORD
+from userportal.users.tests.test_login import CountingHasher
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def counting_hasher(settings):
+    settings.PASSWORD_HASHERS = ["userportal.users.tests.test_login.CountingHasher"]
+    return CountingHasher
+
+
+@pytest.fixture(autouse=True)
+def _limits(settings):
+    settings.LOGIN_RATE_LIMIT_WINDOW = 60
+    settings.LOGIN_RATE_LIMIT_PER_IP = 5
+    settings.LOGIN_RATE_LIMIT_PER_EMAIL = 3
+
+
+def log_in(email: str, password: str = "wrong", address: str = "10.0.0.1"):
+    return APIClient(REMOTE_ADDR=address).post("/api/token/", {"email": email, "password": password}, format="json")
+
+
+def test_email_limit_stops_hashing(counting_hasher):
+    User.objects.create_user(email="ada@example.com", name="Ada", password=PASSWORD)
+    for address in ["10.0.0.1", "10.0.0.2", "10.0.0.3"]:
+        assert log_in("ada@example.com", address=address).status_code == HTTPStatus.UNAUTHORIZED
+    CountingHasher.verified = 0
+
+    response = log_in("Ada@Example.com", PASSWORD, address="10.0.0.4")
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response["Retry-After"]) >= 1
+    assert CountingHasher.verified == 0
+
+
+def test_ip_limit_covers_every_email():
+    for number in range(5):
+        assert log_in(f"user{number}@example.com").status_code == HTTPStatus.UNAUTHORIZED
+
+    assert log_in("someone@example.com").status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert log_in("someone@example.com", address="10.0.0.9").status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.parametrize(
+    ("forwarded", "proxies", "address"),
+    [
+        ("10.0.0.1", 1, "10.0.0.1"),
+        ("6.6.6.6, 10.0.0.1", 1, "10.0.0.1"),
+        ("6.6.6.6, 10.0.0.1, 172.16.0.2", 2, "10.0.0.1"),
+        ("10.0.0.1", 2, "10.0.0.1"),
+    ],
+)
+def test_client_ip_ignores_forged_entries(rf, settings, forwarded, proxies, address):
+    settings.RATE_LIMIT_IP_HEADER = "HTTP_X_FORWARDED_FOR"
+    settings.RATE_LIMIT_PROXY_COUNT = proxies
+
+    assert ratelimit.client_ip(rf.post("/", HTTP_X_FORWARDED_FOR=forwarded)) == address
+
+
+def test_forged_addresses_share_the_real_one(settings):
+    settings.RATE_LIMIT_IP_HEADER = "HTTP_X_FORWARDED_FOR"
+    client = APIClient()
+
+    def attempt(number):
+        return client.post(
+            "/api/token/", {"email": f"user{number}@example.com", "password": "wrong"},
+            format="json", HTTP_X_FORWARDED_FOR=f"6.6.6.{number}, 10.0.0.1",
+        )
+
+    for number in range(5):
+        assert attempt(number).status_code == HTTPStatus.UNAUTHORIZED
+    assert attempt(5).status_code == HTTPStatus.TOO_MANY_REQUESTS
+
+
+def test_window_slides(monkeypatch):
+    now = 6000.0  # The start of a window.
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now)
+    for number in range(5):
+        log_in(f"user{number}@example.com")
+
+    # Halfway through the next window, half of the last one still counts:
+    # 2.5 + 2 attempts fit within 5, 2.5 + 3 do not.
+    now += 90
+    assert log_in("a@example.com").status_code == HTTPStatus.UNAUTHORIZED
+    assert log_in("b@example.com").status_code == HTTPStatus.UNAUTHORIZED
+    assert log_in("c@example.com").status_code == HTTPStatus.TOO_MANY_REQUESTS
+
+
+def test_retry_after():
+    # 30s in, 4 + 6 * 0.5 = 7 attempts count; at 50s, 4 + 6 / 6 = 5 do.
+    assert retry_after(4, 6, 5, 30, 60) == 20
+    assert retry_after(8, 0, 5, 30, 60) == 53
+
+
+def test_benchmark_login_is_not_limited(counting_hasher):
+    out = StringIO()
+
+    call_command("benchmark_login", logins=5, stdout=out)
+
+    assert out.getvalue().startswith("5 logins with counting_md5")
+
+
+def test_benchmark_login_compares_the_double_check(counting_hasher):
+    out = StringIO()
+
+    call_command("benchmark_login", logins=5, compare=True, stdout=out)
+
+    first, second = out.getvalue().splitlines()
+    assert first.startswith("5 logins with counting_md5")
+    assert second.startswith("Checking the password twice: ")
@@ -0,0 +1,69 @@
+from http import HTTPStatus
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from rest_framework.test import APIClient
+
+from userportal.users.extraction import save_result
+from userportal.users.models import File
+from userportal.users.models import User
+from userportal.users.search import highlight
+from userportal.users.tests.factories import UserFactory
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(connection.vendor != "postgresql", reason="full-text search needs PostgreSQL"),
+]
+
+
+def make_file(user, name, description=None):
+    return File.objects.create(
+        user=user,
+        file=SimpleUploadedFile(name, name.encode()),
+        file_type="text/plain",
+        file_size=len(name),
+        description=description,
+    )
+
+
+def test_highlight_escapes_document_text():
+    assert highlight(" <b>\x02tax\x03</b> ") == "&lt;b&gt;<mark>tax</mark>&lt;/b&gt;"
+
+
+class TestFileSearch:
+    @pytest.fixture
+    def client(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_ranked_results_with_snippets(self, client, user: User):
+        in_text = make_file(user, "notes.txt")
+        save_result(in_text.pk, {
+            "text": "The invoice for March is attached below.",
+            "page_count": None,
+            "sheet_count": None,
+            "word_count": 7,
+        })
+        in_name = make_file(user, "invoice-2024.txt")
+        make_file(user, "holiday.txt", description="Photos from the trip")
+        make_file(UserFactory(), "invoice.txt")
+
+        response = client.get("/api/files/search/", {"q": "invoices"})
+
+        assert response.status_code == HTTPStatus.OK
+        results = response.json()["results"]
+        assert [result["id"] for result in results] == [in_name.pk, in_text.pk]
+        assert "<mark>invoice</mark>" in results[1]["snippet"]
+
+    def test_description_update_is_indexed(self, client, user: User):
+        file = make_file(user, "scan.txt")
+        file.description = "Signed lease agreement"
+        file.save()
+
+        response = client.get("/api/files/search/", {"q": "lease"})
+        assert [result["id"] for result in response.json()["results"]] == [file.pk]
+
+    def test_terms_are_required(self, client):
+        assert client.get("/api/files/search/").status_code == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,320 @@
+import gzip
+import os
+import threading
+from datetime import timedelta
+from http import HTTPStatus
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from userportal.users.models import Blob
+from userportal.users.models import File
+from userportal.users.models import User
+from userportal.users.storage import blob_storage
+from userportal.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def make_file(user: User, content: bytes, name: str = "report.txt") -> File:
+    file = File(user=user, file_type="text/plain", file_size=len(content))
+    file.file = ContentFile(content, name=name)
+    file.save()
+    return file
+
+
+class TestBlobStore:
+    def test_identical_uploads_share_one_blob(self, user: User):
+        first = make_file(user, b"same bytes", "a.txt")
+        second = make_file(UserFactory(), b"same bytes", "b.txt")
+
+        assert first.file.name == second.file.name
+        assert first.original_name == "a.txt"
+        assert second.download_name == "b.txt"
+        assert Blob.objects.get(pk=first.blob_id).ref_count == 2
+
+    def test_blob_deleted_with_last_reference(self, user: User, django_capture_on_commit_callbacks):
+        first = make_file(user, b"shared")
+        second = make_file(user, b"shared")
+        name = first.file.name
+
+        with django_capture_on_commit_callbacks(execute=True):
+            first.delete()
+        assert blob_storage.exists(name)
+        assert Blob.objects.get(pk=second.blob_id).ref_count == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            second.delete()
+        assert not blob_storage.exists(name)
+        assert not Blob.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unreferenced_blob_kept_for_concurrent_upload(user: User):
+    file = make_file(user, b"contested")
+    name, digest = file.file.name, file.blob_id
+    # As left by the release of the last reference, before its on_commit.
+    Blob.objects.filter(pk=digest).update(ref_count=0)
+    acquired, finish = threading.Event(), threading.Event()
+
+    def upload():
+        try:
+            with transaction.atomic():
+                Blob.objects.acquire(digest, 9)
+                acquired.set()
+                finish.wait(5)
+        finally:
+            connection.close()
+
+    uploader = threading.Thread(target=upload)
+    uploader.start()
+    acquired.wait(5)
+    deleter = threading.Thread(target=lambda: (Blob.objects.delete_unreferenced(digest), connection.close()))
+    deleter.start()
+    deleter.join(0.2)
+    # Waiting for the upload's row lock.
+    assert deleter.is_alive()
+    finish.set()
+    uploader.join()
+    deleter.join()
+
+    assert Blob.objects.get(pk=digest).ref_count == 1
+    assert blob_storage.exists(name)
+
+
+def test_dedupe_files_command(user: User, django_capture_on_commit_callbacks):
+    Path(blob_storage.path("uploads")).mkdir(parents=True)
+    for i in range(3):
+        Path(blob_storage.path(f"uploads/copy{i}.txt")).write_bytes(b"duplicate")
+        File.objects.create(user=user, file=f"uploads/copy{i}.txt", file_type="text/plain", file_size=9)
+    assert not Blob.objects.exists()
+
+    out = StringIO()
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("dedupe_files", stdout=out)
+
+    assert "collapsed 2 duplicates (18 bytes reclaimed)" in out.getvalue()
+    assert File.objects.values("file").distinct().count() == 1
+    assert Blob.objects.get().ref_count == 3
+    assert not any(blob_storage.exists(f"uploads/copy{i}.txt") for i in range(3))
+
+
+def test_blobs_are_sharded(user: User):
+    file = make_file(user, b"sharded")
+    digest = file.blob_id
+    assert file.file.name == f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+    assert Path(blob_storage.base_location, file.file.name).read_bytes() == b"sharded"
+
+
+def test_shard_blobs_command(user: User, settings):
+    settings.BLOB_STORAGE_FANOUT = 0
+    file = make_file(user, b"stored flat")
+    flat_name = file.file.name
+    settings.BLOB_STORAGE_FANOUT = 2
+    # Flat blobs are still found before they are moved.
+    assert File.objects.get(pk=file.pk).file.read() == b"stored flat"
+
+    call_command("shard_blobs", stdout=StringIO())
+
+    file.refresh_from_db()
+    assert file.file.name == f"blobs/{file.blob_id[:2]}/{file.blob_id[2:4]}/{file.blob_id}"
+    assert not Path(blob_storage.base_location, flat_name).exists()
+    assert file.file.read() == b"stored flat"
+
+
+def test_accel_redirect_to_flat_blob(user: User, settings):
+    settings.DOWNLOAD_DELIVERY_BACKEND = "userportal.users.delivery.NginxAccelDelivery"
+    settings.BLOB_STORAGE_FANOUT = 0
+    make_file(user, b"stored flat")
+    settings.BLOB_STORAGE_FANOUT = 2
+    # Saved under the sharded name, but the bytes are still stored flat.
+    file = make_file(user, b"stored flat")
+    assert file.file.name == f"blobs/{file.blob_id[:2]}/{file.blob_id[2:4]}/{file.blob_id}"
+    client = APIClient()
+    client.force_authenticate(user)
+
+    response = client.get(f"/api/files/{file.pk}/download/")
+
+    assert response["X-Accel-Redirect"] == f"/protected/blobs/{file.blob_id}"
+
+
+def test_reconcile_files_command(user: User, settings):
+    kept = make_file(user, b"still referenced")
+    lost = make_file(user, b"bytes went missing")
+    Path(blob_storage.locate(lost.file.name).path).unlink()
+    os.utime(blob_storage.locate(kept.file.name).path, (0, 0))
+    media = Path(settings.MEDIA_ROOT)
+    orphans = [
+        media / "blobs" / ("0" * 64),
+        media / "blobs" / f"{'1' * 64}.abc.tmp",
+        media / "upload_sessions" / "00000000-0000-0000-0000-000000000000.part",
+        media / "uploads" / "forgotten.txt",
+    ]
+    for orphan in orphans:
+        orphan.parent.mkdir(parents=True, exist_ok=True)
+        orphan.write_bytes(b"12345")
+        os.utime(orphan, (0, 0))
+    recent = media / "blobs" / ("2" * 64)
+    recent.write_bytes(b"in flight")
+
+    out, err = StringIO(), StringIO()
+    call_command("reconcile_files", "--max-rate", "0", stdout=out, stderr=err)
+
+    assert "Removed 4 orphaned files (20 bytes)" in out.getvalue()
+    assert "1 blobs and 1 files are missing" in out.getvalue()
+    assert lost.blob_id in err.getvalue()
+    for orphan in orphans:
+        assert not orphan.exists()
+        assert (media / "quarantine" / orphan.relative_to(media)).exists()
+    assert recent.exists()
+    assert blob_storage.exists(kept.file.name)
+
+
+class TestTiering:
+    @pytest.fixture
+    def cold_root(self, settings, tmp_path):
+        settings.COLD_STORAGE_ROOT = str(tmp_path / "cold")
+        return tmp_path / "cold"
+
+    def test_compressed_cold_blob_reads_transparently(self, user: User, cold_root):
+        content = b"cold storage " * 100
+        file = make_file(user, content)
+
+        stored = blob_storage.move_to_tier(file.file.name, "cold", compress=True)
+
+        assert stored.encoding == "gzip"
+        assert not Path(blob_storage.base_location, file.file.name).exists()
+        assert blob_storage.size(file.file.name) == len(content)
+        with File.objects.get(pk=file.pk).file.open("rb") as f:
+            f.seek(13)
+            assert f.read(7) == b"cold st"
+
+    def test_download_from_cold_tier(self, user: User, cold_root, settings):
+        settings.DOWNLOAD_DELIVERY_BACKEND = "userportal.users.delivery.NginxAccelDelivery"
+        file = make_file(user, b"plain cold bytes")
+        blob_storage.move_to_tier(file.file.name, "cold")
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get(f"/api/files/{file.pk}/download/")
+        assert response["X-Accel-Redirect"] == f"/protected-cold/{file.file.name}"
+
+        blob_storage.move_to_tier(file.file.name, "cold", compress=True)
+        response = client.get(f"/api/files/{file.pk}/download/")
+        assert response["Content-Length"] == "16"
+        assert b"".join(response.streaming_content) == b"plain cold bytes"
+        assert Blob.objects.get(pk=file.blob_id).last_accessed is not None
+
+    def test_tier_blobs_command(self, user: User, cold_root, django_capture_on_commit_callbacks):
+        stale = make_file(user, b"old")
+        recent = make_file(user, b"new")
+        Blob.objects.filter(pk=stale.blob_id).update(created=timezone.now() - timedelta(days=100))
+
+        call_command("tier_blobs", "--days", "30", "--compress", "--max-rate", "0", stdout=StringIO())
+
+        assert Blob.objects.get(pk=stale.blob_id).tier == "cold"
+        assert Blob.objects.get(pk=recent.blob_id).tier == "hot"
+        assert (cold_root / f"{stale.file.name}.gz").exists()
+
+        Blob.objects.touch(stale.blob_id)
+        call_command("tier_blobs", "--days", "30", "--max-rate", "0", stdout=StringIO())
+        assert Blob.objects.get(pk=stale.blob_id).tier == "hot"
+        # Compressed blobs stay compressed when they come back.
+        assert Path(blob_storage.base_location, f"{stale.file.name}.gz").exists()
+        with blob_storage.open(stale.file.name) as f:
+            assert f.read() == b"old"
+
+        with django_capture_on_commit_callbacks(execute=True):
+            stale.delete()
+        assert not blob_storage.exists(stale.file.name)
+
+
+class TestCompressionAtRest:
+    @pytest.fixture(autouse=True)
+    def _gzip(self, settings):
+        settings.BLOB_COMPRESSION = "gzip"
+
+    def upload(self, user: User, content: bytes, content_type: str = "text/plain") -> File:
+        file = File(user=user, file_type=content_type, file_size=len(content))
+        file.file = SimpleUploadedFile("notes.txt", content, content_type=content_type)
+        file.save()
+        return file
+
+    def test_compressible_text_stored_gzipped(self, user: User):
+        content = b"minutes of the meeting\n" * 1000
+        file = self.upload(user, content)
+
+        stored = blob_storage.locate(file.file.name)
+        assert stored.encoding == "gzip"
+        assert Path(stored.path).stat().st_size < len(content) / 10
+        assert blob_storage.size(file.file.name) == len(content)
+        with File.objects.get(pk=file.pk).file.open("rb") as f:
+            f.seek(len(content) - 8)
+            assert f.read() == b"meeting\n"
+            f.seek(0)
+            assert f.read(7) == b"minutes"
+
+    def test_compressed_blob_has_no_path(self, user: User):
+        file = self.upload(user, b"minutes of the meeting\n" * 1000)
+
+        with pytest.raises(ValueError, match="compressed"):
+            blob_storage.path(file.file.name)
+
+    def test_failed_compressed_write_leaves_no_temporary_file(self, user: User, settings):
+        class Interrupted(ContentFile):
+            content_type = "text/plain"
+            sha256 = "1" * 64
+
+            def chunks(self, chunk_size=None):
+                yield b"minutes of the meeting\n" * 1000
+                raise OSError("connection reset")
+
+        with pytest.raises(OSError, match="connection reset"):
+            blob_storage.save("notes.txt", Interrupted(b"minutes of the meeting\n" * 2000, name="notes.txt"))
+
+        assert not [path for path in Path(settings.MEDIA_ROOT).rglob("*") if path.is_file()]
+
+    def test_incompressible_or_other_types_stored_raw(self, user: User, settings):
+        noise = self.upload(user, os.urandom(4096))
+        image = self.upload(user, b"a" * 4096, content_type="image/png")
+        settings.BLOB_COMPRESSION = ""
+        disabled = self.upload(user, b"b" * 4096)
+
+        for file in (noise, image, disabled):
+            assert blob_storage.locate(file.file.name).encoding is None
+
+    def test_download_passes_compressed_bytes_through(self, user: User):
+        content = b"quarterly figures\n" * 500
+        file = self.upload(user, content)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f"/api/files/{file.pk}/download/"
+
+        response = client.get(url, HTTP_ACCEPT_ENCODING="br, gzip;q=0.8")
+        assert response["Content-Encoding"] == "gzip"
+        assert response["ETag"] == f'W/"{file.blob_id}"'
+        assert "Accept-Encoding" in response["Vary"]
+        assert gzip.decompress(b"".join(response.streaming_content)) == content
+
+        response = client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0")
+        assert not response.has_header("Content-Encoding")
+        assert response["Content-Length"] == str(len(content))
+        assert b"".join(response.streaming_content) == content
+
+        assert response["Accept-Ranges"] == "none"
+
+        response = client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=0-9")
+        assert response.status_code == HTTPStatus.OK
+        assert gzip.decompress(b"".join(response.streaming_content)) == content
+
+        response = client.get(url, HTTP_ACCEPT_ENCODING="identity", HTTP_RANGE="bytes=0-9")
+        assert response.status_code == HTTPStatus.OK
+        assert b"".join(response.streaming_content) == content
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import json
+import os
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APIClient
+
+from userportal.users.models import Blob
+from userportal.users.models import File
+from userportal.users.models import UploadSession
+from userportal.users.models import User
+from userportal.users.receiver import application as receiver
+from userportal.users.tickets import received_path
+from userportal.users.uploadhandlers import DOCX
+from userportal.users.uploadhandlers import ContentSniffer
+from userportal.users.uploads import missing_ranges
+from userportal.users.uploads import received_ranges
+
+pytestmark = pytest.mark.django_db
+
+
+def test_received_ranges_merges_overlapping_chunks():
+    assert received_ranges([(10, 5), (0, 10), (20, 5), (22, 10)]) == [[0, 15], [20, 32]]
+
+
+def test_missing_ranges():
+    assert missing_ranges([[0, 15], [20, 32]], 40) == [[15, 20], [32, 40]]
+    assert missing_ranges([], 8) == [[0, 8]]
+    assert missing_ranges([[0, 8]], 8) == []
+
+
+class TestUploadSessionViewSet:
+    content = b"hello resumable world\n" * 10
+
+    @pytest.fixture
+    def client(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def create_session(self, client):
+        response = client.post(
+            "/api/uploads/",
+            {"filename": "notes.txt", "content_type": "text/plain", "total_size": len(self.content)},
+            format="json",
+        )
+        assert response.status_code == HTTPStatus.CREATED
+        return response.json()["id"]
+
+    def put_chunk(self, client, session_id, offset, data):
+        return client.generic(
+            "PUT",
+            f"/api/uploads/{session_id}/chunks/{offset}/",
+            data,
+            content_type="application/octet-stream",
+        )
+
+    def test_resumable_upload(self, client, user: User):
+        session_id = self.create_session(client)
+
+        response = self.put_chunk(client, session_id, 100, self.content[100:])
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()["missing"] == [[0, 100]]
+
+        response = client.post(f"/api/uploads/{session_id}/complete/")
+        assert response.status_code == HTTPStatus.CONFLICT
+
+        self.put_chunk(client, session_id, 0, self.content[:100])
+        response = client.post(f"/api/uploads/{session_id}/complete/")
+        assert response.status_code == HTTPStatus.CREATED
+
+        file = File.objects.get(user=user)
+        assert file.file_size == len(self.content)
+        assert file.file.read() == self.content
+        assert not UploadSession.objects.exists()
+
+    def test_chunk_past_end_is_rejected(self, client):
+        session_id = self.create_session(client)
+        response = self.put_chunk(client, session_id, len(self.content) - 1, b"xx")
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_unsupported_type_is_rejected(self, client):
+        response = client.post(
+            "/api/uploads/",
+            {"filename": "a.exe", "content_type": "application/x-msdownload", "total_size": 10},
+            format="json",
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def put_to_receiver(url, chunks, disconnect=False):
+    """Drive the ASGI upload receiver with a PUT of ``chunks``; return (status, body)."""
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    messages.append({"type": "http.disconnect"} if disconnect else {"type": "http.request", "body": b""})
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "PUT", "path": urlsplit(url).path, "headers": []}
+    asyncio.run(receiver(scope, receive, send))
+    if not sent:
+        return None, None
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+class TestUploadReceiver:
+    content = b"sent straight to the receiver\n" * 10
+
+    @pytest.fixture
+    def client(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def ticket(self, client):
+        response = client.post(
+            "/api/uploads/",
+            {"filename": "notes.txt", "content_type": "text/plain", "total_size": len(self.content)},
+            format="json",
+        )
+        session_id = response.json()["id"]
+        response = client.post(f"/api/uploads/{session_id}/ticket/")
+        assert response.status_code == HTTPStatus.OK
+        return session_id, response.json()["url"]
+
+    def test_upload_through_receiver(self, client, user: User):
+        session_id, url = self.ticket(client)
+
+        status, body = put_to_receiver(url, [self.content[:100], self.content[100:]])
+        assert status == HTTPStatus.CREATED
+        assert body == {"received": len(self.content)}
+
+        response = client.post(f"/api/uploads/{session_id}/complete/")
+        assert response.status_code == HTTPStatus.CREATED
+        assert File.objects.get(user=user).file.read() == self.content
+        assert not UploadSession.objects.exists()
+
+    def test_completing_does_not_read_the_received_body(self, client, user: User, monkeypatch):
+        session_id, url = self.ticket(client)
+        put_to_receiver(url, [self.content])
+
+        def fail(file):
+            raise AssertionError("The body was read again")
+
+        monkeypatch.setattr("userportal.users.uploads.sniff_file", fail)
+        response = client.post(f"/api/uploads/{session_id}/complete/")
+
+        assert response.status_code == HTTPStatus.CREATED
+        file = File.objects.get(user=user)
+        assert file.blob_id == hashlib.sha256(self.content).hexdigest()
+        assert file.file_type == "text/plain"
+        assert not os.listdir(Path(received_path(session_id)).parent)
+
+    def test_incomplete_or_oversized_body_is_discarded(self, client):
+        session_id, url = self.ticket(client)
+
+        assert put_to_receiver(url, [self.content[:50]], disconnect=True) == (None, None)
+        status, _ = put_to_receiver(url, [self.content, b"extra"])
+        assert status == HTTPStatus.BAD_REQUEST
+
+        response = client.post(f"/api/uploads/{session_id}/complete/")
+        assert response.status_code == HTTPStatus.CONFLICT
+
+    def test_forged_ticket_is_rejected(self, client):
+        _, url = self.ticket(client)
+        status, body = put_to_receiver(url[:-3] + "xyz", [self.content])
+        assert status == HTTPStatus.FORBIDDEN
+        assert body == {"error": "Invalid upload ticket"}
+
+
+class TestBatchUpload:
+    def test_partial_failure(self, user: User):
+        client = APIClient()
+        client.force_authenticate(user)
+        files = [
+            SimpleUploadedFile("a.txt", b"same", content_type="text/plain"),
+            SimpleUploadedFile("b.exe", b"MZ\x90\x00\x03", content_type="application/x-msdownload"),
+            SimpleUploadedFile("c.txt", b"same", content_type="text/plain"),
+        ]
+
+        response = client.post("/api/files/batch/", {"files": files, "description": "folder"})
+
+        assert response.status_code == HTTPStatus.MULTI_STATUS
+        results = response.json()["results"]
+        assert [result["status"] for result in results] == [201, 400, 201]
+        assert results[2]["file"]["original_name"] == "c.txt"
+        assert File.objects.filter(user=user, description="folder").count() == 2
+        assert Blob.objects.get().ref_count == 2
+
+    def test_results_keep_request_order(self, user: User, settings):
+        settings.FILE_UPLOAD_MAX_SIZE = 1024 * 1024
+        client = APIClient()
+        client.force_authenticate(user)
+        files = [
+            SimpleUploadedFile("a.txt", b"first", content_type="text/plain"),
+            SimpleUploadedFile("big.txt", b"a" * (1024 * 1024 + 1), content_type="text/plain"),
+            SimpleUploadedFile("c.txt", b"third", content_type="text/plain"),
+        ]
+
+        response = client.post("/api/files/batch/", {"files": files})
+
+        results = response.json()["results"]
+        assert [(result["index"], result["name"], result["status"]) for result in results] == [
+            (0, "a.txt", 201), (1, "big.txt", 400), (2, "c.txt", 201),
+        ]
+
+    def test_nothing_uploaded(self, user: User):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post("/api/files/batch/", {}, format="multipart")
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.parametrize(
+    ("chunks", "expected"),
+    [
+        ([b"%PDF-1.7\n%\xe2\xe3"], "application/pdf"),
+        ([b"PK\x03\x04[Content_Types].xml", b"....", b"PK\x03\x04word/document.xml"], DOCX),
+        ([b"PK\x03\x04[Content_Types].xml"], "application/zip"),
+        ([b"plain text\r\n\tand more \xc3\xa9"], "text/plain"),
+        ([b"MZ\x90\x00\x03"], "application/octet-stream"),
+    ],
+)
+def test_content_sniffer(chunks, expected):
+    sniffer = ContentSniffer()
+    for chunk in chunks:
+        sniffer.feed(chunk)
+    assert sniffer.content_type == expected
+
+
+class TestInspectedUploads:
+    @pytest.fixture
+    def client(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_type_comes_from_content(self, client, user: User):
+        upload = SimpleUploadedFile("notes.pdf", b"just some text", content_type="application/pdf")
+        response = client.post("/api/files/", {"file": upload})
+
+        assert response.status_code == HTTPStatus.CREATED
+        file = File.objects.get(user=user)
+        assert file.file_type == "text/plain"
+        assert file.file_size == len(b"just some text")
+
+    def test_spoofed_type_is_rejected(self, client):
+        upload = SimpleUploadedFile("virus.txt", b"MZ\x90\x00\x03", content_type="text/plain")
+        response = client.post("/api/files/", {"file": upload})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_oversized_upload_is_dropped(self, client, settings):
+        settings.FILE_UPLOAD_MAX_SIZE = 1024 * 1024
+        upload = SimpleUploadedFile("big.txt", b"a" * (1024 * 1024 + 1), content_type="text/plain")
+        response = client.post("/api/files/", {"file": upload})
+
+        assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        assert response.json() == {"file": ["File size must be less than 1MB"]}
+        assert not File.objects.exists()
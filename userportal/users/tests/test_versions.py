@@ -0,0 +1,144 @@
+import random
+from io import StringIO
+from http import HTTPStatus
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from userportal.users.models import Blob
+from userportal.users.models import File
+from userportal.users.models import FileVersion
+from userportal.users.models import StorageUsage
+from userportal.users.models import User
+from userportal.users.versions import chunk_version
+from userportal.users.versions import content_chunks
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _small_chunks(settings):
+    settings.VERSION_CHUNK_MIN_SIZE = 512
+    settings.VERSION_CHUNK_AVG_SIZE = 2048
+    settings.VERSION_CHUNK_MAX_SIZE = 8192
+
+
+def document(seed: int = 0, words: int = 20000) -> bytes:
+    rng = random.Random(seed)
+    vocabulary = ["ledger", "invoice", "total", "march", "april", "paid", "due", "net", "tax", "q1"]
+    return " ".join(rng.choice(vocabulary) + str(rng.randrange(1000)) for _ in range(words)).encode()
+
+
+def test_edits_only_change_nearby_chunks():
+    original = document()
+    edited = original[:50000] + b" inserted remark " + original[50000:]
+
+    before = list(content_chunks(ContentFile(original)))
+    after = list(content_chunks(ContentFile(edited)))
+
+    assert b"".join(after) == edited
+    assert all(len(chunk) <= 8192 for chunk in after)
+    changed = set(after) - set(before)
+    assert len(changed) <= 2
+    assert sum(map(len, changed)) < len(edited) / 10
+
+
+class TestVersions:
+    @pytest.fixture
+    def client(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def upload_version(self, client, file: File, content: bytes):
+        upload = SimpleUploadedFile("ledger.txt", content, content_type="text/plain")
+        return client.post(f"/api/files/{file.pk}/versions/", {"file": upload}, format="multipart")
+
+    def test_new_version_keeps_old_one_as_chunks(self, client, user: User, django_capture_on_commit_callbacks):
+        v1 = document()
+        v2 = v1.replace(b"ledger", b"LEDGER", 1)
+        file = File(user=user, file_type="text/plain", file_size=len(v1))
+        file.file = ContentFile(v1, name="ledger.txt")
+        file.save()
+
+        response = self.upload_version(client, file, v2)
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json()["number"] == 2
+
+        file.refresh_from_db()
+        assert file.file.read() == v2
+        assert file.file_size == len(v2)
+        old = FileVersion.objects.get(file=file, number=1)
+        assert old.blob_id is not None
+
+        with django_capture_on_commit_callbacks(execute=True):
+            chunk_version(old.pk)
+        old.refresh_from_db()
+        assert old.blob_id is None
+        assert sum(size for _, size in old.chunks) == len(v1)
+        # The whole v1 blob is gone, replaced by its chunks.
+        assert not Blob.objects.filter(pk=old.sha256).exists()
+        assert Blob.objects.filter(pk__in=[digest for digest, _ in old.chunks]).exists()
+
+        versions = client.get(f"/api/files/{file.pk}/versions/").json()
+        assert [(v["number"], v["current"]) for v in versions] == [(2, True), (1, False)]
+        response = client.get(f"/api/files/{file.pk}/versions/1/download/")
+        assert b"".join(response.streaming_content) == v1
+        response = client.get(f"/api/files/{file.pk}/versions/2/download/")
+        assert b"".join(response.streaming_content) == v2
+
+    def test_chunking_in_a_worker_process(self, client, user: User):
+        v1 = document(seed=1, words=2000)
+        file = File(user=user, file_type="text/plain", file_size=len(v1))
+        file.file = ContentFile(v1, name="ledger.txt")
+        file.save()
+        self.upload_version(client, file, b"replaced")
+        old = FileVersion.objects.get(file=file, number=1)
+
+        chunk_version(old.pk, offload=True)
+
+        old.refresh_from_db()
+        assert [size for _, size in old.chunks] == [len(chunk) for chunk in content_chunks(ContentFile(v1))]
+
+    def test_deleting_file_releases_every_version(self, client, user: User, django_capture_on_commit_callbacks):
+        file = File(user=user, file_type="text/plain", file_size=5)
+        file.file = ContentFile(b"first", name="a.txt")
+        file.save()
+        self.upload_version(client, file, b"second")
+        chunk_version(FileVersion.objects.get(file=file, number=1).pk)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.delete(f"/api/files/{file.pk}/")
+
+        assert not FileVersion.objects.exists()
+        assert not Blob.objects.exists()
+
+    def test_replaced_versions_count_against_the_quota(self, client, user: User, settings):
+        settings.STORAGE_QUOTA_DEFAULT = 2500
+        file = File(user=user, file_type="text/plain", file_size=1000)
+        file.file = ContentFile(b"a" * 1000, name="a.txt")
+        file.save()
+
+        assert self.upload_version(client, file, b"b" * 1000).status_code == HTTPStatus.CREATED
+        assert self.upload_version(client, file, b"c" * 1000).status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        usage = StorageUsage.objects.get(user=user)
+        assert (usage.bytes_used, usage.file_count) == (2000, 1)
+        assert usage.by_type == {"text/plain": {"count": 1, "bytes": 1000}}
+
+        StorageUsage.objects.filter(user=user).update(bytes_used=0)
+        call_command("reconcile_storage_usage", stdout=StringIO())
+        assert StorageUsage.objects.get(user=user).bytes_used == 2000
+
+        client.delete(f"/api/files/{file.pk}/")
+        assert StorageUsage.objects.get(user=user).bytes_used == 0
+
+    def test_unversioned_file_lists_its_original(self, client, user: User):
+        file = File(user=user, file_type="text/plain", file_size=5)
+        file.file = ContentFile(b"first", name="a.txt")
+        file.save()
+
+        versions = client.get(f"/api/files/{file.pk}/versions/").json()
+        assert [(v["number"], v["current"]) for v in versions] == [(1, True)]
@@ -0,0 +1,82 @@
+"""Signed tickets for uploading a session's bytes outside Django.
+
+``POST /api/uploads/<id>/ticket/`` returns a URL on the upload receiver
+(:mod:`userportal.users.receiver`, or any proxy that does the same) with a
+ticket naming the session and its size, signed with ``SECRET_KEY``. The
+receiver checks the ticket, writes the request body to the session's
+:func:`received_path` and renames it into place once every byte has
+arrived, after recording the body's SHA-256 and sniffed type next to it.
+``POST /api/uploads/<id>/complete/`` then only has to check those and move
+the file into the blob store, so no Django worker waits on a slow client or
+reads the body again.
+
+This module does not touch models so that the receiver can use it without
+loading the app registry.
+"""
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+SALT = 'userportal.users.tickets'
+
+
+class InvalidTicket(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class UploadTicket:
+    session_id: str
+    size: int
+
+
+def received_path(session_id):
+    """Where the receiver puts the whole body of an upload session."""
+    return os.path.join(settings.MEDIA_ROOT, settings.RESUMABLE_UPLOAD_DIR, f"{session_id}.received")
+
+
+def received_metadata_path(session_id):
+    """Where the receiver records the size, SHA-256 and sniffed type of the body."""
+    return f"{received_path(session_id)}.json"
+
+
+def write_received_metadata(session_id, metadata):
+    path = received_metadata_path(session_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:  # noqa: PTH123
+        json.dump(metadata, file)
+    os.replace(tmp_path, path)
+
+
+def read_received_metadata(session_id):
+    """Return what the receiver recorded about a session's body, or ``None``."""
+    try:
+        with open(received_metadata_path(session_id)) as file:  # noqa: PTH123
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def issue_ticket(session, expires_in=None):
+    """Return ``(url, expires)`` for uploading ``session``'s bytes to the receiver."""
+    expires = timezone.now() + timedelta(seconds=expires_in or settings.UPLOAD_TICKET_EXPIRES)
+    payload = {'s': str(session.pk), 'z': session.total_size, 'exp': int(expires.timestamp())}
+    token = signing.dumps(payload, salt=SALT)
+    return f"{settings.UPLOAD_RECEIVER_URL.rstrip('/')}/{token}", expires
+
+
+def verify_ticket(token):
+    """Return the :class:`UploadTicket` for ``token``, or raise :class:`InvalidTicket`."""
+    try:
+        payload = signing.loads(token, salt=SALT)
+    except signing.BadSignature as exc:
+        raise InvalidTicket('Invalid upload ticket') from exc
+    if payload['exp'] < time.time():
+        raise InvalidTicket('Upload ticket has expired')
+    return UploadTicket(payload['s'], payload['z'])
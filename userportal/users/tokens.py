@@ -0,0 +1,78 @@
+"""Logging in with an email and password in exchange for a JWT pair.
+
+``/api/token/``, ``login_view`` and ``login_view_api`` all go through
+:func:`log_in`. Checking the password is by far the most expensive part of a
+login (argon2 is slow on purpose), so it happens exactly once, in
+``authenticate()``. The token pair and the serialized user are then built from
+the user that check returned.
+
+While checking, Django rehashes the password if it was stored with another
+hasher or with weaker parameters than the current ones. Changing
+``PASSWORD_HASHERS`` or raising the work factor therefore needs no migration:
+users are upgraded as they log in.
+
+Refresh tokens are :class:`RefreshToken`, which keeps revocations wherever
+``TOKEN_BLACKLIST_BACKEND`` says (see :mod:`userportal.users.blacklist`).
+"""
+from django.contrib.auth import authenticate
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+
+from .blacklist import is_revoked
+from .blacklist import revoke
+from .blacklist import uses_redis
+from .serializers import UserSerializer
+
+
+class RefreshToken(tokens.RefreshToken):
+    """A refresh token revoked in the blacklist ``TOKEN_BLACKLIST_BACKEND`` names.
+
+    With Redis, no ``OutstandingToken`` row is written for each login either.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        if uses_redis():
+            # Skip BlacklistMixin, which records every token in the database.
+            return super(tokens.BlacklistMixin, cls).for_user(user)
+        return super().for_user(user)
+
+    def check_blacklist(self):
+        if not uses_redis():
+            return super().check_blacklist()
+        if is_revoked(self.payload):
+            raise TokenError(_("Token is blacklisted"))
+        return None
+
+    def blacklist(self):
+        if not uses_redis():
+            return super().blacklist()
+        return revoke(self.payload)
+
+    def outstand(self):
+        if not uses_redis():
+            return super().outstand()
+        return None
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+def log_in(request, email, password):
+    """Return the active user ``email`` and ``password`` belong to, or ``None``."""
+    if not email or not password:
+        return None
+    return authenticate(request, email=email, password=password)
+
+
+def issue_tokens(user):
+    """Return ``refresh`` and ``access`` tokens and the serialized ``user``."""
+    refresh = RefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'user': UserSerializer(user).data,
+    }
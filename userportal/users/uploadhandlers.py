@@ -0,0 +1,154 @@
+"""Upload handlers that inspect files while they are being received.
+
+Django passes every chunk of an uploaded file through the handlers in
+``FILE_UPLOAD_HANDLERS``. The handlers here keep Django's usual split (small
+files in memory, larger ones in a temporary file) and, in the same pass,
+count the bytes, compute the SHA-256 and sniff the real type from the
+content. The results are attached to the uploaded file as ``sha256`` and
+``sniffed_type``, so nothing has to read the file again to validate or
+store it.
+
+A file that grows past ``FILE_UPLOAD_MAX_SIZE`` is dropped as soon as the
+limit is crossed; the rest of it is discarded as it arrives instead of being
+buffered, and the rejection is recorded on ``request.rejected_uploads``.
+Accepted and rejected files alike get their ``position`` among the files of
+the request, so responses can refer to files in the order they were sent.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import MemoryFileUploadHandler
+from django.core.files.uploadhandler import SkipFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+ZIP_MAGIC = b'PK\x03\x04'
+# The stream name of the main document in a Word 97-2003 file, as stored
+# (UTF-16LE) in the compound file directory.
+WORD_DOCUMENT_STREAM = 'WordDocument'.encode('utf-16-le')
+# Control characters other than whitespace (and ESC) do not appear in text.
+BINARY_BYTES = bytes(set(range(32)) - {9, 10, 12, 13, 27})
+
+
+class ContentSniffer:
+    """Work out a file's type from its bytes as they stream past.
+
+    The first bytes identify PDF, ZIP and OLE2 containers. Office documents
+    are told apart by the member or stream names that follow, which is why
+    the whole stream is fed in rather than only its head.
+    """
+    head_size = 8 * 1024
+    overlap = 32
+
+    def __init__(self):
+        self.head = b''
+        self.tail = b''
+        self.container_type = None
+
+    def feed(self, data):
+        if len(self.head) < self.head_size:
+            self.head += data[:self.head_size - len(self.head)]
+        if self.container_type is not None:
+            return
+        window = self.tail + data
+        self.tail = window[-self.overlap:]
+        if self.head.startswith(ZIP_MAGIC):
+            if b'word/' in window:
+                self.container_type = DOCX
+            elif b'xl/' in window:
+                self.container_type = XLSX
+        elif self.head.startswith(OLE2_MAGIC) and WORD_DOCUMENT_STREAM in window:
+            self.container_type = 'application/msword'
+
+    @property
+    def content_type(self):
+        if self.head.startswith(b'%PDF-'):
+            return 'application/pdf'
+        if self.head.startswith(ZIP_MAGIC):
+            return self.container_type or 'application/zip'
+        if self.head.startswith(OLE2_MAGIC):
+            return self.container_type or 'application/x-ole-storage'
+        if self.head and len(self.head.translate(None, BINARY_BYTES)) == len(self.head):
+            return 'text/plain'
+        return 'application/octet-stream'
+
+
+def sniff_file(file, block_size=64 * 1024):
+    """Hash and sniff an already stored Django ``File`` in one read."""
+    hasher = hashlib.sha256()
+    sniffer = ContentSniffer()
+    for chunk in file.chunks(block_size):
+        hasher.update(chunk)
+        sniffer.feed(chunk)
+    file.sha256 = hasher.hexdigest()
+    file.sniffed_type = sniffer.content_type
+    return file
+
+
+def rejected_uploads(request):
+    """Uploads refused by the handlers. Only complete once the body has been parsed."""
+    return getattr(request, 'rejected_uploads', [])
+
+
+def next_position(request):
+    """Number the files of a request as each is accepted or rejected, which happens once per file, in order."""
+    position = getattr(request, 'upload_count', 0)
+    request.upload_count = position + 1
+    return position
+
+
+class InspectingUploadMixin:
+    max_size_setting = 'FILE_UPLOAD_MAX_SIZE'
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        self.sniffer = ContentSniffer()
+        self.received = 0
+        super().new_file(*args, **kwargs)
+
+    def inspect(self, raw_data):
+        self.received += len(raw_data)
+        max_size = getattr(settings, self.max_size_setting)
+        if self.received > max_size:
+            self.reject(f"File size must be less than {max_size // (1024 * 1024)}MB")
+        self.hasher.update(raw_data)
+        self.sniffer.feed(raw_data)
+
+    def reject(self, error):
+        if self.request is not None:
+            if not hasattr(self.request, 'rejected_uploads'):
+                self.request.rejected_uploads = []
+            self.request.rejected_uploads.append({
+                'field': self.field_name,
+                'name': self.file_name,
+                'error': error,
+                'position': next_position(self.request),
+            })
+        # The parser closes (and so deletes) the partial file and discards
+        # the rest of this file's bytes without handing them to us.
+        raise SkipFile
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.hasher.hexdigest()
+            file.sniffed_type = self.sniffer.content_type
+            if self.request is not None:
+                file.position = next_position(self.request)
+        return file
+
+
+class InspectingMemoryFileUploadHandler(InspectingUploadMixin, MemoryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        if self.activated:
+            self.inspect(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+
+class InspectingTemporaryFileUploadHandler(InspectingUploadMixin, TemporaryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        self.inspect(raw_data)
+        return super().receive_data_chunk(raw_data, start)
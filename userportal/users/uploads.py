@@ -0,0 +1,266 @@
+"""Helpers for resumable uploads.
+
+An :class:`~userportal.users.models.UploadSession` owns a staging file under
+``MEDIA_ROOT/RESUMABLE_UPLOAD_DIR``. Chunks are copied into it at their offset
+in small blocks straight from the request stream, so memory use stays constant
+no matter how big a chunk or the whole upload is. Once every byte has arrived
+the staging file is moved (not copied) into the blob store and becomes a
+``File``. Alternatively the whole body can be sent to the upload receiver
+with a ticket (see :mod:`~userportal.users.tickets`), and completing the
+session moves the received file instead.
+"""
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .extraction import schedule_extraction
+from .models import Blob
+from .models import File
+from .models import StorageUsage
+from .search import update_search_vectors
+from .storage import blob_storage
+from .storage import content_digest
+from .tickets import read_received_metadata
+from .tickets import received_metadata_path
+from .tickets import received_path
+from .uploadhandlers import sniff_file
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+def detected_content_type(uploaded):
+    """The type sniffed from an upload's content, falling back to the client's claim."""
+    return getattr(uploaded, 'sniffed_type', None) or uploaded.content_type
+
+
+def check_upload(content_type, size, max_size):
+    """Validate the declared type and size of an upload."""
+    if content_type not in settings.FILE_ALLOWED_CONTENT_TYPES:
+        raise serializers.ValidationError("Only PDF, Excel, Word, and TXT files are allowed")
+    if size > max_size:
+        raise serializers.ValidationError(f"File size must be less than {max_size // (1024 * 1024)}MB")
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Storage quota exceeded'
+    default_code = 'quota_exceeded'
+
+
+def charge_storage(user_id, file_type, size):
+    """Add a new file to the user's usage, refusing it if it does not fit their quota.
+
+    The usage row stays locked until the transaction ends, so concurrent
+    uploads from one user cannot both squeeze into the last free bytes.
+    """
+    with transaction.atomic():
+        usage = StorageUsage.objects.locked(user_id)
+        if not usage.has_room(size):
+            raise QuotaExceeded
+        usage.add(file_type, size)
+        usage.save()
+
+
+def staging_path(session):
+    return os.path.join(settings.MEDIA_ROOT, settings.RESUMABLE_UPLOAD_DIR, f"{session.pk}.part")
+
+
+def chunk_problem(session, offset, length):
+    """Return ``(error, status)`` if a chunk cannot be written, or ``None``."""
+    if length <= 0:
+        return 'Content-Length is required', status.HTTP_411_LENGTH_REQUIRED
+    if length > settings.RESUMABLE_UPLOAD_MAX_CHUNK_SIZE:
+        return (
+            f'Chunks must be at most {settings.RESUMABLE_UPLOAD_MAX_CHUNK_SIZE} bytes',
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    if offset + length > session.total_size:
+        return 'Chunk extends past the end of the file', status.HTTP_400_BAD_REQUEST
+    return None
+
+
+def write_chunk(session, offset, stream, length):
+    """Copy ``length`` bytes from ``stream`` into the staging file at ``offset``.
+
+    Returns the number of bytes written, which is less than ``length`` if the
+    client went away before sending the whole chunk.
+    """
+    path = staging_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as staging:
+        staging.seek(offset)
+        while written < length:
+            block = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not block:
+                break
+            staging.write(block)
+            written += len(block)
+    return written
+
+
+def discard_staging_file(session):
+    for path in (staging_path(session), received_path(session.pk), received_metadata_path(session.pk)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def has_received_body(session):
+    """Whether the upload receiver has stored the session's whole body."""
+    try:
+        return os.path.getsize(received_path(session.pk)) == session.total_size
+    except FileNotFoundError:
+        return False
+
+
+def received_ranges(chunks):
+    """Merge ``(offset, size)`` pairs into sorted, non-overlapping ``[start, end)`` ranges."""
+    ranges = []
+    for offset, size in sorted(chunks):
+        end = offset + size
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([offset, end])
+    return ranges
+
+
+def missing_ranges(ranges, total_size):
+    """Return the ``[start, end)`` gaps left in ``[0, total_size)`` by ``ranges``."""
+    missing = []
+    position = 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < total_size:
+        missing.append([position, total_size])
+    return missing
+
+
+class StagedFile(DjangoFile):
+    """A file on local disk that storage can move into place.
+
+    Storage backends check for ``temporary_file_path()`` and rename the file
+    instead of streaming its contents, exactly as for Django's own
+    ``TemporaryUploadedFile``.
+    """
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)  # noqa: SIM115
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def complete_upload(session):
+    """Create a ``File`` from a fully received session and delete the session."""
+    metadata = None
+    if has_received_body(session):
+        path = received_path(session.pk)
+        metadata = read_received_metadata(session.pk)
+    else:
+        path = staging_path(session)
+    with StagedFile(path, session.filename) as staged:
+        if metadata is not None and metadata['size'] == staged.size:
+            # The receiver hashed and sniffed the body as it arrived.
+            staged.sha256 = metadata['sha256']
+            staged.sniffed_type = metadata['content_type']
+        else:
+            # Chunks arrive in any order, so they are read back once, both
+            # to check what was actually uploaded and to hash it.
+            sniff_file(staged)
+        check_upload(staged.sniffed_type, staged.size, settings.RESUMABLE_UPLOAD_MAX_SIZE)
+        instance = File(
+            user=session.user,
+            original_name=session.filename,
+            file_type=staged.sniffed_type,
+            file_size=staged.size,
+            description=session.description,
+        )
+        instance.file = staged
+        instance.save()
+    # Nothing was moved if the content was already in the blob store.
+    discard_staging_file(session)
+    session.delete()
+    return instance
+
+
+@transaction.atomic
+def create_files(user, uploaded_files, rejected=(), description=None):
+    """Validate, store and insert a batch of uploaded files in one go.
+
+    Invalid files, and those already ``rejected`` by the upload handlers, are
+    reported without affecting the others. Returns one dict per file, in the
+    order they were sent, with its ``index`` in the request and either the
+    created ``file`` or the validation ``errors``.
+    """
+    results = []
+    valid = []
+    for index, uploaded in enumerate(uploaded_files):
+        result = {
+            'index': getattr(uploaded, 'position', index),
+            'name': uploaded.name,
+            'file': None,
+            'errors': None,
+        }
+        try:
+            check_upload(detected_content_type(uploaded), uploaded.size, settings.FILE_UPLOAD_MAX_SIZE)
+        except serializers.ValidationError as exc:
+            result['errors'] = exc.detail
+        else:
+            valid.append((result, uploaded))
+        results.append(result)
+    for index, rejection in enumerate(rejected, len(uploaded_files)):
+        results.append({
+            'index': rejection.get('position', index),
+            'name': rejection['name'],
+            'file': None,
+            'errors': [rejection['error']],
+        })
+    results.sort(key=lambda result: result['index'])
+
+    # bulk_create() skips the pre_save signal that charges single uploads.
+    # Files are charged in order; those past the quota are refused.
+    usage = StorageUsage.objects.locked(user.pk)
+    fitting = []
+    for result, uploaded in valid:
+        file_type = detected_content_type(uploaded)
+        if usage.has_room(uploaded.size):
+            usage.add(file_type, uploaded.size)
+            fitting.append((result, uploaded))
+        else:
+            result['errors'] = [QuotaExceeded.default_detail]
+    usage.save()
+    valid = fitting
+
+    # Likewise take the blob references here, once per distinct content and
+    # before anything is written.
+    references = Counter(content_digest(uploaded) for _, uploaded in valid)
+    sizes = {uploaded.sha256: uploaded.size for _, uploaded in valid}
+    for digest, count in references.items():
+        Blob.objects.acquire(digest, sizes[digest], count)
+
+    for result, uploaded in valid:
+        result['file'] = File(
+            user=user,
+            file=blob_storage.save(uploaded.name, uploaded),
+            blob_id=uploaded.sha256,
+            original_name=os.path.basename(uploaded.name),
+            file_type=detected_content_type(uploaded),
+            file_size=uploaded.size,
+            description=description,
+        )
+    created = File.objects.bulk_create([result['file'] for result, _ in valid])
+    schedule_extraction(created)
+    update_search_vectors([file.pk for file in created])
+    return results
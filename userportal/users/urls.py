@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from django.views.decorators.csrf import csrf_exempt
+from . import async_views
 from . import views
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import MyTokenObtainPairView, register_view, me_view, logout_view
@@ -12,6 +13,7 @@ router.register(r'profile', views.ProfileView, basename='profile')
 router.register(r'addresses', views.AddressViewSet, basename='address')
 router.register(r'phones', views.PhoneNumberViewSet, basename='phone')
 router.register(r'files', views.FileViewSet, basename='file')
+router.register(r'uploads', views.UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     path('token/', csrf_exempt(MyTokenObtainPairView.as_view()), name='token_obtain_pair'),
@@ -21,6 +23,10 @@ urlpatterns = [
     path('me/',       me_view,       name='me'),        
     path('~redirect/', view=views.user_redirect_view, name="redirect"),
     path('~update/', view=views.user_update_view, name="update"),
+    # Async endpoints for ASGI deployments, see async_views.py.
+    path('async/files/<int:pk>/download/', async_views.download_file_view, name='async-file-download'),
+    path('async/uploads/<uuid:pk>/chunks/<int:offset>/', async_views.upload_chunk_view, name='async-upload-chunk'),
+    path('downloads/<str:token>/', view=views.signed_download_view, name='signed-download'),
     path('', include(router.urls)),
     path('<str:email>/', view=views.user_detail_view, name="detail"),
 ]
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""File versions, with older versions stored as deduplicated chunks.
+
+Uploading a new version of a ``File`` (``POST /api/files/<id>/versions/``)
+replaces its content as usual and records a :class:`FileVersion`; the file's
+``current_version`` points at the newest one, whose bytes are simply
+``File.file``. The version being replaced keeps a reference to its whole blob
+until :func:`chunk_version` runs on a background thread after the commit (or
+``manage.py chunk_versions`` catches up). It splits the content into chunks
+with content-defined chunking and stores each chunk as a blob of its own.
+The chunker is pure Python, so the boundaries of chunks are found in a
+worker process rather than a thread of the web process, where it would hold
+the GIL for seconds.
+
+Chunk boundaries depend only on the bytes around them, so an edit changes
+the chunks it touches and leaves the rest identical. Identical chunks are the
+same blob, so a document edited a hundred times costs roughly its size plus
+its edits, not a hundred copies. Old versions are downloaded by streaming
+their chunks back in order.
+"""
+import hashlib
+import logging
+import os
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.db import transaction
+from rest_framework import serializers
+
+from . import executors
+from .compression import open_reader
+from .models import Blob
+from .models import File
+from .models import FileVersion
+from .models import StorageUsage
+from .storage import COPY_BUFFER_SIZE
+from .storage import blob_name
+from .storage import blob_storage
+from .uploads import QuotaExceeded
+from .uploads import detected_content_type
+
+logger = logging.getLogger(__name__)
+
+# Random values for the gear hash, fixed so chunk boundaries never change.
+# 30 bits keep every value a single-digit CPython int, which is noticeably
+# faster in the per-byte loop than 64-bit arithmetic.
+_gear_random = random.Random(0x5EED)  # noqa: S311
+GEAR = tuple(_gear_random.getrandbits(30) for _ in range(256))
+HASH_MASK = (1 << 30) - 1
+
+
+def cut_point(data, min_size, mask, max_size):
+    """Return the length of the first chunk of ``data``.
+
+    A gear hash rolls over the bytes; shifting left by one per byte means it
+    only depends on the last 30 of them. A chunk ends where the hash has all
+    of ``mask``'s bits clear, which happens every ``mask + 1`` bytes on
+    average, and never before ``min_size`` (those bytes are not even hashed)
+    or after ``max_size``.
+    """
+    end = min(len(data), max_size)
+    if end <= min_size:
+        return end
+    gear = GEAR
+    h = 0
+    for length, byte in enumerate(data[min_size:end], min_size + 1):
+        h = ((h << 1) + gear[byte]) & HASH_MASK
+        if not h & mask:
+            return length
+    return end
+
+
+def chunk_sizes():
+    """``(min_size, mask, max_size)`` for :func:`cut_point`, from the settings."""
+    # The average must be a power of two for the mask.
+    mask = (1 << (settings.VERSION_CHUNK_AVG_SIZE.bit_length() - 1)) - 1
+    return settings.VERSION_CHUNK_MIN_SIZE, mask, settings.VERSION_CHUNK_MAX_SIZE
+
+
+def content_chunks(file, sizes=None):
+    """Split a Django ``File`` into content-defined chunks, yielding their bytes."""
+    min_size, mask, max_size = sizes or chunk_sizes()
+    buffer = b''
+    for block in file.chunks(COPY_BUFFER_SIZE):
+        buffer += block
+        while len(buffer) >= max_size:
+            cut = cut_point(buffer, min_size, mask, max_size)
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    while buffer:
+        cut = cut_point(buffer, min_size, mask, max_size)
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+
+
+def chunk_lengths(path, encoding, sizes):
+    """Return the lengths of the content-defined chunks of the blob stored at ``path``.
+
+    Everything it needs is passed in, so it can run in a worker process.
+    """
+    source = open_reader(path, encoding) if encoding else open(path, 'rb')  # noqa: PTH123, SIM115
+    with DjangoFile(source) as file:
+        return [len(data) for data in content_chunks(file, sizes)]
+
+
+def split_content(file, lengths):
+    """Yield consecutive pieces of ``file`` of the given lengths."""
+    blocks = file.chunks(COPY_BUFFER_SIZE)
+    buffer = b''
+    for length in lengths:
+        while len(buffer) < length:
+            block = next(blocks, b'')
+            if not block:
+                raise ValueError("The content is shorter than its chunks")
+            buffer += block
+        yield buffer[:length]
+        buffer = buffer[length:]
+
+
+def version_fields(file):
+    return {
+        'original_name': file.download_name,
+        'file_type': file.file_type,
+        'size': file.file_size,
+        'sha256': file.blob_id,
+    }
+
+
+@transaction.atomic
+def add_version(file, content):
+    """Make the uploaded ``content`` the current version of ``file``.
+
+    The replaced version keeps its bytes and is chunked once the transaction
+    commits. It still counts against the quota, so the new content is charged
+    in full.
+    """
+    file = File.objects.select_for_update().get(pk=file.pk)
+    if not file.blob_id:
+        raise serializers.ValidationError("Run `manage.py dedupe_files` before adding versions to this file")
+    previous = file.current_version or FileVersion.objects.create(file=file, number=1, **version_fields(file))
+
+    file_type = detected_content_type(content)
+    usage = StorageUsage.objects.locked(file.user_id)
+    if not usage.has_room(content.size):
+        raise QuotaExceeded
+    usage.add(file.file_type, -file.file_size, count=-1)
+    usage.add(file_type, content.size)
+    usage.add_versions(file.file_size)
+    usage.save()
+
+    # Take the reference before the file lets go of its blob.
+    Blob.objects.acquire(file.blob_id, file.file_size)
+    previous.blob_id = file.blob_id
+    previous.save(update_fields=['blob'])
+
+    file.file = content
+    file.original_name = os.path.basename(content.name)
+    file.file_type = file_type
+    file.file_size = content.size
+    file.save()
+
+    current = FileVersion.objects.create(file=file, number=previous.number + 1, **version_fields(file))
+    # update() rather than save(): the content signals have already run.
+    File.objects.filter(pk=file.pk).update(current_version=current)
+    file.current_version = current
+    schedule_chunking([previous.pk])
+    return current
+
+
+def chunk_version(version_id, offload=False):
+    """Replace a version's reference to its whole blob with references to its chunks.
+
+    With ``offload``, the chunk boundaries are found in a worker process.
+    """
+    version = FileVersion.objects.filter(pk=version_id, chunks__isnull=True, blob__isnull=False).first()
+    if version is None:
+        return
+    name = blob_name(version.blob_id)
+    located = blob_storage.locate(name)
+    args = (located.path, located.encoding, chunk_sizes())
+    if offload:
+        pool = executors.get_processes('chunking', settings.VERSION_CHUNKING_WORKERS)
+        lengths = pool.submit(chunk_lengths, *args).result()
+    else:
+        lengths = chunk_lengths(*args)
+
+    manifest = []
+    acquired = []
+    stored = False
+    try:
+        with blob_storage.open(name) as source:
+            for data in split_content(source, lengths):
+                digest = hashlib.sha256(data).hexdigest()
+                # As for uploads, reference the blob before writing it.
+                Blob.objects.acquire(digest, len(data))
+                acquired.append(digest)
+                chunk = ContentFile(data)
+                chunk.sha256 = digest
+                blob_storage.save(None, chunk)
+                manifest.append([digest, len(data)])
+        with transaction.atomic():
+            # The version may have been deleted or chunked in the meantime.
+            stored = FileVersion.objects.filter(pk=version.pk, blob_id=version.blob_id).update(
+                chunks=manifest, blob=None,
+            )
+            if stored:
+                Blob.objects.release(version.blob_id)
+    except BaseException:
+        stored = False
+        raise
+    finally:
+        if not stored:
+            for digest, count in Counter(acquired).items():
+                Blob.objects.release(digest, count)
+
+
+def version_content(version):
+    """Yield the bytes of a replaced version, from its chunks or its whole blob."""
+    if version.chunks is None:
+        names = [blob_name(version.blob_id)]
+    else:
+        names = [blob_name(digest) for digest, _ in version.chunks]
+    for name in names:
+        with blob_storage.open(name) as stored:
+            yield from stored.chunks(COPY_BUFFER_SIZE)
+
+
+def _run(version_id):
+    try:
+        chunk_version(version_id, offload=True)
+    except Exception:
+        # The whole blob is still referenced; `manage.py chunk_versions` retries.
+        logger.exception("Chunking failed for file version %s", version_id)
+    finally:
+        close_old_connections()
+
+
+def _submit(version_id):
+    executors.get('chunking', settings.VERSION_CHUNKING_WORKERS).submit(_run, version_id)
+
+
+def schedule_chunking(version_ids):
+    for version_id in version_ids:
+        transaction.on_commit(lambda version_id=version_id: _submit(version_id))
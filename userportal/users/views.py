@@ -1,9 +1,13 @@
-from django.contrib.auth import authenticate, login, logout
+from django.conf import settings
+from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
+from django.db import transaction
 from django.db.models import QuerySet
-from django.http import JsonResponse, HttpResponse, FileResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
@@ -16,11 +20,28 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authentication import SessionAuthentication
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework import viewsets
-from .models import User, Address, PhoneNumber, File
-from .serializers import UserSerializer, AddressSerializer, PhoneNumberSerializer, FileSerializer
+from rest_framework import mixins, viewsets
+from rest_framework.filters import OrderingFilter
+from .models import User, Address, PhoneNumber, File, FileContent, FileVersion, UploadSession, UploadChunk, Blob
+from .serializers import UserSerializer, AddressSerializer, PhoneNumberSerializer, FileSerializer, UploadSessionSerializer
+from .serializers import FileArchiveSerializer, FileSearchResultSerializer, ProfileSerializer, SignedUrlSerializer
+from .serializers import FileVersionSerializer, NewVersionSerializer
+from .archives import stream_zip
+from .authentication import CachedJWTAuthentication
+from .delivery import serve_file, serve_stored
+from .filters import FileFilterBackend
+from .hashing import HashingBusy
+from .pagination import FileCursorPagination
+from .previews import TEXT, PreviewPending, PreviewUnavailable, get_preview, preview_kinds
+from .previews import cache_key as preview_cache_key
+from .ratelimit import RateLimited, check_rate
+from .search import search_files
+from .signed_urls import InvalidDownloadToken, sign_download, verify_download
+from .uploadhandlers import rejected_uploads
+from .tickets import issue_ticket
+from .tokens import RefreshToken, issue_tokens, log_in
+from .uploads import chunk_problem, complete_upload, create_files, discard_staging_file, has_received_body, write_chunk
+from .versions import add_version, version_content, version_fields
 from rest_framework.decorators import action
 from rest_framework import serializers
 from rest_framework.views import APIView
@@ -28,8 +49,6 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import AllowAny
 import logging
 import json
-import os
-import mimetypes
 
 logger = logging.getLogger(__name__)
 
@@ -108,19 +127,24 @@ def login_view_api(request):
                 'message': 'Email and password are required'
             }, status=400)
 
-        user = authenticate(request, email=email, password=password)
+        try:
+            check_rate(request, 'login', email)
+        except RateLimited as exc:
+            response = JsonResponse({
+                'message': f'Too many attempts, please try again in {exc.wait} seconds'
+            }, status=429)
+            response['Retry-After'] = str(exc.wait)
+            return response
+
+        try:
+            user = log_in(request, email, password)
+        except HashingBusy as exc:
+            response = JsonResponse({'message': str(exc.detail)}, status=exc.status_code)
+            response['Retry-After'] = str(exc.wait)
+            return response
         
         if user is not None:
-            refresh = RefreshToken.for_user(user)
-            return JsonResponse({
-                'access': str(refresh.access_token),
-                'refresh': str(refresh),
-                'user': {
-                    'id': user.id,
-                    'email': user.email,
-                    'name': user.name
-                }
-            })
+            return JsonResponse(issue_tokens(user))
 
         return JsonResponse({
             'message': 'Invalid credentials'
@@ -143,15 +167,11 @@ def login_view(request):
                 'message': 'Email and password are required'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        user = authenticate(request, email=email, password=password)
+        check_rate(request, 'login', email)
+        user = log_in(request, email, password)
         
         if user is not None:
-            refresh = RefreshToken.for_user(user)
-            return Response({
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-                'user': UserSerializer(user).data
-            }, status=status.HTTP_200_OK)
+            return Response(issue_tokens(user), status=status.HTTP_200_OK)
 
         return Response({
             'message': 'Invalid credentials'
@@ -166,15 +186,11 @@ def login_view(request):
 @permission_classes([AllowAny])
 def register_view(request):
     if request.method == 'POST':
+        check_rate(request, 'register', request.data.get('email'))
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
-            return Response({
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-                'user': UserSerializer(user).data
-            }, status=status.HTTP_201_CREATED)
+            return Response(issue_tokens(user), status=status.HTTP_201_CREATED)
         
         # Customize error messages
         errors = serializer.errors
@@ -191,7 +207,7 @@ def register_view(request):
 
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
     try:
@@ -210,7 +226,7 @@ def logout_view(request):
 
 @require_http_methods(["GET"])
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def me_view(request):
     user = request.user
@@ -229,15 +245,15 @@ user_detail_api_view = UserDetailAPIView.as_view()
 
 
 class ProfileView(viewsets.ModelViewSet):
-    serializer_class = UserSerializer
-    authentication_classes = (JWTAuthentication,)
+    serializer_class = ProfileSerializer
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAuthenticated,)
     def get_queryset(self):
-        return User.objects.filter(pk=self.request.user.pk)
+        return User.objects.filter(pk=self.request.user.pk).select_related('storage_usage')
 
 class AddressViewSet(viewsets.ModelViewSet):
     serializer_class = AddressSerializer
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -293,7 +309,7 @@ class AddressViewSet(viewsets.ModelViewSet):
 
 class PhoneNumberViewSet(viewsets.ModelViewSet):
     serializer_class = PhoneNumberSerializer
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -314,10 +330,28 @@ class PhoneNumberViewSet(viewsets.ModelViewSet):
 class FileViewSet(viewsets.ModelViewSet):
     serializer_class = FileSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
+    pagination_class = FileCursorPagination
+    filter_backends = [FileFilterBackend, OrderingFilter]
+    # Only orderings the (user, upload_date, id) index can serve for cursors.
+    ordering_fields = ['upload_date']
 
     def get_queryset(self):
-        return File.objects.filter(user=self.request.user)
+        return File.objects.filter(user=self.request.user).select_related('content')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        # Files dropped mid-stream by the upload handler never reach the serializer.
+        rejected = rejected_uploads(request)
+        if rejected:
+            return Response(
+                {'file': [rejection['error'] for rejection in rejected]},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -331,14 +365,223 @@ class FileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        file_path = file.file.path
-        file_name = os.path.basename(file_path)
-        content_type, _ = mimetypes.guess_type(file_path)
-        if not content_type:
-            content_type = 'application/octet-stream'
+        return serve_file(request, file)
 
-        response = FileResponse(open(file_path, 'rb'), content_type=content_type)
-        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    @action(detail=True, methods=['get', 'post'])
+    def versions(self, request, pk=None):
+        """
+        List the file's versions, newest first, or POST a ``file`` to make
+        it the new current version. Older versions stay downloadable.
+        """
+        file = self.get_object()
+        if request.method == 'POST':
+            rejected = rejected_uploads(request)
+            if rejected:
+                return Response(
+                    {'file': [rejection['error'] for rejection in rejected]},
+                    status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                )
+            serializer = NewVersionSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            version = add_version(file, serializer.validated_data['file'])
+            return Response(FileVersionSerializer(version).data, status=status.HTTP_201_CREATED)
+
+        versions = list(file.versions.select_related('file'))
+        if not versions:
+            # Files never re-uploaded have only their original version.
+            versions = [FileVersion(file=file, number=1, **version_fields(file))]
+        return Response(FileVersionSerializer(versions, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path=r'versions/(?P<number>\d+)/download')
+    def version_download(self, request, pk=None, number=None):
+        file = self.get_object()
+        version = FileVersion.objects.filter(file=file, number=number).first()
+        if version is None and number == '1' and file.current_version_id is None:
+            # Files never re-uploaded have only their original version.
+            return serve_file(request, file)
+        if version is None:
+            return Response({'error': 'Version not found'}, status=status.HTTP_404_NOT_FOUND)
+        if version.pk == file.current_version_id:
+            return serve_file(request, file)
+
+        response = StreamingHttpResponse(version_content(version), content_type=version.file_type)
+        response['Content-Length'] = version.size
+        response['Content-Disposition'] = content_disposition_header(True, version.original_name)
+        response['ETag'] = f'"{version.sha256}"'
+        return response
+
+    @action(detail=True, methods=['post'], url_path='signed-url')
+    def signed_url(self, request, pk=None):
+        """
+        Return a short-lived URL that downloads the file without credentials,
+        for sharing or embedding. ``expires_in`` is in seconds.
+        """
+        file = self.get_object()
+        serializer = SignedUrlSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        path, expires = sign_download(file, serializer.validated_data.get('expires_in'))
+        if file.blob_id:
+            # Signed downloads never touch the database, so count the read now.
+            Blob.objects.touch(file.blob_id)
+        return Response({
+            'url': request.build_absolute_uri(path),
+            'expires': expires,
+        })
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """
+        Return a preview for the dashboard: ``kind=thumbnail`` is a PNG of a
+        PDF's first page, ``kind=text`` the opening text. Without ``kind``,
+        the best preview the file has.
+        """
+        file = self.get_object()
+        kind = request.query_params.get('kind') or next(iter(preview_kinds(file.file_type)), TEXT)
+        etag = f'"{preview_cache_key(file, kind)}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                data = get_preview(file, kind)
+            except PreviewUnavailable as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_404_NOT_FOUND)
+            except (TimeoutError, PreviewPending):
+                return Response(
+                    {'error': 'The preview is still being prepared, please try again shortly'},
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Retry-After': '1'},
+                )
+            if kind == TEXT:
+                response = Response({'text': data.decode()})
+            else:
+                response = HttpResponse(data, content_type='image/png')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def text(self, request, pk=None):
+        """Return the text extracted from the file in the background."""
+        file = self.get_object()
+        content = getattr(file, 'content', None)
+        if content is None or content.status != FileContent.Status.DONE:
+            return Response(
+                {'error': 'Text extraction has not finished for this file',
+                 'status': content.status if content else None},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({'text': content.text, 'word_count': content.word_count})
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over file names, descriptions and extracted text.
+        ``q`` takes web search syntax; ``limit`` caps the number of results.
+        """
+        terms = request.query_params.get('q', '').strip()
+        if not terms:
+            return Response({'error': 'Search terms are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', settings.SEARCH_RESULTS_LIMIT))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), settings.SEARCH_MAX_RESULTS)
+
+        files = search_files(self.get_queryset(), terms, limit)
+        serializer = FileSearchResultSerializer(files, many=True, context=self.get_serializer_context())
+        return Response({'results': serializer.data})
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Upload several files (repeated ``files`` fields) in one request.
+        Each file is validated on its own; valid files are stored and
+        inserted together and the response reports a result per file.
+        """
+        uploaded_files = request.FILES.getlist('files')
+        if not uploaded_files and not rejected_uploads(request):
+            return Response(
+                {'files': ['No files were uploaded']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(uploaded_files) > settings.FILE_BATCH_MAX_FILES:
+            return Response(
+                {'files': [f'At most {settings.FILE_BATCH_MAX_FILES} files can be uploaded at once']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = create_files(
+            request.user,
+            uploaded_files,
+            rejected=rejected_uploads(request),
+            description=request.data.get('description'),
+        )
+
+        context = self.get_serializer_context()
+        body = []
+        for result in results:
+            if result['file'] is not None:
+                body.append({
+                    'index': result['index'],
+                    'name': result['name'],
+                    'status': status.HTTP_201_CREATED,
+                    'file': FileSerializer(result['file'], context=context).data,
+                })
+            else:
+                body.append({
+                    'index': result['index'],
+                    'name': result['name'],
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': result['errors'],
+                })
+
+        created = sum(1 for result in results if result['file'] is not None)
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'results': body}, status=response_status)
+
+    @action(detail=False, methods=['get', 'post'])
+    def archive(self, request):
+        """
+        Download several files as one streamed ZIP archive. Pass ``ids``
+        (a JSON list, or comma-separated in the query string) to pick files,
+        otherwise every file matching ``file_type`` (or all files) is included.
+        """
+        params = request.data if request.method == 'POST' else request.query_params
+        ids = params.get('ids')
+        if isinstance(ids, str):
+            ids = [part for part in ids.split(',') if part]
+        data = {'ids': ids, 'file_type': params.get('file_type')}
+        serializer = FileArchiveSerializer(data={key: value for key, value in data.items() if value is not None})
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get('ids')
+        file_type = serializer.validated_data.get('file_type')
+
+        files = self.get_queryset().order_by('upload_date', 'id')
+        if file_type:
+            files = files.filter(file_type=file_type)
+        if ids is not None:
+            # One query both loads the files and checks they all belong to the user.
+            files = list(files.filter(pk__in=ids))
+            missing = sorted(set(ids) - {file.pk for file in files})
+            if missing:
+                return Response(
+                    {'error': 'Files not found', 'missing': missing},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        else:
+            files = list(files[:settings.FILE_ARCHIVE_MAX_FILES + 1])
+            if len(files) > settings.FILE_ARCHIVE_MAX_FILES:
+                return Response(
+                    {'error': f'At most {settings.FILE_ARCHIVE_MAX_FILES} files can be downloaded at once'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        response = StreamingHttpResponse(stream_zip(files), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="files.zip"'
         return response
 
     def destroy(self, request, *args, **kwargs):
@@ -351,36 +594,116 @@ class FileViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable uploads: create a session, PUT raw chunks to
+    ``chunks/<offset>/``, GET the session to see which byte ranges have
+    arrived, then POST ``complete/`` to turn it into a ``File``. Instead of
+    chunks, the whole file can be PUT to the upload receiver at the URL
+    returned by POST ``ticket/``.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).prefetch_related('chunks')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        discard_staging_file(instance)
+        instance.delete()
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<offset>\d+)')
+    def chunk(self, request, pk=None, offset=None):
+        session = self.get_object()
+        offset = int(offset)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+
+        problem = chunk_problem(session, offset, length)
+        if problem:
+            error, response_status = problem
+            return Response({'error': error}, status=response_status)
+
+        # Read the raw body ourselves so DRF never buffers it through a parser.
+        written = write_chunk(session, offset, request.stream, length)
+        if written != length:
+            return Response(
+                {'error': 'Incomplete chunk, please resend it'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        UploadChunk.objects.update_or_create(session=session, offset=offset, defaults={'size': length})
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=True, methods=['post'])
+    def ticket(self, request, pk=None):
+        """Return a signed URL on the upload receiver for sending the whole file."""
+        session = self.get_object()
+        url, expires = issue_ticket(session)
+        return Response({'url': request.build_absolute_uri(url), 'expires': expires})
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        missing = self.get_serializer(session).data['missing']
+        if missing and not has_received_body(session):
+            return Response(
+                {'error': 'Upload is not complete', 'missing': missing},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        file = complete_upload(session)
+        return Response(
+            FileSerializer(file, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED
+        )
+
+
+@transaction.non_atomic_requests
+@require_http_methods(["GET", "HEAD"])
+def signed_download_view(request, token):
+    """Serve a file from a signed URL; the token carries everything needed."""
+    try:
+        details = verify_download(token)
+    except InvalidDownloadToken as exc:
+        return JsonResponse({'error': str(exc)}, status=status.HTTP_403_FORBIDDEN)
+    return serve_stored(request, **details)
+
+
 class MyTokenObtainPairView(TokenObtainPairView):
+    """
+    Exchange an email and password for a token pair. The user is sent in
+    the ``X-User-Data`` header, built from the same single password check.
+    """
     permission_classes = (AllowAny,)
 
     def post(self, request, *args, **kwargs):
-        try:
-            response = super().post(request, *args, **kwargs)
-            
-            if response.status_code == 200:
-                # Get the user from the request
-                user = authenticate(
-                    email=request.data.get('email'),
-                    password=request.data.get('password')
-                )
-                if user and user.is_authenticated:
-                    user_data = UserSerializer(user).data
-                    response['X-User-Data'] = json.dumps(user_data)
-                return response
-
-            # If authentication failed
-            error_message = response.data.get('detail')
-            if not error_message:
-                error_message = 'Invalid credentials'
+        email = request.data.get('email')
+        password = request.data.get('password')
+        if not email or not password:
             return Response(
-                {'error': error_message},
-                status=status.HTTP_401_UNAUTHORIZED
+                {'error': 'Email and password are required'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        except Exception as e:
-            logger.error(f"Token authentication error: {str(e)}")
+        check_rate(request, 'login', email)
+        user = log_in(request, email, password)
+        if user is None:
             return Response(
-                {'error': 'An error occurred during authentication'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': 'No active account found with the given credentials'},
+                status=status.HTTP_401_UNAUTHORIZED
             )
+
+        tokens = issue_tokens(user)
+        response = Response({'refresh': tokens['refresh'], 'access': tokens['access']})
+        response['X-User-Data'] = json.dumps(tokens['user'])
+        return response